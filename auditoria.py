@@ -0,0 +1,78 @@
+# Rastro de auditoría en la tabla AUDITORIA (migración 7).
+# A diferencia de los logs/ (texto para leer), cada fila se escribe dentro de la misma transacción que el
+# cambio que describe: si la operación se revierte, su registro de auditoría también.
+# ENTIDAD + ENTIDAD_ID apuntan a la fila afectada (HUESPED -> HUESPEDES.NUMERO, PRODUCTO -> PRODUCTOS.CODIGO,
+# USUARIO -> USUARIOS.ID, CONSUMO -> CONSUMOS.ID, CORTESIA -> CORTESIAS.ID), así se puede cruzar con esas tablas.
+
+import json
+import usuarios  # 'import' de módulo: usuarios también importa este módulo
+from datetime import datetime
+from db import db
+
+TAMANO_PAGINA_AUDITORIA = 20
+ENTIDADES = ("HUESPED", "PRODUCTO", "CONSUMO", "CORTESIA", "USUARIO")
+
+def auditar(accion, entidad, entidad_id=None, **datos):
+    """
+    Registra un cambio en AUDITORIA con el usuario de la sesión como autor.
+    Llamarla dentro del 'with db.transaccion()' del cambio. Los 'datos' se guardan como JSON.
+    Ej: auditar("CHECKOUT", "HUESPED", numero, habitacion=5, monto=1200.0)
+    """
+    fecha = datetime.now().isoformat(sep=" ", timespec="seconds")
+    carga = {campo: valor for campo, valor in datos.items() if valor is not None}
+    db.ejecutar(
+        "INSERT INTO AUDITORIA (FECHA, USUARIO, ACCION, ENTIDAD, ENTIDAD_ID, DATOS) VALUES (?, ?, ?, ?, ?, ?)",
+        (fecha, usuarios.sesion.usuario, accion, entidad, entidad_id,
+         json.dumps(carga, ensure_ascii=False, default=str) if carga else None)
+    )
+
+def consultar_auditoria(usuario=None, accion=None, entidad=None, entidad_id=None, desde=None, hasta=None,
+                        antes_de=None, tamano=TAMANO_PAGINA_AUDITORIA):
+    """
+    Devuelve (filas, hay_mas) con hasta 'tamano' registros, del más nuevo al más viejo.
+    Paginación por clave: para la página siguiente se pasa en 'antes_de' el (FECHA, ID) del último registro
+    recibido. 'desde' y 'hasta' son fechas YYYY-MM-DD (inclusive). Cada fila trae DATOS ya decodificado.
+    """
+    condiciones = []
+    params = []
+    if usuario:
+        condiciones.append("USUARIO = ?")
+        params.append(usuario)
+    if accion:
+        condiciones.append("ACCION = ?")
+        params.append(accion)
+    if entidad:
+        condiciones.append("ENTIDAD = ?")
+        params.append(entidad)
+    if entidad_id is not None:
+        condiciones.append("ENTIDAD_ID = ?")
+        params.append(entidad_id)
+    if desde:
+        condiciones.append("FECHA >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("FECHA <= ?")
+        params.append(f"{hasta} 23:59:59")
+    if antes_de is not None:
+        # (FECHA, ID) sigue el orden de los índices por fecha, que incluyen el ID al final
+        condiciones.append("(FECHA, ID) < (?, ?)")
+        params.extend(antes_de)
+
+    # Se pide uno de más para saber si hay otra página sin hacer un COUNT
+    query = f"""
+        SELECT ID, FECHA, USUARIO, ACCION, ENTIDAD, ENTIDAD_ID, DATOS FROM AUDITORIA
+        {'WHERE ' + ' AND '.join(condiciones) if condiciones else ''}
+        ORDER BY FECHA DESC, ID DESC LIMIT ?
+    """
+    params.append(tamano + 1)
+    filas = [dict(fila) for fila in db.obtener_todos(query, tuple(params))]
+    for fila in filas:
+        fila["DATOS"] = json.loads(fila["DATOS"]) if fila["DATOS"] else {}
+    return filas[:tamano], len(filas) > tamano
+
+def formatear_auditoria(fila):
+    # "dd-mm-YYYY HH:MM:SS | usuario | ACCION HUESPED #12 | campo=valor, ..."
+    fecha = datetime.fromisoformat(fila["FECHA"]).strftime("%d-%m-%Y %H:%M:%S")
+    entidad = fila["ENTIDAD"] if fila["ENTIDAD_ID"] is None else f"{fila['ENTIDAD']} #{fila['ENTIDAD_ID']}"
+    datos = ", ".join(f"{campo}={valor}" for campo, valor in fila["DATOS"].items())
+    return f"{fecha} | {fila['USUARIO'] or '-'} | {fila['ACCION']} {entidad}" + (f" | {datos}" if datos else "")
@@ -0,0 +1,819 @@
+import atexit
+import contextlib
+import gzip
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from itertools import zip_longest
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Escritura de los logs de logs/ en segundo plano.
+# Quien registra solo encola el texto y sigue (no toca el disco, ni siquiera dentro de una transacción).
+# Un hilo escritor mantiene abiertos los archivos y escribe por lotes: cuando junta LINEAS_POR_LOTE
+# entradas, cuando pasan INTERVALO_VACIADO segundos desde la primera pendiente, o al vaciar/cerrar.
+# main.py cierra la bitácora en su 'finally' y además queda registrado un atexit, así lo encolado
+# se escribe aunque el programa termine por un error.
+#
+# Formato: por defecto cada entrada es una línea JSON (JSON Lines) con la fecha, los campos tipados
+# que pase quien registra (accion, usuario, huesped, producto, cantidad, monto...) y el texto legible.
+# Con BITACORA_FORMATO=texto se vuelve al formato viejo (texto + línea de guiones).
+# Los archivos rotan al superar TAMANO_MAXIMO_LOG o al cambiar el día: el actual se renombra a
+# <nombre>.<AAAAMMDD-HHMMSS> y se empieza uno nuevo. 'leer' recorre todos los segmentos en orden
+# y entiende ambos formatos, así que los logs viejos en texto se siguen pudiendo leer.
+#
+# Índice: logs/indice_logs.db (SQLite, aparte de la base principal) guarda por cada entrada su
+# segmento y posición en bytes junto con fecha, acción, usuario, habitación, huésped y producto.
+# El hilo escritor lo actualiza después de cada lote y las búsquedas lo completan con lo que falte
+# (archivos viejos, entradas escritas por otro proceso), así que se puede borrar y se rehace solo.
+#
+# Archivo: los segmentos rotados se comprimen con gzip (<nombre>.<marca>.gz) en el hilo escritor,
+# y los más viejos se borran cuando superan RETENCION_DIAS o cuando el total de rotados pasa
+# RETENCION_BYTES. Los lectores y el índice abren igual un segmento comprimido que uno sin comprimir;
+# las posiciones del índice son siempre sobre el contenido descomprimido.
+#
+# Varios procesos (terminales) pueden escribir en la misma carpeta. Cada lote, cada rotación y el
+# mantenimiento de los rotados se hacen con el candado logs/rotacion.lock tomado, y antes de escribir
+# se comprueba que el archivo abierto siga siendo el de la ruta (si otro proceso lo rotó, se abre el
+# nuevo). Así ningún proceso escribe en un segmento que otro ya renombró, comprimió o borró.
+
+CARPETA_LOGS = "logs"
+LINEAS_POR_LOTE = 64
+INTERVALO_VACIADO = 0.5  # segundos
+VARIABLE_ENTORNO_FORMATO = "BITACORA_FORMATO"
+FORMATOS = ("jsonl", "texto")
+TAMANO_MAXIMO_LOG = 1024 * 1024  # bytes
+ROTAR_POR_DIA = True
+SEPARADOR_TEXTO = "-" * 60
+BLOQUE_LECTURA = 64 * 1024  # bytes por lectura al recorrer un archivo desde el final
+COMPRIMIR_ROTADOS = True
+RETENCION_DIAS = 730                   # None: sin límite de antigüedad
+RETENCION_BYTES = 200 * 1024 * 1024    # total de segmentos rotados (ya comprimidos); None: sin límite
+
+ARCHIVO_INDICE = "indice_logs.db"
+ARCHIVO_CANDADO = "rotacion.lock"
+# En Windows un archivo abierto por otro proceso no se puede renombrar: cada escritor suelta los suyos
+# después de cada lote para que cualquiera pueda rotarlos
+SOLTAR_ARCHIVOS_POR_LOTE = os.name == "nt"
+
+_PATRON_USUARIO_TEXTO = re.compile(r"\bpor:? ([\w.@-]+)", re.IGNORECASE)
+_PATRON_FECHA_TEXTO = re.compile(r"\[(\d{2})-(\d{2})-(\d{4}) (\d{2}:\d{2})\]")
+_PATRON_SEGMENTO = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?(\.gz)?$")
+
+class Bitacora:
+    def __init__(self, carpeta=CARPETA_LOGS, lineas_por_lote=LINEAS_POR_LOTE, intervalo=INTERVALO_VACIADO,
+                 formato=None, tamano_maximo=TAMANO_MAXIMO_LOG, rotar_por_dia=ROTAR_POR_DIA,
+                 comprimir=COMPRIMIR_ROTADOS, retencion_dias=RETENCION_DIAS, retencion_bytes=RETENCION_BYTES):
+        # Ruta absoluta desde ahora: el vaciado del atexit puede correr con otro directorio actual
+        self.carpeta = os.path.abspath(carpeta)
+        self.lineas_por_lote = lineas_por_lote
+        self.intervalo = intervalo
+        formato = formato or os.environ.get(VARIABLE_ENTORNO_FORMATO, "jsonl").strip().lower()
+        if formato not in FORMATOS:
+            print(f"⚠️  Formato de logs '{formato}' desconocido; se usa 'jsonl'.")
+            formato = "jsonl"
+        self.formato = formato
+        self.tamano_maximo = tamano_maximo
+        self.rotar_por_dia = rotar_por_dia
+        self.comprimir = comprimir
+        self.retencion_dias = retencion_dias
+        self.retencion_bytes = retencion_bytes
+        self._cola = queue.Queue()
+        self._archivos = {}  # nombre de archivo -> archivo abierto (solo los usa el hilo escritor)
+        self._dias = {}      # nombre de archivo -> día de su primera entrada, para rotar al cambiar
+        self.indice = IndiceLogs(self.carpeta)
+        self._hilo = None
+        self._lock_hilo = threading.Lock()
+
+    def registrar(self, nombre_archivo, contenido, **campos):
+        """
+        Encola una entrada con la fecha actual, los campos tipados y el texto legible.
+        Los campos con valor None no se guardan.
+        """
+        if self.formato == "texto":
+            self.escribir(nombre_archivo, f"{contenido}\n{SEPARADOR_TEXTO}\n")
+            return
+        entrada = {"fecha": datetime.now().isoformat(sep=" ", timespec="seconds")}
+        entrada.update((clave, valor) for clave, valor in campos.items() if valor is not None)
+        entrada["texto"] = contenido
+        self.escribir(nombre_archivo, json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+
+    def escribir(self, nombre_archivo, texto):
+        """Encola 'texto' para agregarlo al final de logs/<nombre_archivo>. Vuelve enseguida."""
+        self._iniciar_hilo()
+        self._cola.put(("texto", nombre_archivo, texto))
+
+    def vaciar(self, timeout=5):
+        """Espera a que todo lo encolado hasta ahora esté escrito en disco."""
+        self._esperar("vaciar", timeout)
+
+    def cerrar(self, timeout=5):
+        """Escribe lo pendiente, cierra los archivos y detiene el hilo (se reinicia si se vuelve a escribir)."""
+        self._esperar("cerrar", timeout)
+        self.indice.cerrar_conexion_hilo()
+
+    def _esperar(self, orden, timeout):
+        with self._lock_hilo:
+            activo = self._hilo is not None and self._hilo.is_alive()
+        if not activo:
+            return
+        listo = threading.Event()
+        self._cola.put((orden, listo))
+        if not listo.wait(timeout):
+            print(f"⚠️  La escritura de logs no terminó en {timeout} s; puede haber entradas sin guardar.")
+
+    def _iniciar_hilo(self):
+        with self._lock_hilo:
+            if self._hilo is None or not self._hilo.is_alive():
+                # daemon: no impide que el programa termine; lo pendiente se escribe en cerrar()
+                self._hilo = threading.Thread(target=self._trabajar, name="bitacora", daemon=True)
+                self._hilo.start()
+
+    def _trabajar(self):
+        # Lo que haya quedado sin comprimir o vencido de una ejecución anterior
+        try:
+            with _candado_de_carpeta(self.carpeta):
+                self._mantener_rotados()
+        except OSError as e:
+            print(f"⚠️  No se pudo mantener el archivo de logs: {e}")
+        pendientes = {}  # nombre de archivo -> lista de textos
+        cantidad = 0
+        limite = None
+        while True:
+            espera = None if limite is None else max(0.0, limite - time.monotonic())
+            try:
+                item = self._cola.get(timeout=espera)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                # Venció el intervalo con entradas pendientes
+                self._escribir_pendientes(pendientes)
+                cantidad, limite = 0, None
+                continue
+
+            if item[0] == "texto":
+                _, nombre, texto = item
+                pendientes.setdefault(nombre, []).append(texto)
+                cantidad += 1
+                if limite is None:
+                    limite = time.monotonic() + self.intervalo
+                if cantidad >= self.lineas_por_lote:
+                    self._escribir_pendientes(pendientes)
+                    cantidad, limite = 0, None
+                continue
+
+            # "vaciar" o "cerrar": todo lo anterior en la cola ya está en 'pendientes'
+            orden, listo = item
+            self._escribir_pendientes(pendientes)
+            cantidad, limite = 0, None
+            if orden == "cerrar":
+                self._cerrar_archivos()
+                self.indice.cerrar_conexion_hilo()
+                listo.set()
+                return
+            listo.set()
+
+    def _escribir_pendientes(self, pendientes):
+        if not pendientes:
+            return
+        try:
+            with _candado_de_carpeta(self.carpeta):
+                for nombre, textos in pendientes.items():
+                    self._escribir_lote(nombre, textos)
+                if SOLTAR_ARCHIVOS_POR_LOTE:
+                    self._cerrar_archivos()
+        except OSError as e:
+            # No se pudo tomar el candado (carpeta inaccesible): el flujo principal sigue igual
+            print(f"⚠️  No se pudieron escribir los logs: {e}")
+            self._cerrar_archivos()
+        pendientes.clear()
+
+    def _escribir_lote(self, nombre, textos):
+        # Con el candado de la carpeta tomado
+        try:
+            self._soltar_si_lo_rotaron(nombre)
+            self._rotar_si_corresponde(nombre)
+            archivo = self._archivo(nombre)
+            archivo.write("".join(textos))
+            # Al sistema operativo en cada lote: si el proceso muere, se pierde a lo sumo el lote en curso
+            archivo.flush()
+        except Exception as e:
+            # Evitar que un error de log rompa el flujo principal
+            print(f"⚠️  No se pudo escribir el log '{nombre}': {e}")
+            self._cerrar_archivo(nombre)
+            return
+        self._indexar(nombre, nombre)
+
+    def _indexar(self, segmento, nombre_log):
+        try:
+            self.indice.indexar(segmento, nombre_log)
+        except Exception as e:
+            # Si falla, la próxima búsqueda indexa lo que haya quedado pendiente
+            print(f"⚠️  No se pudo actualizar el índice de '{segmento}': {e}")
+
+    def _archivo(self, nombre):
+        archivo = self._archivos.get(nombre)
+        if archivo is None:
+            os.makedirs(self.carpeta, exist_ok=True)
+            ruta = os.path.join(self.carpeta, nombre)
+            archivo = open(ruta, "a", encoding="utf-8")
+            self._archivos[nombre] = archivo
+            # Un archivo que ya existía pertenece al día de su última modificación
+            self._dias[nombre] = date.fromtimestamp(os.path.getmtime(ruta))
+        return archivo
+
+    def _soltar_si_lo_rotaron(self, nombre):
+        # Si otro proceso rotó el archivo desde el último lote, el que está abierto es ya un segmento viejo
+        # (que ese proceso comprime y borra): se cierra y se abre el de la ruta
+        archivo = self._archivos.get(nombre)
+        if archivo is None:
+            return
+        try:
+            vigente = os.path.samestat(os.fstat(archivo.fileno()), os.stat(os.path.join(self.carpeta, nombre)))
+        except OSError:
+            vigente = False
+        if not vigente:
+            self._cerrar_archivo(nombre)
+
+    def _rotar_si_corresponde(self, nombre):
+        ruta = os.path.join(self.carpeta, nombre)
+        if not os.path.exists(ruta):
+            return
+        # El tamaño en disco: incluye lo que escribieron otros procesos
+        tamano = os.path.getsize(ruta)
+        dia = self._dias.get(nombre) or date.fromtimestamp(os.path.getmtime(ruta))
+        if tamano == 0:
+            return
+        if tamano < self.tamano_maximo and not (self.rotar_por_dia and dia != date.today()):
+            return
+        self._cerrar_archivo(nombre)
+        marca = datetime.now().strftime("%Y%m%d-%H%M%S")
+        destino = f"{ruta}.{marca}"
+        intento = 1
+        while os.path.exists(destino) or os.path.exists(destino + ".gz"):
+            destino = f"{ruta}.{marca}-{intento}"
+            intento += 1
+        # El índice tiene que estar completo antes de que las posiciones pasen a otro nombre de archivo
+        self._indexar(nombre, nombre)
+        try:
+            os.replace(ruta, destino)
+        except OSError:
+            # En Windows, si otro proceso todavía lo tiene abierto: se sigue escribiendo en el mismo
+            # archivo y se vuelve a intentar en el próximo lote
+            return
+        try:
+            self.indice.renombrar(nombre, os.path.basename(destino))
+        except Exception as e:
+            print(f"⚠️  No se pudo actualizar el índice de '{nombre}': {e}")
+        self._mantener_rotados()
+
+    def _mantener_rotados(self):
+        # Comprime los segmentos rotados que estén sin comprimir y aplica la retención.
+        # Corre en el hilo escritor, con el candado de la carpeta tomado: quien registra nunca espera por esto,
+        # y ningún escritor tiene abierto un segmento rotado.
+        if not os.path.isdir(self.carpeta):
+            return
+        try:
+            for archivo in os.listdir(self.carpeta):
+                if archivo.endswith(".gz.parcial"):
+                    os.remove(os.path.join(self.carpeta, archivo))  # compresión interrumpida
+                elif self.comprimir and _es_rotado(archivo) and not archivo.endswith(".gz"):
+                    self._comprimir(archivo)
+            self._aplicar_retencion()
+        except Exception as e:
+            print(f"⚠️  No se pudo mantener el archivo de logs: {e}")
+
+    def _comprimir(self, segmento):
+        ruta = os.path.join(self.carpeta, segmento)
+        destino = ruta + ".gz"
+        if not os.path.exists(destino):
+            parcial = destino + ".parcial"
+            with open(ruta, "rb") as origen, gzip.open(parcial, "wb") as comprimido:
+                shutil.copyfileobj(origen, comprimido)
+            os.replace(parcial, destino)
+        self.indice.renombrar(segmento, segmento + ".gz")
+        os.remove(ruta)
+
+    def _aplicar_retencion(self):
+        if self.retencion_dias is None and self.retencion_bytes is None:
+            return
+        rotados = []
+        for archivo in os.listdir(self.carpeta):
+            coincidencia = _PATRON_SEGMENTO.search(archivo)
+            if coincidencia and _es_rotado(archivo):
+                marca, repeticion, _ = coincidencia.groups()
+                tamano = os.path.getsize(os.path.join(self.carpeta, archivo))
+                rotados.append(((marca, int(repeticion or 0)), archivo, tamano))
+        rotados.sort()  # del más viejo al más nuevo, de todos los logs juntos
+        total = sum(tamano for _, _, tamano in rotados)
+        ahora = datetime.now()
+        for (marca, _), archivo, tamano in rotados:
+            vencido = (self.retencion_dias is not None
+                       and (ahora - datetime.strptime(marca, "%Y%m%d-%H%M%S")).days > self.retencion_dias)
+            excedido = self.retencion_bytes is not None and total > self.retencion_bytes
+            if not (vencido or excedido):
+                break
+            os.remove(os.path.join(self.carpeta, archivo))
+            self.indice.olvidar(archivo)
+            total -= tamano
+
+    def _cerrar_archivo(self, nombre):
+        self._dias.pop(nombre, None)
+        archivo = self._archivos.pop(nombre, None)
+        if archivo is not None:
+            try:
+                archivo.close()
+            except Exception:
+                pass
+
+    def _cerrar_archivos(self):
+        for nombre in list(self._archivos):
+            self._cerrar_archivo(nombre)
+
+    # --- Lectura ---
+
+    def segmentos(self, nombre_archivo):
+        """Rutas de los segmentos de un log, del más viejo al actual."""
+        if not os.path.isdir(self.carpeta):
+            return []
+        rotados = []
+        for f in os.listdir(self.carpeta):
+            if not f.startswith(nombre_archivo + "."):
+                continue
+            coincidencia = _PATRON_SEGMENTO.fullmatch(f[len(nombre_archivo):])
+            if coincidencia:
+                marca, repeticion, comprimido = coincidencia.groups()
+                if not comprimido and os.path.exists(os.path.join(self.carpeta, f + ".gz")):
+                    continue  # se está comprimiendo: ya está completo en el .gz
+                # Orden por marca de tiempo y, dentro del mismo segundo, por número de repetición
+                rotados.append(((marca, int(repeticion or 0)), os.path.join(self.carpeta, f)))
+        actual = os.path.join(self.carpeta, nombre_archivo)
+        return [ruta for _, ruta in sorted(rotados)] + ([actual] if os.path.exists(actual) else [])
+
+    def leer(self, nombre_archivo, desde=None, hasta=None):
+        """
+        Recorre las entradas de un log (todos sus segmentos) de la más vieja a la más nueva,
+        sin cargar los archivos enteros. Cada entrada es un diccionario con al menos 'fecha'
+        (YYYY-MM-DD HH:MM:SS, o None si una entrada vieja no la tiene) y 'texto'.
+        'desde' y 'hasta' (YYYY-MM-DD, inclusive) filtran por fecha.
+        """
+        self.vaciar()
+        hasta = f"{hasta} 23:59:59" if hasta else None
+        for ruta in self.segmentos(nombre_archivo):
+            with io.TextIOWrapper(_abrir(ruta), encoding="utf-8", errors="replace") as archivo:
+                for entrada in parsear_entradas(archivo):
+                    fecha = entrada.get("fecha")
+                    if (desde or hasta) and fecha is None:
+                        continue
+                    if desde and fecha < desde:
+                        continue
+                    if hasta and fecha > hasta:
+                        continue
+                    yield entrada
+
+    def leer_recientes(self, nombre_archivo, desde=None, hasta=None):
+        """
+        Como 'leer', pero de la entrada más nueva a la más vieja: lee cada segmento desde el final
+        hacia atrás, de a bloques, y solo avanza cuando se le piden más entradas.
+        Con 'hasta' (YYYY-MM-DD) salta directo a esa fecha: descarta los segmentos posteriores mirando
+        su primera entrada y ubica la posición dentro del archivo con una búsqueda binaria.
+        Con 'desde' se detiene al llegar a entradas anteriores a esa fecha.
+        """
+        self.vaciar()
+        limite = f"{hasta} 23:59:59" if hasta else None
+        for ruta in reversed(self.segmentos(nombre_archivo)):
+            with _abrir_para_recorrer(ruta) as archivo:
+                fin = archivo.seek(0, os.SEEK_END)
+                if limite:
+                    primera = _fecha_desde(archivo, 0)
+                    if primera is not None and primera > limite:
+                        continue  # todo el segmento es posterior a la fecha pedida
+                    fin = _posicion_hasta(archivo, fin, limite)
+                for entrada in parsear_entradas_al_reves(_lineas_al_reves(archivo, fin)):
+                    fecha = entrada.get("fecha")
+                    if limite and fecha and fecha > limite:
+                        continue
+                    if desde and fecha and fecha < desde:
+                        return
+                    yield entrada
+
+class IndiceLogs:
+    """
+    Índice de las entradas de los logs: fecha, acción, usuario, habitación, huésped y producto,
+    con el segmento y la posición en bytes donde está cada entrada. Las entradas en texto viejo
+    solo se indexan por fecha y usuario (no tienen campos).
+    """
+    _ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS SEGMENTOS (
+            ID INTEGER PRIMARY KEY,
+            NOMBRE TEXT NOT NULL UNIQUE,  -- archivo dentro de la carpeta de logs
+            LOG TEXT NOT NULL,            -- log al que pertenece (ej: checkins.log)
+            INDEXADO INTEGER NOT NULL     -- bytes del segmento ya indexados
+        );
+        CREATE TABLE IF NOT EXISTS ENTRADAS (
+            SEGMENTO INTEGER NOT NULL, POSICION INTEGER NOT NULL,
+            FECHA TEXT, ACCION TEXT, USUARIO TEXT,
+            HABITACION INTEGER, HUESPED INTEGER, PRODUCTO INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_FECHA ON ENTRADAS(FECHA);
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_USUARIO ON ENTRADAS(USUARIO, FECHA);
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_HABITACION ON ENTRADAS(HABITACION, FECHA);
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_HUESPED ON ENTRADAS(HUESPED, FECHA);
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_PRODUCTO ON ENTRADAS(PRODUCTO, FECHA);
+        CREATE INDEX IF NOT EXISTS IDX_ENTRADAS_SEGMENTO ON ENTRADAS(SEGMENTO, POSICION);
+    """
+
+    def __init__(self, carpeta=CARPETA_LOGS):
+        self.carpeta = os.path.abspath(carpeta)
+        self._local = threading.local()  # una conexión por hilo, como DBManager
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.carpeta, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.carpeta, ARCHIVO_INDICE), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(self._ESQUEMA)
+            self._local.conn = conn
+        return conn
+
+    def cerrar_conexion_hilo(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def indexar(self, segmento, nombre_log):
+        """Indexa lo que se agregó al segmento desde la última vez. Si el archivo se achicó, lo reindexa."""
+        ruta = os.path.join(self.carpeta, segmento)
+        if not os.path.exists(ruta):
+            return
+        conn = self._conn()
+        # BEGIN IMMEDIATE: si dos procesos indexan el mismo segmento, el segundo espera y no duplica
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conn.execute("SELECT ID, INDEXADO FROM SEGMENTOS WHERE NOMBRE = ?", (segmento,)).fetchone()
+            if fila is None:
+                id_segmento = conn.execute("INSERT INTO SEGMENTOS (NOMBRE, LOG, INDEXADO) VALUES (?, ?, 0)",
+                                           (segmento, nombre_log)).lastrowid
+                inicio = 0
+            else:
+                id_segmento, inicio = fila
+            # Un .gz no cambia después de creado; su tamaño comprimido no se compara con posiciones
+            if not ruta.endswith(".gz") and os.path.getsize(ruta) < inicio:
+                conn.execute("DELETE FROM ENTRADAS WHERE SEGMENTO = ?", (id_segmento,))
+                inicio = 0
+            filas = []
+            fin = inicio
+            with _abrir(ruta) as archivo:
+                for posicion, entrada, fin in _entradas_con_posicion(archivo, inicio):
+                    filas.extend(_filas_de_indice(id_segmento, posicion, entrada))
+            conn.executemany(
+                "INSERT INTO ENTRADAS (SEGMENTO, POSICION, FECHA, ACCION, USUARIO, HABITACION, HUESPED, PRODUCTO) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+            conn.execute("UPDATE SEGMENTOS SET INDEXADO = ? WHERE ID = ?", (fin, id_segmento))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renombrar(self, segmento, nuevo_nombre):
+        # Las entradas apuntan al ID del segmento: alcanza con cambiarle el nombre.
+        # Si el nombre nuevo ya estaba indexado (se cortó un renombre anterior), se descarta el viejo.
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM SEGMENTOS WHERE NOMBRE = ?", (nuevo_nombre,)).fetchone():
+                self._olvidar(conn, segmento)
+            else:
+                conn.execute("UPDATE SEGMENTOS SET NOMBRE = ? WHERE NOMBRE = ?", (nuevo_nombre, segmento))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def olvidar(self, segmento):
+        """Quita del índice un segmento y sus entradas (ej: después de borrarlo por retención)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._olvidar(conn, segmento)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _olvidar(self, conn, segmento):
+        conn.execute("DELETE FROM ENTRADAS WHERE SEGMENTO = (SELECT ID FROM SEGMENTOS WHERE NOMBRE = ?)", (segmento,))
+        conn.execute("DELETE FROM SEGMENTOS WHERE NOMBRE = ?", (segmento,))
+
+    def ponerse_al_dia(self):
+        """Indexa lo pendiente de todos los logs y olvida los segmentos que ya no existen."""
+        if not os.path.isdir(self.carpeta):
+            return
+        conn = self._conn()
+        indexados = dict(conn.execute("SELECT NOMBRE, INDEXADO FROM SEGMENTOS"))
+        presentes = set()
+        for archivo in os.listdir(self.carpeta):
+            nombre_log = _log_de_segmento(archivo)
+            if nombre_log is None:
+                continue
+            presentes.add(archivo)
+            if archivo.endswith(".gz"):
+                pendiente = archivo not in indexados  # comprimido: no crece
+            else:
+                pendiente = os.path.getsize(os.path.join(self.carpeta, archivo)) != indexados.get(archivo, 0)
+            if pendiente:
+                self.indexar(archivo, nombre_log)
+        for segmento in set(indexados) - presentes:
+            self.olvidar(segmento)
+
+    def buscar(self, log=None, desde=None, hasta=None, usuario=None, habitacion=None,
+               huesped=None, producto=None, accion=None, limite=50):
+        """
+        Entradas que cumplen todos los filtros dados, de la más nueva a la más vieja (hasta 'limite').
+        Cada una es el diccionario de la entrada más 'log' (nombre del archivo).
+        """
+        self.ponerse_al_dia()
+        condiciones, params = [], []
+        for columna, valor in (("S.LOG", log), ("E.USUARIO", usuario), ("E.HABITACION", habitacion),
+                               ("E.HUESPED", huesped), ("E.PRODUCTO", producto), ("E.ACCION", accion)):
+            if valor is not None:
+                condiciones.append(f"{columna} = ?")
+                params.append(valor)
+        if desde:
+            condiciones.append("E.FECHA >= ?")
+            params.append(desde)
+        if hasta:
+            condiciones.append("E.FECHA <= ?")
+            params.append(f"{hasta} 23:59:59")
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        filas = self._conn().execute(
+            f"SELECT DISTINCT S.NOMBRE, E.POSICION, S.LOG, E.FECHA FROM ENTRADAS E JOIN SEGMENTOS S ON S.ID = E.SEGMENTO "
+            f"{where} ORDER BY E.FECHA DESC, E.SEGMENTO DESC, E.POSICION DESC LIMIT ?", (*params, limite)).fetchall()
+
+        resultados = []
+        for segmento, posicion, nombre_log, _ in filas:
+            entrada = self._leer_en(segmento, posicion)
+            if entrada is not None:
+                entrada["log"] = nombre_log
+                resultados.append(entrada)
+        return resultados
+
+    def _leer_en(self, segmento, posicion):
+        try:
+            with _abrir(os.path.join(self.carpeta, segmento)) as archivo:
+                for _, entrada, _ in _entradas_con_posicion(archivo, posicion):
+                    return entrada
+        except OSError:
+            return None
+        return None
+
+@contextlib.contextmanager
+def _candado_de_carpeta(carpeta):
+    # Candado exclusivo entre procesos sobre la carpeta de logs (también entre instancias del mismo proceso)
+    os.makedirs(carpeta, exist_ok=True)
+    with open(os.path.join(carpeta, ARCHIVO_CANDADO), "a+b") as archivo:
+        if fcntl is not None:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+        else:
+            archivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(archivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK se rinde a los 10 s: se sigue esperando
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_UN)
+            else:
+                archivo.seek(0)
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _abrir(ruta):
+    # Segmento en modo binario, comprimido o no (gzip permite seek hacia adelante sobre lo descomprimido)
+    return gzip.open(ruta, "rb") if ruta.endswith(".gz") else open(ruta, "rb")
+
+def _abrir_para_recorrer(ruta):
+    # Para leer desde el final hacia atrás hace falta seek libre: un .gz (segmento rotado, de tamaño
+    # acotado) se descomprime entero en memoria
+    if ruta.endswith(".gz"):
+        with gzip.open(ruta, "rb") as comprimido:
+            return io.BytesIO(comprimido.read())
+    return open(ruta, "rb")
+
+def _es_rotado(archivo):
+    coincidencia = _PATRON_SEGMENTO.search(archivo)
+    return bool(coincidencia) and archivo[:coincidencia.start()].endswith(".log")
+
+def _log_de_segmento(archivo):
+    # Nombre del log al que pertenece un archivo de la carpeta (el actual o uno rotado), o None
+    if archivo.endswith(".log"):
+        return archivo
+    coincidencia = _PATRON_SEGMENTO.search(archivo)
+    if coincidencia and archivo[:coincidencia.start()].endswith(".log"):
+        return archivo[:coincidencia.start()]
+    return None
+
+def _como_entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+def _filas_de_indice(id_segmento, posicion, entrada):
+    # Una fila por entrada; si la entrada trae listas (ej: un intercambio con dos huéspedes y dos
+    # habitaciones) se agrega una fila por cada posición para poder encontrarla por cualquiera.
+    habitaciones = entrada.get("habitaciones") or [entrada.get("habitacion")]
+    huespedes = entrada.get("huespedes") or [entrada.get("huesped")]
+    productos = entrada.get("productos") or [entrada.get("producto")]
+    usuario = entrada.get("usuario")
+    if usuario is None and "accion" not in entrada:
+        # Entrada de texto viejo: el usuario es el último "por <usuario>" del texto
+        encontrados = _PATRON_USUARIO_TEXTO.findall(entrada.get("texto", ""))
+        usuario = encontrados[-1] if encontrados else None
+    return [
+        (id_segmento, posicion, entrada.get("fecha"), entrada.get("accion"), usuario,
+         _como_entero(habitacion), _como_entero(huesped), _como_entero(producto))
+        for habitacion, huesped, producto in zip_longest(habitaciones, huespedes, productos)
+    ]
+
+def _entradas_con_posicion(archivo, inicio):
+    # (posición, entrada, fin) de cada entrada completa de un archivo binario a partir de 'inicio'.
+    # Una línea sin terminar o un bloque de texto sin su separador quedan para la próxima vez.
+    archivo.seek(inicio)
+    posicion = inicio
+    bloque, inicio_bloque = [], None
+    for linea in archivo:
+        if not linea.endswith(b"\n"):
+            return
+        actual = posicion
+        posicion += len(linea)
+        texto = linea.decode("utf-8", errors="replace").rstrip("\r\n")
+        if not bloque:
+            entrada = _json_o_none(texto)
+            if entrada is not None:
+                entrada.setdefault("fecha", None)
+                entrada.setdefault("texto", "")
+                yield actual, entrada, posicion
+                continue
+        if _es_separador(texto):
+            if bloque:
+                yield inicio_bloque, _entrada_de_texto(bloque), posicion
+            bloque = []
+            continue
+        if not bloque:
+            if not texto.strip():
+                continue
+            inicio_bloque = actual
+        bloque.append(texto)
+
+def _lineas_al_reves(archivo, fin):
+    # Líneas de un archivo binario desde la posición 'fin' hacia el principio
+    posicion = fin
+    resto = b""
+    while posicion > 0:
+        tamano = min(BLOQUE_LECTURA, posicion)
+        posicion -= tamano
+        archivo.seek(posicion)
+        lineas = (archivo.read(tamano) + resto).split(b"\n")
+        resto = lineas.pop(0)  # puede ser el final de una línea que empieza en el bloque anterior
+        for linea in reversed(lineas):
+            yield linea.decode("utf-8", errors="replace")
+    if resto:
+        yield resto.decode("utf-8", errors="replace")
+
+def _es_separador(linea):
+    return len(linea) >= 10 and set(linea) == {"-"}
+
+def _json_o_none(linea):
+    if not linea.startswith("{"):
+        return None
+    try:
+        entrada = json.loads(linea)
+    except ValueError:
+        return None
+    return entrada if isinstance(entrada, dict) else None
+
+def _fecha_de_linea(linea):
+    # Fecha (YYYY-MM-DD HH:MM:SS) de una línea JSON o de la línea '[DD-MM-YYYY HH:MM]' del formato viejo
+    entrada = _json_o_none(linea)
+    if entrada is not None:
+        return entrada.get("fecha")
+    coincidencia = _PATRON_FECHA_TEXTO.search(linea)
+    if coincidencia:
+        d, m, a, hora = coincidencia.groups()
+        return f"{a}-{m}-{d} {hora}:00"
+    return None
+
+def _fecha_desde(archivo, posicion):
+    # Primera fecha que aparece a partir de 'posicion' (descartando la línea cortada), o None
+    archivo.seek(posicion)
+    if posicion:
+        archivo.readline()
+    for linea in archivo:
+        fecha = _fecha_de_linea(linea.decode("utf-8", errors="replace").rstrip("\n"))
+        if fecha:
+            return fecha
+    return None
+
+def _posicion_hasta(archivo, tamano, limite):
+    # Posición donde empieza la primera entrada posterior a 'limite' (o el final del archivo).
+    # Las entradas se agregan en orden, así que alcanza con una búsqueda binaria sobre los bytes
+    # y un recorrido corto hacia adelante desde donde termina.
+    bajo, alto = 0, tamano
+    while alto - bajo > BLOQUE_LECTURA:
+        medio = (bajo + alto) // 2
+        fecha = _fecha_desde(archivo, medio)
+        if fecha is None or fecha > limite:
+            alto = medio
+        else:
+            bajo = medio
+    archivo.seek(bajo)
+    if bajo:
+        archivo.readline()
+    inicio_entrada = archivo.tell()
+    while True:
+        posicion = archivo.tell()
+        linea = archivo.readline()
+        if not linea:
+            return tamano
+        texto = linea.decode("utf-8", errors="replace").rstrip("\n")
+        if _es_separador(texto):
+            inicio_entrada = archivo.tell()  # lo que sigue es una entrada nueva
+            continue
+        if _json_o_none(texto) is not None:
+            inicio_entrada = posicion
+        fecha = _fecha_de_linea(texto)
+        if fecha and fecha > limite:
+            return inicio_entrada
+
+def parsear_entradas_al_reves(lineas):
+    """Como parsear_entradas, pero recibe las líneas de la última a la primera y devuelve las entradas en ese orden."""
+    bloque = []  # líneas del bloque de texto en curso, al revés
+    for linea in lineas:
+        linea = linea.rstrip("\r")
+        if not bloque:
+            entrada = _json_o_none(linea)
+            if entrada is not None:
+                entrada.setdefault("fecha", None)
+                entrada.setdefault("texto", "")
+                yield entrada
+                continue
+        if _es_separador(linea):
+            if any(l.strip() for l in bloque):
+                yield _entrada_de_texto(bloque[::-1])
+            bloque = []
+            continue
+        if not bloque and not linea.strip():
+            continue
+        bloque.append(linea)
+    if any(l.strip() for l in bloque):
+        yield _entrada_de_texto(bloque[::-1])
+
+def parsear_entradas(lineas):
+    """
+    Convierte las líneas de un log en entradas, una por vez. Las líneas JSON son una entrada cada una;
+    el texto del formato viejo se junta hasta la línea de guiones y su fecha se toma del '[DD-MM-YYYY HH:MM]'.
+    """
+    bloque = []
+    for linea in lineas:
+        linea = linea.rstrip("\n")
+        if not bloque:
+            entrada = _json_o_none(linea)
+            if entrada is not None:
+                entrada.setdefault("fecha", None)
+                entrada.setdefault("texto", "")
+                yield entrada
+                continue
+        if _es_separador(linea):
+            if bloque:
+                yield _entrada_de_texto(bloque)
+                bloque = []
+            continue
+        bloque.append(linea)
+    if any(l.strip() for l in bloque):
+        yield _entrada_de_texto(bloque)
+
+def _entrada_de_texto(bloque):
+    texto = "\n".join(bloque).strip("\n")
+    return {"fecha": _fecha_de_linea(texto), "texto": texto}
+
+bitacora = Bitacora()
+atexit.register(bitacora.cerrar)
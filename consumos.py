@@ -1,8 +1,10 @@
 import re
+import sqlite3
 import usuarios
+from auditoria import auditar
 from datetime import datetime
 from db import db
-from huespedes import buscar_huesped, _editar_huesped_db
+from huespedes import buscar_huesped, _editar_huesped_db, registrar_eventos, registrar_evento
 from unidecode import unidecode
 from utiles import registrar_log, imprimir_huesped, pedir_entero, pedir_confirmacion, imprimir_productos, formatear_fecha, marca_de_tiempo, opcion_menu, parse_fecha_a_datetime, pedir_precio
 
@@ -57,13 +59,14 @@ def _recolectar_consumos(huesped_numero):
         if codigo == 0:
             break
         if codigo == "*":
-            productos = db.obtener_todos("SELECT * FROM PRODUCTOS WHERE STOCK > 0 OR STOCK = -1")
+            productos = db.obtener_todos("SELECT * FROM PRODUCTOS WHERE STOCK > 0 OR STOCK = -1", cache=True)
             if not productos:
                 print("\n❌ No hay productos en stock.")
             else:
                 imprimir_productos(productos)
             continue
 
+        # Sin caché: el stock leído acá valida la cantidad
         producto = db.obtener_uno("SELECT * FROM PRODUCTOS WHERE CODIGO = ?", (codigo,))
         if not producto:
             print("\n❌ Producto no encontrado.")
@@ -151,49 +154,83 @@ def _editar_consumos_agregados(consumos):
 
 def _guardar_consumos_en_db(consumos, huesped):
     # Guarda la lista final de consumos en la base de datos, actualizando stock y registro.
+    # Todas las líneas del carrito se escriben en lote: la cantidad de sentencias no depende
+    # del largo de la cuenta.
 
     numero_huesped = huesped["NUMERO"]
 
+    try:
+        _escribir_consumos(consumos, numero_huesped)
+    except Exception as e:
+        print(f"\n❌ Error al registrar los consumos: {e}")
+        return
+
+    print(f"✔ Consumos agregados para {huesped['NOMBRE'].capitalize()} {huesped['APELLIDO'].capitalize()}, de la habitación {huesped['HABITACION']}:")
+    for i, consumo in enumerate(consumos):
+        print(f"  {i + 1}. Producto: {consumo['nombre'].capitalize()} (Cód: {consumo['codigo']}), Cantidad: {consumo['cantidad']}")
+
+def _escribir_consumos(consumos, numero_huesped):
+    # Inserta los consumos, descuenta stock y agrega los eventos al historial, todo en una transacción.
     with db.transaccion():
+        filas_consumo = []
+        eventos = []
         for consumo in consumos:
             fecha = datetime.now().isoformat(sep=" ", timespec="seconds")
-            
-            # 1. Insertar el consumo
-            db.ejecutar("INSERT INTO CONSUMOS (HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO) VALUES (?, ?, ?, ?, ?)",
-                        (consumo['huesped_id'], consumo['codigo'], consumo['cantidad'], fecha, consumo['pagado']))
-            
-            # 2. Actualizar stock del producto
-            if consumo['stock_anterior'] != -1:
-                grupo_info = db.obtener_uno("SELECT GRUPO FROM PRODUCTOS WHERE CODIGO = ?", (consumo['codigo'],))
-                grupo = grupo_info["GRUPO"] if grupo_info else None
-
-                if grupo:
-                    # Buscar todos los productos en el mismo grupo
-                    equivalentes = db.obtener_todos("SELECT CODIGO, STOCK FROM PRODUCTOS WHERE GRUPO = ?", (grupo,))
-                    for eq in equivalentes:
-                        if eq["STOCK"] != -1:  # no tocar stock infinito
-                            nuevo_stock = eq["STOCK"] - consumo['cantidad']
-                            db.ejecutar("UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?", (nuevo_stock, eq["CODIGO"]))
-                else:
-                    # Producto sin grupo → descuenta solo a él
-                    nuevo_stock = consumo['stock_anterior'] - consumo['cantidad']
-                    db.ejecutar("UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?", (nuevo_stock, consumo['codigo']))
+            filas_consumo.append((consumo['huesped_id'], consumo['codigo'], consumo['cantidad'], fecha, consumo['pagado']))
 
-            # 3. Abre el registro del huésped
-            registro_anterior_data = db.obtener_uno("SELECT REGISTRO FROM HUESPEDES WHERE NUMERO = ?", (numero_huesped,))
-            registro_anterior = str(registro_anterior_data["REGISTRO"] or "") if registro_anterior_data else ""
-            
-            # 4. Prepara el registro de la acción actual
-            registro_consumo = f"Consumo agregado: {consumo['nombre']} (x{consumo['cantidad']}) - {fecha}"
+            registro_consumo = f"Consumo agregado: {consumo['nombre']} (x{consumo['cantidad']})"
             if consumo['pagado'] == 1:
                 registro_consumo += " (PAGADO)"
-            
-            nuevo_registro = (registro_anterior + "\n---\n" + registro_consumo) if registro_anterior.strip() else registro_consumo
-            _editar_huesped_db(numero_huesped, {"REGISTRO": nuevo_registro})
+            eventos.append(("CONSUMO", registro_consumo))
 
-    print(f"✔ Consumos agregados para {huesped['NOMBRE'].capitalize()} {huesped['APELLIDO'].capitalize()}, de la habitación {huesped['HABITACION']}:")
-    for i, consumo in enumerate(consumos):
-        print(f"  {i + 1}. Producto: {consumo['nombre'].capitalize()} (Cód: {consumo['codigo']}), Cantidad: {consumo['cantidad']}")
+        # 1. Insertar los consumos
+        db.ejecutar_lote("INSERT INTO CONSUMOS (HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO) VALUES (?, ?, ?, ?, ?)", filas_consumo)
+
+        # 2. Actualizar stock de los productos (y de los equivalentes de su grupo)
+        _descontar_stock_consumos(consumos)
+
+        # 3. Agrega las entradas al historial del huésped (INSERT, sin reescribir lo anterior)
+        registrar_eventos(numero_huesped, eventos)
+
+def _descontar_stock_consumos(consumos):
+    # Descuenta del stock las cantidades del carrito, agrupadas por producto.
+    # Si el producto pertenece a un grupo, el descuento se aplica a todos sus equivalentes.
+    # No se filtra por el stock leído al armar el carrito: si es infinito (-1) lo decide la base al actualizar.
+    cantidades = {}
+    for consumo in consumos:
+        cantidades[consumo['codigo']] = cantidades.get(consumo['codigo'], 0) + consumo['cantidad']
+    try:
+        _ajustar_stock(cantidades)
+    except sqlite3.IntegrityError:
+        # El stock se leyó al armar el carrito; otra terminal pudo haber vendido mientras tanto
+        raise ValueError("No hay stock suficiente para alguno de los productos (cambió desde que se armó el carrito).")
+
+def _ajustar_stock(cantidades):
+    """
+    Resta del stock 'cantidades' (codigo -> unidades; negativas para reponer) con UPDATE relativos,
+    sobre el valor que tiene la base en ese momento y no sobre uno leído antes.
+    Los productos con grupo se suman por grupo y se actualizan todos sus equivalentes en una sola sentencia.
+    El stock infinito (-1) no se toca. Si no alcanza el stock la sentencia deja NULL, que viola NOT NULL
+    y lanza sqlite3.IntegrityError (un simple STOCK - ? podría caer justo en -1 y volverse infinito).
+    Usar dentro de una transacción: una consulta para los grupos y dos lotes, sin importar el tamaño de cada grupo.
+    """
+    if not cantidades:
+        return
+    marcadores = ", ".join("?" * len(cantidades))
+    productos = db.obtener_todos(f"SELECT CODIGO, GRUPO FROM PRODUCTOS WHERE CODIGO IN ({marcadores})", tuple(cantidades))
+
+    por_grupo = {}   # grupo -> unidades
+    por_codigo = {}  # codigo sin grupo -> unidades
+    for producto in productos:
+        destino = por_grupo if producto["GRUPO"] else por_codigo
+        clave = producto["GRUPO"] or producto["CODIGO"]
+        destino[clave] = destino.get(clave, 0) + cantidades[producto["CODIGO"]]
+
+    ajuste = "STOCK = CASE WHEN STOCK >= ? THEN STOCK - ? END"
+    db.ejecutar_lote(f"UPDATE PRODUCTOS SET {ajuste} WHERE GRUPO = ? AND STOCK != -1",
+                     [(cantidad, cantidad, grupo) for grupo, cantidad in por_grupo.items() if cantidad])
+    db.ejecutar_lote(f"UPDATE PRODUCTOS SET {ajuste} WHERE CODIGO = ? AND STOCK != -1",
+                     [(cantidad, cantidad, codigo) for codigo, cantidad in por_codigo.items() if cantidad])
 
 @usuarios.requiere_acceso(1)
 def ver_consumos():
@@ -264,7 +301,7 @@ def _obtener_huesped(habitacion):
         if huesped:
             return huesped, "ABIERTO"
         huesped = db.obtener_uno(
-            "SELECT * FROM HUESPEDES WHERE HABITACION = ? AND ESTADO = 'PROGRAMADO' ORDER BY DATE(CHECKIN) ASC", 
+            "SELECT * FROM HUESPEDES WHERE HABITACION = ? AND ESTADO = 'PROGRAMADO' ORDER BY CHECKIN ASC", 
             (habitacion,)
         )
         return (huesped, "PROGRAMADO") if huesped else (None, None)
@@ -526,31 +563,19 @@ def _eliminar_consumos_db(huesped, consumos, a_eliminar):
     """
     try:
         with db.transaccion():
+            a_reponer = {}  # codigo -> unidades a devolver al stock
             for i in a_eliminar:
                 consumo_data = consumos[i]
                 consumo_id = consumo_data["ID"]
                 producto_id = consumo_data["PRODUCTO"]
                 producto_nombre = consumo_data["NOMBRE"]
                 cantidad = consumo_data["CANTIDAD"]
-
-                # Restaurar stock (producto y equivalentes de su grupo)
-                grupo_info = db.obtener_uno("SELECT GRUPO FROM PRODUCTOS WHERE CODIGO = ?", (producto_id,))
-                grupo = grupo_info["GRUPO"] if grupo_info else None
-
-                if grupo:
-                    equivalentes = db.obtener_todos("SELECT CODIGO, STOCK FROM PRODUCTOS WHERE GRUPO = ?", (grupo,))
-                    for eq in equivalentes:
-                        if eq["STOCK"] != -1:
-                            nuevo_stock = eq["STOCK"] + cantidad
-                            db.ejecutar("UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?", (nuevo_stock, eq["CODIGO"]))
-                else:
-                    producto = db.obtener_uno("SELECT STOCK FROM PRODUCTOS WHERE CODIGO = ?", (producto_id,))
-                    if producto and producto["STOCK"] != -1:
-                        nuevo_stock = producto["STOCK"] + cantidad
-                        db.ejecutar("UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?", (nuevo_stock, producto_id))
+                a_reponer[producto_id] = a_reponer.get(producto_id, 0) + cantidad
 
                 # Eliminar consumo
                 db.ejecutar("DELETE FROM CONSUMOS WHERE ID = ?", (consumo_id,))
+                auditar("CONSUMO_ELIMINADO", "CONSUMO", consumo_id, huesped=huesped["NUMERO"],
+                        producto=producto_id, cantidad=cantidad)
 
                 # Log
                 marca_tiempo = marca_de_tiempo()
@@ -560,7 +585,12 @@ def _eliminar_consumos_db(huesped, consumos, a_eliminar):
                     f"Producto: {producto_nombre} (ID: {producto_id}) | Cantidad: {cantidad} | Consumo_ID: {consumo_id}\n"
                     f"Acción realizada por: {usuarios.sesion.usuario}"
                 )
-                registrar_log("consumos_eliminados.log", log)
+                registrar_log("consumos_eliminados.log", log, accion="CONSUMO_ELIMINADO", usuario=usuarios.sesion.usuario,
+                              huesped=huesped["NUMERO"], habitacion=huesped["HABITACION"],
+                              producto=producto_id, cantidad=cantidad, consumo=consumo_id)
+
+            # Restaurar stock (producto y equivalentes de su grupo), todo junto
+            _ajustar_stock({codigo: -cantidad for codigo, cantidad in a_reponer.items()})
         return len(a_eliminar)
     except Exception as e:
         raise RuntimeError(f"La operación de eliminación falló y fue revertida: {e}")
@@ -667,8 +697,7 @@ def _procesar_pago(consumos_pendientes):
     # 2. Ejecución de la transacción
     try:
         with db.transaccion():
-            for cid in consumos_a_pagar_ids:
-                db.ejecutar("UPDATE CONSUMOS SET PAGADO = 1 WHERE ID = ?", (cid,))
+            db.ejecutar_lote("UPDATE CONSUMOS SET PAGADO = 1 WHERE ID = ?", [(cid,) for cid in consumos_a_pagar_ids])
         print(f"\n✔ Se marcaron {len(consumos_a_pagar_ids)} consumo(s) como pagados.")
     except Exception as e:
         print(f"\n❌ La operación de registrar pago falló y fue revertida. Error: {e}")
@@ -776,21 +805,14 @@ def _recolectar_parametros_descuento():
 
 def _ejecutar_actualizacion_descuento(numero_huesped, nuevo_valor_descuento, log_string):
     """
-    Prepara y ejecuta la actualización del campo DESCUENTO y el REGISTRO.
+    Prepara y ejecuta la actualización del campo DESCUENTO y el evento en el historial.
     """
     updates = {"DESCUENTO": nuevo_valor_descuento}
-    
-    # Obtener el registro actual
-    registro_anterior_data = db.obtener_uno("SELECT REGISTRO FROM HUESPEDES WHERE NUMERO = ?", (numero_huesped,))
-    registro_anterior = str(registro_anterior_data["REGISTRO"] or "")
-    
-    # Crear el nuevo registro (Asegúrate que 'marca_de_tiempo' y 'usuarios.sesion.usuario' están disponibles)
-    registro_descuento = f"{log_string} por {usuarios.sesion.usuario} - {marca_de_tiempo()}"
-    updates["REGISTRO"] = (registro_anterior + "\n---\n" + registro_descuento) if registro_anterior.strip() else registro_descuento
 
     try:
         with db.transaccion():
             _editar_huesped_db(numero_huesped, updates) 
+            registrar_evento(numero_huesped, "DESCUENTO", log_string.strip())
         print("\n✔ Operación de descuento realizada correctamente.")
         return True
     except Exception as e:
@@ -831,13 +853,14 @@ def _recolectar_cortesias():
             if codigo == 0:
                 break
             if codigo == "*":
-                productos = db.obtener_todos("SELECT * FROM PRODUCTOS WHERE STOCK > 0 OR STOCK = -1")
+                productos = db.obtener_todos("SELECT * FROM PRODUCTOS WHERE STOCK > 0 OR STOCK = -1", cache=True)
                 if productos:
                     imprimir_productos(productos)
                 else:
                     print("\n❌ No hay productos en stock.")
                 continue
 
+            # Sin caché: el stock leído acá valida la cantidad
             producto = db.obtener_uno("SELECT * FROM PRODUCTOS WHERE CODIGO = ?", (codigo,))
             if not producto:
                 print("\n⚠️  Producto no encontrado.")
@@ -927,19 +950,29 @@ def _guardar_y_registrar_cortesias(cortesias, autoriza):
 
     try:
         with db.transaccion():
+            filas_cortesia = []
+            descuentos = {}  # codigo -> unidades a descontar
             for cortesia in cortesias:
                 fecha = datetime.now().isoformat(sep=" ", timespec="seconds")
-                
-                # 1. Insertar en la tabla de CORTESIAS
-                db.ejecutar("INSERT INTO CORTESIAS (PRODUCTO, CANTIDAD, FECHA, AUTORIZA) VALUES (?, ?, ?, ?)",
-                            (cortesia['codigo'], cortesia['cantidad'], fecha, autoriza))
-
-                # 2. Actualizar stock del producto
-                if cortesia['stock_anterior'] != -1:
-                    nuevo_stock = cortesia['stock_anterior'] - cortesia['cantidad']
-                    db.ejecutar("UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?", (nuevo_stock, cortesia['codigo']))
-
-                # 3. Registrar en el archivo de log
+                filas_cortesia.append((cortesia['codigo'], cortesia['cantidad'], fecha, autoriza))
+                descuentos[cortesia['codigo']] = descuentos.get(cortesia['codigo'], 0) + cortesia['cantidad']
+
+            # 1. Insertar en la tabla de CORTESIAS
+            db.ejecutar_lote("INSERT INTO CORTESIAS (PRODUCTO, CANTIDAD, FECHA, AUTORIZA) VALUES (?, ?, ?, ?)", filas_cortesia)
+            # Con el candado de escritura tomado, las últimas filas de CORTESIAS son las recién insertadas
+            ids_cortesia = [fila["ID"] for fila in reversed(db.obtener_todos(
+                "SELECT ID FROM CORTESIAS ORDER BY ID DESC LIMIT ?", (len(filas_cortesia),)))]
+
+            # 2. Actualizar stock de los productos (y de los equivalentes de su grupo), como en los consumos
+            try:
+                _ajustar_stock(descuentos)
+            except sqlite3.IntegrityError:
+                raise ValueError("No hay stock suficiente para alguno de los productos (cambió desde que se armó la lista).")
+
+            # 3. Registrar en auditoría y en el archivo de log
+            for id_cortesia, cortesia in zip(ids_cortesia, cortesias):
+                auditar("CORTESIA", "CORTESIA", id_cortesia, producto=cortesia["codigo"],
+                        cantidad=cortesia["cantidad"], autoriza=autoriza)
                 log = (
                     f"[{marca_de_tiempo()}] CONSUMO DE CORTESÍA:\n"
                     f"Producto: {cortesia['nombre']} (ID: {cortesia['codigo']}) | "
@@ -947,7 +980,8 @@ def _guardar_y_registrar_cortesias(cortesias, autoriza):
                     f"Autorizado por: {autoriza.title()} | "
                     f"Registrado por: {usuarios.sesion.usuario}"
                 )
-                registrar_log("consumos_cortesia.log", log)
+                registrar_log("consumos_cortesia.log", log, accion="CORTESIA", usuario=usuarios.sesion.usuario,
+                              producto=cortesia["codigo"], cantidad=cortesia["cantidad"], autoriza=autoriza)
         print(f"\n✔ Cortesía autorizada por {autoriza.capitalize()} registrada correctamente.")
         for i, cortesia in enumerate(cortesias):
             print(f"  {i + 1}. {cortesia['nombre'].capitalize()}, (x{cortesia['cantidad']})")
@@ -1,78 +1,859 @@
+import logging
+import os
+import random
+import re
 import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
 from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Perfil de conexión por defecto. Se aplica cada vez que se abre la conexión.
+# WAL permite que los reportes lean mientras recepción escribe consumos.
+PRAGMAS_POR_DEFECTO = {
+    "busy_timeout": 5000,        # ms que espera un escritor antes de "database is locked"
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",     # seguro con WAL, evita un fsync por cada commit
+    "cache_size": -32000,        # negativo = KiB (~32 MB de caché de páginas)
+    "mmap_size": 268435456,      # 256 MB mapeados en memoria para lecturas
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+# Cada despliegue puede sobrescribir el perfil con esta variable de entorno,
+# por ejemplo: BASEDEDATOS_PRAGMAS="cache_size=-8000,synchronous=FULL"
+VARIABLE_ENTORNO_PRAGMAS = "BASEDEDATOS_PRAGMAS"
+
+_PATRON_VALOR_PRAGMA = re.compile(r"^-?[A-Za-z0-9_]+$")
+
+# Reintentos cuando otra terminal tiene tomada la base para escribir ("database is locked").
+# Cada intento ya espera hasta busy_timeout; entre intentos se duerme con backoff exponencial.
+REINTENTOS_ESCRITURA = 8
+ESPERA_INICIAL_REINTENTO = 0.05  # segundos, se duplica en cada reintento
+ESPERA_MAXIMA_REINTENTO = 2.0
+UMBRAL_ESPERA = 0.01             # una escritura que tardó más que esto en empezar cuenta como espera
+
+def _es_bloqueo(error):
+    mensaje = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in mensaje or "busy" in mensaje)
+
+# Registro de consultas lentas. Umbral en milisegundos; sin umbral (None) no se mide nada.
+# Se puede activar sin tocar el código con, por ejemplo: BASEDEDATOS_UMBRAL_LENTAS_MS=200
+VARIABLE_ENTORNO_UMBRAL_LENTAS = "BASEDEDATOS_UMBRAL_LENTAS_MS"
+ARCHIVO_CONSULTAS_LENTAS = os.path.join("logs", "consultas_lentas.log")
+TAMANO_MAXIMO_LOG_LENTAS = 1024 * 1024  # bytes por archivo antes de rotar
+RESPALDOS_LOG_LENTAS = 5                # archivos rotados que se conservan
+
+# Medición por acción (ver DBManager.medir_accion): si una misma forma de SQL se repite más de
+# estas veces en una sola acción del menú, se anota en el log como posible consulta "N+1".
+UMBRAL_REPETICIONES_SQL = 10
+ARCHIVO_CONSULTAS_REPETIDAS = os.path.join("logs", "consultas_repetidas.log")
+
+_PATRON_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PATRON_ESPACIOS = re.compile(r"\s+")
+_SENTENCIAS_CON_PLAN = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+
+# Caché de resultados (opcional, por consulta con cache=True)
+TAMANO_CACHE = 256  # cantidad máxima de resultados guardados (se descarta el menos usado)
+
+_PATRON_TABLAS_LEIDAS = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_PATRON_TABLA_ESCRITA = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+([A-Za-z_][A-Za-z0-9_]*)",
+    re.IGNORECASE)
+
+def _tablas_leidas(query):
+    return frozenset(tabla.upper() for tabla in _PATRON_TABLAS_LEIDAS.findall(query))
+
+def _tabla_escrita(query):
+    # Tabla que modifica un INSERT/UPDATE/DELETE, o None si es otra cosa (DDL, PRAGMA, etc.)
+    coincidencia = _PATRON_TABLA_ESCRITA.match(query)
+    return coincidencia.group(1).upper() if coincidencia else None
+
+def _clave_params(params):
+    # Los parámetros forman parte de la clave del caché, así que tienen que ser inmutables.
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+def _umbral_de_entorno():
+    crudo = os.environ.get(VARIABLE_ENTORNO_UMBRAL_LENTAS, "").strip()
+    if not crudo:
+        return None
+    try:
+        return float(crudo)
+    except ValueError:
+        print(f"⚠️  Valor inválido para {VARIABLE_ENTORNO_UMBRAL_LENTAS}: {crudo}")
+        return None
+
+def _normalizar_sql(query):
+    # Una sola línea y literales reemplazados por '?', para agrupar consultas de la misma forma.
+    return _PATRON_ESPACIOS.sub(" ", _PATRON_LITERALES.sub("?", query)).strip()
+
+def _funcion_llamadora():
+    # Primer marco de la pila que no pertenece a este módulo (quién pidió la consulta).
+    marco = sys._getframe(1)
+    while marco is not None and marco.f_code.co_filename == __file__:
+        marco = marco.f_back
+    if marco is None:
+        return "?"
+    return f"{os.path.basename(marco.f_code.co_filename)}:{marco.f_lineno} {marco.f_code.co_name}"
+
+def _pragmas_de_entorno():
+    # Lee los PRAGMA definidos en la variable de entorno (formato clave=valor separados por coma).
+    pragmas = {}
+    crudo = os.environ.get(VARIABLE_ENTORNO_PRAGMAS, "")
+    for parte in crudo.split(","):
+        if "=" not in parte:
+            continue
+        clave, valor = parte.split("=", 1)
+        pragmas[clave.strip().lower()] = valor.strip()
+    return pragmas
+
+class Fila:
+    # Fila compacta de resultado. Guarda la tupla que devuelve sqlite3 y comparte el mapa
+    # columna -> posición con todas las filas de la misma consulta, en lugar de copiar cada
+    # fila a un dict nuevo. Se usa igual que un dict: fila["COL"], fila.get("COL"), "COL" in fila.
+    # Las claves asignadas después (ej: fila["ITEM_TOTAL"] = ...) se guardan aparte.
+    __slots__ = ("_columnas", "_valores", "_extra")
+
+    def __init__(self, columnas, valores):
+        self._columnas = columnas  # dict {nombre: posición}, compartido por toda la consulta
+        self._valores = valores
+        self._extra = None
+
+    def __getitem__(self, clave):
+        if self._extra is not None and clave in self._extra:
+            return self._extra[clave]
+        return self._valores[self._columnas[clave]]
+
+    def __setitem__(self, clave, valor):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[clave] = valor
+
+    def get(self, clave, defecto=None):
+        try:
+            return self[clave]
+        except KeyError:
+            return defecto
+
+    def __contains__(self, clave):
+        return clave in self._columnas or (self._extra is not None and clave in self._extra)
+
+    def keys(self):
+        claves = list(self._columnas)
+        if self._extra:
+            claves.extend(clave for clave in self._extra if clave not in self._columnas)
+        return claves
+
+    def values(self):
+        return [self[clave] for clave in self.keys()]
+
+    def items(self):
+        return [(clave, self[clave]) for clave in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, otro):
+        if isinstance(otro, (Fila, dict)):
+            return dict(self.items()) == dict(otro.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+# Mapas columna -> posición, uno por "forma" de consulta (tupla de nombres de columna).
+# Las consultas de la aplicación son texto fijo, así que las formas son pocas (una por SELECT distinto);
+# igual se acota por si alguien arma columnas dinámicas: al llenarse se vacía y se vuelve a armar.
+# Las Filas ya entregadas conservan su propio mapa.
+_ESQUEMAS = {}
+MAXIMO_ESQUEMAS = 1024
+
+def _esquema(cursor):
+    # Devuelve el mapa de columnas del cursor, reutilizando el de consultas con la misma forma.
+    nombres = tuple(col[0] for col in cursor.description)
+    esquema = _ESQUEMAS.get(nombres)
+    if esquema is None:
+        if len(_ESQUEMAS) >= MAXIMO_ESQUEMAS:
+            _ESQUEMAS.clear()
+        esquema = {nombre: posicion for posicion, nombre in enumerate(nombres)}
+        _ESQUEMAS[nombres] = esquema
+    return esquema
+
+class EstadisticasAccion:
+    # Sentencias, filas y tiempo de SQL de una acción del menú (una llamada a requiere_acceso).
+    # 'por_sql' cuenta cada texto de SQL tal como se ejecutó; 'formas()' los agrupa normalizados.
+    __slots__ = ("nombre", "sentencias", "filas", "segundos", "por_sql")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.sentencias = 0
+        self.filas = 0
+        self.segundos = 0.0  # tiempo dentro de SQLite, sin contar lo que tarda el usuario en responder
+        self.por_sql = {}
+
+    def registrar(self, query, filas, segundos):
+        self.sentencias += 1
+        self.filas += max(filas, 0)
+        self.segundos += segundos
+        self.por_sql[query] = self.por_sql.get(query, 0) + 1
+
+    def formas(self):
+        # Cantidad de ejecuciones por forma de SQL (literales reemplazados por '?')
+        formas = {}
+        for query, cantidad in self.por_sql.items():
+            forma = _normalizar_sql(query)
+            formas[forma] = formas.get(forma, 0) + cantidad
+        return formas
+
+    def repetidas(self, umbral=UMBRAL_REPETICIONES_SQL):
+        return sorted(((forma, n) for forma, n in self.formas().items() if n > umbral), key=lambda x: -x[1])
+
+    def __repr__(self):
+        return (f"EstadisticasAccion({self.nombre!r}, sentencias={self.sentencias}, "
+                f"filas={self.filas}, segundos={self.segundos:.4f})")
+
+class _CopiaReiniciada(Exception):
+    # Corta una copia paso a paso que se reinició demasiadas veces (ver DBManager.respaldar)
+    pass
 
 class DBManager:
-    def __init__(self, db_path="BaseDeDatos.db"):
+    # Cada hilo trabaja con su propia conexión (sqlite3 no permite compartirlas entre hilos).
+    # Las lecturas corren en paralelo gracias a WAL; las escrituras pasan de a una
+    # por el candado de escritura, que actúa como cola de un único escritor.
+    def __init__(self, db_path="BaseDeDatos.db", pragmas=None, umbral_lentas_ms=None):
         self._path = db_path
-        self._conn = None
+        # El perfil final es: valores por defecto < variable de entorno < parámetro explícito
+        self._pragmas = dict(PRAGMAS_POR_DEFECTO)
+        self._pragmas.update(_pragmas_de_entorno())
+        self._pragmas.update({clave.lower(): valor for clave, valor in (pragmas or {}).items()})
+        self._local = threading.local()          # conexión y profundidad de transacción por hilo
+        self._conexiones = {}                    # id de hilo -> conexión, para poder cerrarlas todas
+        self._conexiones_lectura = {}            # id de hilo -> conexión de solo lectura (ver 'lectura_consistente')
+        self._lock_conexiones = threading.Lock()
+        self._lock_escritura = threading.RLock() # un solo escritor a la vez dentro del proceso
+        self._lock_contencion = threading.Lock()
+        self._contencion = {"esperas": 0, "segundos_espera": 0.0, "reintentos": 0, "fallos": 0}
+        self._loggers = {}                       # archivo de log -> logger (se crean al usarlos)
+        self.umbral_repeticiones = UMBRAL_REPETICIONES_SQL
+        self.ultima_accion = None                # EstadisticasAccion de la última acción terminada
+        self._lock_acciones = threading.Lock()
+        self._acciones = {}                      # nombre de acción -> totales acumulados
+        # Caché compartido por todos los hilos: clave (método, sql, params) -> (tablas, esquema, datos)
+        self._cache = OrderedDict()
+        self._lock_cache = threading.Lock()
+        self._version_cache = 0                  # aumenta con cada invalidación
+        self._dependientes = None                # tabla -> tablas con FK hacia ella (se calcula al usarlo)
+        self._estadisticas_cache = {"aciertos": 0, "fallos": 0, "invalidaciones": 0}
+        self._umbral_lentas = None               # segundos; None = no se mide
+        self.configurar_consultas_lentas(umbral_lentas_ms if umbral_lentas_ms is not None else _umbral_de_entorno())
         self.abrir_conexion() # Abre la conexión al inicializar
 
     def abrir_conexion(self):
-        #Intenta abrir la conexión, configurando los parámetros.
-        if self._conn is None:
+        #Intenta abrir la conexión del hilo actual, configurando los parámetros.
+        if getattr(self._local, "conn", None) is None:
             try:
-                self._conn = sqlite3.connect(self._path)
-                self._conn.execute("PRAGMA foreign_keys = ON")
-                self._conn.row_factory = sqlite3.Row
+                # isolation_level=None: las transacciones se abren explícitamente en 'transaccion'.
+                # check_same_thread=False solo para que 'cerrar' pueda cerrar conexiones de otros hilos.
+                conn = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+                self._aplicar_pragmas(conn)
+                # Sin row_factory: sqlite3 entrega tuplas y las envolvemos en 'Fila'
             except sqlite3.Error as e:
                 print(f"❌ Error al conectar a la base de datos: {e}")
                 raise # Propaga el error para que el programa sepa que no puede continuar
+            self._local.conn = conn
+            self._local.profundidad = 0
+            self._local.tablas_modificadas = set()
+            self._registrar_conexion(self._conexiones, conn)
+
+    def _registrar_conexion(self, registro, conn):
+        # Anota la conexión del hilo actual en 'registro' (id de hilo -> conexión).
+        # Python reutiliza el id de un hilo que terminó: antes de anotar se cierran las conexiones de
+        # los hilos que ya no existen, en lugar de pisarlas y dejarlas abiertas hasta 'cerrar'.
+        vivos = {hilo.ident for hilo in threading.enumerate()}
+        actual = threading.get_ident()
+        with self._lock_conexiones:
+            huerfanas = [registro.pop(ident) for ident in list(registro) if ident == actual or ident not in vivos]
+            registro[actual] = conn
+        for huerfana in huerfanas:
+            if huerfana is not conn:
+                huerfana.close()
+
+    @property
+    def _conn(self):
+        # Conexión del hilo actual; se abre la primera vez que el hilo la necesita.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._conexiones.get(threading.get_ident()) is not conn:
+            # Nunca se abrió en este hilo, o 'cerrar' la cerró desde otro hilo
+            self._local.conn = None
+            self.abrir_conexion()
+            conn = self._local.conn
+        return conn
+
+    def _conn_consultas(self):
+        # Conexión para las lecturas: la de solo lectura si el hilo está dentro de 'lectura_consistente'.
+        # Dentro de una transacción siempre la de escritura, para ver lo que la propia transacción ya escribió.
+        lectura = getattr(self._local, "lectura", None)
+        if lectura is None or getattr(self._local, "profundidad", 0) > 0:
+            return self._conn
+        return lectura
+
+    def _abrir_conexion_lectura(self):
+        # Conexión de solo lectura del hilo actual (mode=ro + query_only), separada de la de escritura.
+        conn = getattr(self._local, "conn_lectura", None)
+        if conn is not None and self._conexiones_lectura.get(threading.get_ident()) is conn:
+            return conn
+        self._conn  # la de escritura crea el archivo y el WAL si todavía no existen
+        uri = Path(self._path).resolve().as_uri() + "?mode=ro"
+        try:
+            conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+            for clave in ("busy_timeout", "cache_size", "mmap_size", "temp_store"):
+                if clave in self._pragmas and _PATRON_VALOR_PRAGMA.match(str(self._pragmas[clave])):
+                    conn.execute(f"PRAGMA {clave} = {self._pragmas[clave]}")
+            conn.execute("PRAGMA query_only = ON")
+        except sqlite3.Error as e:
+            print(f"❌ Error al abrir la conexión de solo lectura: {e}")
+            raise
+        self._local.conn_lectura = conn
+        self._registrar_conexion(self._conexiones_lectura, conn)
+        return conn
+
+    @contextmanager
+    def lectura_consistente(self, foto=True):
+        """
+        Dentro del bloque, las lecturas de este hilo (obtener_uno, obtener_todos, obtener_iter) van a
+        una conexión de solo lectura y ven una única foto de la base: la que había en la primera
+        consulta del bloque. Con WAL no frena a los escritores. Sirve también como decorador.
+        Mientras la foto está abierta el WAL no se puede reciclar (checkpoint): el bloque tiene que
+        abarcar las consultas, no las pausas esperando al usuario.
+        foto=False: solo desvía las lecturas a esa conexión, sin transacción; cada consulta ve la base
+        de ese momento. Para pantallas que intercalan consultas con preguntas al usuario.
+        Un 'with transaccion()' dentro del bloque lee por la conexión de escritura: ve sus propios cambios.
+        """
+        if getattr(self._local, "lectura", None) is not None:
+            yield  # ya estamos dentro de una foto: se usa la misma
+            return
+        conn = self._abrir_conexion_lectura()
+        if foto:
+            # BEGIN diferido: la foto se fija con la primera lectura
+            conn.execute("BEGIN")
+        self._local.lectura = conn
+        try:
+            yield
+        finally:
+            self._local.lectura = None
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+
+    def _aplicar_pragmas(self, conn):
+        # Aplica el perfil de PRAGMA a una conexión recién abierta.
+        # Solo se aceptan claves conocidas y valores simples, ya que PRAGMA no admite parámetros (?).
+        for clave, valor in self._pragmas.items():
+            if clave not in PRAGMAS_POR_DEFECTO:
+                print(f"⚠️  PRAGMA '{clave}' ignorado (no permitido).")
+                continue
+            if not _PATRON_VALOR_PRAGMA.match(str(valor)):
+                print(f"⚠️  Valor inválido para PRAGMA '{clave}': {valor}")
+                continue
+            conn.execute(f"PRAGMA {clave} = {valor}")
+
+    def diagnostico(self):
+        """Devuelve un diccionario con los PRAGMA efectivos de la conexión y datos del motor."""
+        info = {"ruta": self._path, "sqlite_version": sqlite3.sqlite_version}
+        for clave in PRAGMAS_POR_DEFECTO:
+            fila = self._conn.execute(f"PRAGMA {clave}").fetchone()
+            info[clave] = fila[0] if fila else None
+        with self._lock_conexiones:
+            info["conexiones_abiertas"] = len(self._conexiones)
+            info["conexiones_lectura"] = len(self._conexiones_lectura)
+        return info
     
+    def estadisticas_contencion(self):
+        """Devuelve cuántas escrituras esperaron el bloqueo, cuántos reintentos hubo y cuántas fallaron."""
+        with self._lock_contencion:
+            return dict(self._contencion)
+
+    def _con_reintentos(self, operacion):
+        # Ejecuta 'operacion' (que toma el bloqueo de escritura de SQLite) reintentando con backoff
+        # exponencial mientras la base esté bloqueada por otra conexión. Solo se usa antes de que la
+        # transacción haya escrito algo, así que reintentar nunca pierde ni duplica cambios.
+        inicio = time.perf_counter()
+        intento = 0
+        while True:
+            try:
+                resultado = operacion()
+                break
+            except sqlite3.OperationalError as e:
+                if not _es_bloqueo(e):
+                    raise
+                if intento >= REINTENTOS_ESCRITURA:
+                    with self._lock_contencion:
+                        self._contencion["fallos"] += 1
+                    print(f"❌ La base de datos sigue ocupada por otra terminal después de {intento} reintentos.")
+                    raise
+                espera = min(ESPERA_MAXIMA_REINTENTO, ESPERA_INICIAL_REINTENTO * 2 ** intento)
+                intento += 1
+                with self._lock_contencion:
+                    self._contencion["reintentos"] += 1
+                time.sleep(espera * random.uniform(0.5, 1.0)) # al azar, para que las terminales no reintenten juntas
+        demora = time.perf_counter() - inicio
+        if intento or demora >= UMBRAL_ESPERA:
+            with self._lock_contencion:
+                self._contencion["esperas"] += 1
+                self._contencion["segundos_espera"] += demora
+        return resultado
+
+    def configurar_consultas_lentas(self, umbral_ms):
+        """Activa el registro de consultas lentas (en ms) o lo desactiva con None."""
+        self._umbral_lentas = None if umbral_ms is None else umbral_ms / 1000
+
+    def _obtener_logger(self, archivo):
+        # Logger con rotación por tamaño para 'archivo'. El archivo se abre recién con el primer mensaje.
+        logger = self._loggers.get(archivo)
+        if logger is None:
+            os.makedirs(os.path.dirname(archivo), exist_ok=True)
+            logger = logging.getLogger(f"db.{id(self)}.{os.path.basename(archivo)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            manejador = RotatingFileHandler(
+                archivo, maxBytes=TAMANO_MAXIMO_LOG_LENTAS,
+                backupCount=RESPALDOS_LOG_LENTAS, encoding="utf-8")
+            manejador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(manejador)
+            self._loggers[archivo] = logger
+        return logger
+
+    # --- Medición por acción ---
+
+    @contextmanager
+    def medir_accion(self, nombre):
+        """
+        Cuenta sentencias, filas y tiempo de SQL de este hilo mientras dure el bloque.
+        Entrega el objeto EstadisticasAccion; si ya hay una acción en curso, se suma a esa.
+        """
+        accion = getattr(self._local, "accion", None)
+        if accion is not None:
+            yield accion
+            return
+        accion = EstadisticasAccion(nombre)
+        self._local.accion = accion
+        try:
+            yield accion
+        finally:
+            self._local.accion = None
+            self._cerrar_accion(accion)
+
+    def _cerrar_accion(self, accion):
+        self.ultima_accion = accion
+        with self._lock_acciones:
+            totales = self._acciones.setdefault(accion.nombre, {
+                "ejecuciones": 0, "sentencias": 0, "sentencias_max": 0, "filas": 0, "segundos": 0.0})
+            totales["ejecuciones"] += 1
+            totales["sentencias"] += accion.sentencias
+            totales["sentencias_max"] = max(totales["sentencias_max"], accion.sentencias)
+            totales["filas"] += accion.filas
+            totales["segundos"] += accion.segundos
+        repetidas = accion.repetidas(self.umbral_repeticiones)
+        if repetidas:
+            try:
+                lineas = [f"Acción '{accion.nombre}': {accion.sentencias} sentencias, {accion.filas} filas, "
+                          f"{accion.segundos * 1000:.1f} ms de SQL"]
+                lineas.extend(f"  x{n} {forma}" for forma, n in repetidas)
+                self._obtener_logger(ARCHIVO_CONSULTAS_REPETIDAS).warning("\n".join(lineas))
+            except Exception as e:
+                print(f"⚠️  No se pudo registrar las consultas repetidas: {e}")
+
+    def estadisticas_acciones(self):
+        """Totales por acción: ejecuciones, sentencias (total y máximo), filas y segundos de SQL."""
+        with self._lock_acciones:
+            return {nombre: dict(totales) for nombre, totales in self._acciones.items()}
+
+    def _medir(self):
+        # Devuelve el instante de inicio si hay que medir esta sentencia (registro de lentas
+        # o acción en curso), o None. Es lo único que se paga con la medición apagada.
+        if self._umbral_lentas is not None or getattr(self._local, "accion", None) is not None:
+            return time.perf_counter()
+        return None
+
+    def _despues_de_sentencia(self, conn, query, params, inicio, filas):
+        duracion = time.perf_counter() - inicio
+        accion = getattr(self._local, "accion", None)
+        if accion is not None:
+            accion.registrar(query, filas, duracion)
+        if self._umbral_lentas is not None and duracion >= self._umbral_lentas:
+            self._registrar_lenta(conn, query, params, duracion, filas)
+
+    def _registrar_lenta(self, conn, query, params, duracion, filas):
+        # Escribe una sentencia que superó el umbral en el log, junto con su plan de ejecución.
+        # Nunca interrumpe la operación original.
+        try:
+            plan = []
+            if query.lstrip().upper().startswith(_SENTENCIAS_CON_PLAN):
+                try:
+                    plan = [f"    {fila[3]}" for fila in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+                except sqlite3.Error as e:
+                    plan = [f"    (sin plan: {e})"]
+            lineas = [
+                f"{duracion * 1000:.1f} ms | filas: {filas} | {_funcion_llamadora()}",
+                f"  SQL: {_normalizar_sql(query)}",
+                f"  Parámetros: {params!r}",
+            ]
+            if plan:
+                lineas.append("  Plan:")
+                lineas.extend(plan)
+            self._obtener_logger(ARCHIVO_CONSULTAS_LENTAS).info("\n".join(lineas))
+        except Exception as e:
+            print(f"⚠️  No se pudo registrar la consulta lenta: {e}")
+
+    # --- Caché de resultados ---
+    # Solo se usa cuando la consulta lo pide con cache=True. Cada resultado depende de las tablas
+    # que lee (FROM/JOIN); cualquier escritura por 'ejecutar' o 'ejecutar_lote' sobre esas tablas
+    # (o sobre una tabla a la que apuntan por clave foránea, por los ON UPDATE CASCADE) lo invalida.
+    # Dentro de una transacción el caché no se usa, para no mezclar datos sin confirmar.
+    # Las escrituras de otras terminales (otro proceso sobre el mismo archivo) no pasan por acá:
+    # antes de usar el caché se mira PRAGMA data_version, que cambia cuando otra conexión confirma
+    # algo, y si cambió se descarta todo lo guardado.
+
+    def estadisticas_cache(self):
+        """Devuelve aciertos, fallos, invalidaciones y cantidad de entradas del caché."""
+        with self._lock_cache:
+            estadisticas = dict(self._estadisticas_cache)
+            estadisticas["entradas"] = len(self._cache)
+        return estadisticas
+
+    def limpiar_cache(self):
+        """Descarta todos los resultados guardados."""
+        with self._lock_cache:
+            self._cache.clear()
+            self._version_cache += 1
+            self._dependientes = None
+
+    def _tablas_afectadas(self, tabla):
+        # La tabla escrita más las que la referencian con clave foránea (pueden cambiar en cascada).
+        if self._dependientes is None:
+            dependientes = {}
+            tablas = self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+            for (nombre,) in tablas:
+                for fk in self._conn.execute(f"PRAGMA foreign_key_list('{nombre}')"):
+                    dependientes.setdefault(fk[2].upper(), set()).add(nombre.upper())
+            self._dependientes = dependientes
+        return {tabla} | self._dependientes.get(tabla, set())
+
+    def _invalidar_cache(self, query):
+        # Se llama después de cada escritura. Si no se reconoce la tabla (DDL, PRAGMA...), se vacía todo.
+        tabla = _tabla_escrita(query)
+        if tabla is None:
+            self.limpiar_cache()
+            return
+        if self._local.profundidad > 0:
+            self._local.tablas_modificadas.add(tabla)
+        self._invalidar_tablas({tabla})
+
+    def _invalidar_tablas(self, tablas):
+        if not self._cache:
+            with self._lock_cache:
+                self._version_cache += 1
+            return
+        afectadas = set()
+        for tabla in tablas:
+            afectadas |= self._tablas_afectadas(tabla)
+        with self._lock_cache:
+            self._version_cache += 1
+            claves = [clave for clave, (dependencias, _, _) in self._cache.items() if dependencias & afectadas]
+            for clave in claves:
+                del self._cache[clave]
+            self._estadisticas_cache["invalidaciones"] += len(claves)
+
+    def _descartar_si_cambio_afuera(self):
+        # data_version es propio de cada conexión (una por hilo): se compara con el último visto en este hilo.
+        # La primera vez no hay con qué comparar y también se descarta.
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == getattr(self._local, "data_version", None):
+            return
+        self._local.data_version = version
+        with self._lock_cache:
+            self._estadisticas_cache["invalidaciones"] += len(self._cache)
+            self._cache.clear()
+            self._version_cache += 1
+
+    def _leer_cache(self, clave):
+        self._descartar_si_cambio_afuera()
+        with self._lock_cache:
+            entrada = self._cache.get(clave)
+            if entrada is None:
+                self._estadisticas_cache["fallos"] += 1
+                return None
+            self._cache.move_to_end(clave)
+            self._estadisticas_cache["aciertos"] += 1
+            return entrada
+
+    def _guardar_cache(self, clave, query, version, esquema, datos):
+        with self._lock_cache:
+            # Si hubo una escritura mientras se leía, el resultado puede estar viejo: no se guarda
+            if version != self._version_cache:
+                return
+            self._cache[clave] = (_tablas_leidas(query), esquema, datos)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > TAMANO_CACHE:
+                self._cache.popitem(last=False)
+
+    def _clave_cache(self, metodo, query, params):
+        # Devuelve la clave del caché, o None si esta consulta no puede usarlo
+        if self._local.profundidad > 0 or getattr(self._local, "lectura", None) is not None:
+            return None
+        try:
+            clave = (metodo, query, _clave_params(params))
+            hash(clave)
+        except TypeError:
+            return None
+        return clave
+
     # ---------------------------------------------
     # 🛑 Cambios clave: Todos los métodos de consulta usan un nuevo cursor 
     # y manejan la conexión implícitamente o con el Context Manager.
     # ---------------------------------------------
 
     def ejecutar(self, query, params=()):
-        #Ejecuta una sentencia de modificación pero SIN hacer commit.
-        if self._conn is None: self.abrir_conexion()
-        # Quitamos el 'with self._conn:' para controlar la transacción manualmente
-        self._conn.execute(query, params)
+        #Ejecuta una sentencia de modificación.
+        # Dentro de 'transaccion' se confirma al salir del bloque; fuera de ella se confirma sola.
+        # Devuelve el id de la última fila insertada (lastrowid), útil después de un INSERT.
+        conn = self._conn
+        inicio = self._medir()
+        if self._local.profundidad > 0:
+            cursor = conn.execute(query, params)
+        else:
+            # Sentencia suelta (autocommit): si la base está bloqueada no se aplicó nada, se puede reintentar
+            with self._lock_escritura:
+                cursor = self._con_reintentos(lambda: conn.execute(query, params))
+        self._invalidar_cache(query)
+        if inicio is not None:
+            self._despues_de_sentencia(conn, query, params, inicio, cursor.rowcount)
+        return cursor.lastrowid
+
+    def ejecutar_lote(self, query, lista_params):
+        # Ejecuta la misma sentencia para cada juego de parámetros con un único executemany.
+        # Fuera de 'transaccion' el lote se envuelve en una transacción propia (todo o nada).
+        # Devuelve la cantidad de filas afectadas.
+        lista_params = list(lista_params)
+        if not lista_params:
+            return 0
+        conn = self._conn
+        inicio = self._medir()
+        if self._local.profundidad > 0:
+            filas = conn.executemany(query, lista_params).rowcount
+            self._invalidar_cache(query)
+        else:
+            with self.transaccion():
+                filas = conn.executemany(query, lista_params).rowcount
+                self._invalidar_cache(query)
+        if inicio is not None:
+            # El plan se calcula con el primer juego de parámetros
+            self._despues_de_sentencia(conn, query, lista_params[0], inicio, filas)
+        return filas
 
     # --- 👇 CAMBIO CLAVE 2: Añadir el manejador de contexto 'transaccion' ---
     @contextmanager
     def transaccion(self):
         # Un manejador de contexto para asegurar que un bloque de operaciones se ejecute de forma atómica (todo o nada).
-        if self._conn is None: self.abrir_conexion()
-        try:
-            # No hacemos nada especial al entrar, solo nos preparamos
-            yield
-            # Si el bloque 'with' termina sin errores, hacemos COMMIT
-            self._conn.commit()
-        except Exception as e:
-            # Si ocurre cualquier error dentro del bloque 'with', hacemos ROLLBACK
-            print(f"❌ Ocurrió un error, revirtiendo cambios (rollback): {e}")
-            self._conn.rollback()
-            # Opcional: relanzar el error si quieres que el programa principal lo sepa
-            raise
+        # Toma el candado de escritura durante todo el bloque. Solo la transacción exterior hace COMMIT.
+        # Un 'with db.transaccion()' anidado abre un SAVEPOINT: si falla, se deshacen solo sus cambios
+        # y el error sigue hacia arriba; quien lo atrape puede continuar con la transacción exterior.
+        conn = self._conn
+        if self._local.profundidad > 0:
+            punto = f"sp_{self._local.profundidad}"
+            conn.execute(f"SAVEPOINT {punto}")
+            self._local.profundidad += 1
+            try:
+                yield
+                conn.execute(f"RELEASE {punto}")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute(f"ROLLBACK TO {punto}")
+                    conn.execute(f"RELEASE {punto}")
+                raise
+            finally:
+                self._local.profundidad -= 1
+            return
+
+        with self._lock_escritura:
+            # IMMEDIATE toma el bloqueo de escritura al empezar: si otra terminal lo tiene, se espera
+            # y reintenta acá, antes de ejecutar el bloque, en vez de fallar a mitad de la operación.
+            self._con_reintentos(lambda: conn.execute("BEGIN IMMEDIATE"))
+            self._local.profundidad = 1
+            self._local.tablas_modificadas = set()
+            try:
+                yield
+                # Si el bloque 'with' termina sin errores, hacemos COMMIT
+                conn.execute("COMMIT")
+            except Exception as e:
+                # Si ocurre cualquier error dentro del bloque 'with', hacemos ROLLBACK
+                print(f"❌ Ocurrió un error, revirtiendo cambios (rollback): {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Opcional: relanzar el error si quieres que el programa principal lo sepa
+                raise
+            except BaseException:
+                # Ctrl+C o una tarea cancelada (CancelledError en db_async): no es un error del bloque,
+                # pero la transacción no puede quedar abierta reteniendo el candado de escritura.
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.profundidad = 0
+                # Otro hilo pudo guardar en el caché lo que leyó antes del COMMIT/ROLLBACK
+                if self._local.tablas_modificadas:
+                    self._invalidar_tablas(self._local.tablas_modificadas)
+                    self._local.tablas_modificadas = set()
 
     # Nota: Los métodos 'confirmar', 'revertir' e 'iniciar' ya no son necesarios
     # si se usa el context manager de la conexión.
     
-    def obtener_uno(self, query, params=()):
-        # Ejecuta una consulta y devuelve un único resultado como diccionario (dict).
-        if self._conn is None: self.abrir_conexion()
-        cursor = self._conn.cursor() # Crea un nuevo cursor por consulta
+    def obtener_uno(self, query, params=(), cache=False):
+        # Ejecuta una consulta y devuelve un único resultado como Fila (acceso tipo dict).
+        # cache=True: reutiliza el resultado guardado mientras no se escriban las tablas que lee.
+        conn = self._conn_consultas()
+        clave = self._clave_cache("uno", query, params) if cache else None
+        if clave is not None:
+            entrada = self._leer_cache(clave)
+            if entrada is not None:
+                _, esquema, fila = entrada
+                return Fila(esquema, fila) if fila else None
+            version = self._version_cache
+        inicio = self._medir()
+        cursor = conn.cursor() # Crea un nuevo cursor por consulta
         cursor.execute(query, params)
         fila = cursor.fetchone()
+        if inicio is not None:
+            self._despues_de_sentencia(conn, query, params, inicio, 1 if fila else 0)
+        esquema = _esquema(cursor) if fila else None
+        if clave is not None:
+            self._guardar_cache(clave, query, version, esquema, fila)
         if fila:
-            return dict(fila)
+            return Fila(esquema, fila)
         else:
             return None
 
-    def obtener_todos(self, query, params=()):
-        # Ejecuta una consulta y devuelve todos los resultados como lista de diccionarios
-        if self._conn is None: self.abrir_conexion()
-        cursor = self._conn.cursor() # Crea un nuevo cursor por consulta
+    def obtener_todos(self, query, params=(), cache=False):
+        # Ejecuta una consulta y devuelve todos los resultados como lista de Filas (acceso tipo dict)
+        # cache=True: reutiliza el resultado guardado mientras no se escriban las tablas que lee.
+        conn = self._conn_consultas()
+        clave = self._clave_cache("todos", query, params) if cache else None
+        if clave is not None:
+            entrada = self._leer_cache(clave)
+            if entrada is not None:
+                _, esquema, filas = entrada
+                return [Fila(esquema, fila) for fila in filas]
+            version = self._version_cache
+        inicio = self._medir()
+        cursor = conn.cursor() # Crea un nuevo cursor por consulta
         cursor.execute(query, params)
         filas = cursor.fetchall()
-        return [dict(fila) for fila in filas]
-    
+        if inicio is not None:
+            self._despues_de_sentencia(conn, query, params, inicio, len(filas))
+        esquema = _esquema(cursor) if filas else None
+        if clave is not None:
+            # Se guardan las tuplas; cada acierto arma Filas nuevas porque quien las recibe puede modificarlas
+            self._guardar_cache(clave, query, version, esquema, tuple(filas))
+        if not filas:
+            return []
+        return [Fila(esquema, fila) for fila in filas]
+
+    def obtener_iter(self, query, params=(), tamano_lote=500):
+        # Ejecuta una consulta y entrega los resultados de a uno (generador), leyendo del cursor
+        # en bloques de 'tamano_lote' filas con fetchmany. Nunca arma la lista completa en memoria.
+        conn = self._conn_consultas()
+        cursor = conn.cursor() # Crea un nuevo cursor por consulta
+        try:
+            inicio = self._medir()
+            cursor.execute(query, params)
+            if inicio is not None:
+                # Se mide solo la ejecución; el tiempo entre filas es de quien las consume
+                self._despues_de_sentencia(conn, query, params, inicio, 0)
+            accion = getattr(self._local, "accion", None)
+            esquema = None
+            while True:
+                filas = cursor.fetchmany(tamano_lote)
+                if not filas:
+                    break
+                if accion is not None:
+                    accion.filas += len(filas)
+                if esquema is None:
+                    esquema = _esquema(cursor)
+                for fila in filas:
+                    yield Fila(esquema, fila)
+        finally:
+            cursor.close()
+
+    def respaldar(self, destino, paginas_por_paso=256, pausa=0.005, progreso=None, max_reinicios=3):
+        """
+        Copia la base en caliente al archivo 'destino' con la API de backup de SQLite.
+        Copia 'paginas_por_paso' páginas por vez y duerme 'pausa' segundos entre pasos, así las
+        demás conexiones pueden seguir escribiendo. 'progreso(restantes, total)' es opcional.
+        """
+        # Si otra conexión (otro hilo u otra terminal) escribe durante la copia, SQLite la reinicia
+        # desde cero. Con escrituras constantes podría no terminar nunca: después de 'max_reinicios'
+        # se copia todo en un solo paso, que con WAL lee una foto fija sin bloquear a los escritores.
+        estado = {"restantes": None, "reinicios": 0}
+
+        def al_avanzar(_, restantes, total):
+            if estado["restantes"] is not None and restantes > estado["restantes"]:
+                estado["reinicios"] += 1
+                if estado["reinicios"] > max_reinicios:
+                    raise _CopiaReiniciada()
+            estado["restantes"] = restantes
+            if progreso:
+                progreso(restantes, total)
+            # El 'sleep' de backup() solo se aplica cuando un paso encuentra la base ocupada (BUSY/LOCKED);
+            # la pausa entre pasos normales, que es la que deja pasar a los escritores, se hace acá.
+            if restantes > 0 and pausa:
+                time.sleep(pausa)
+
+        copia = sqlite3.connect(destino)
+        try:
+            try:
+                self._conn.backup(copia, pages=paginas_por_paso, sleep=pausa, progress=al_avanzar)
+            except _CopiaReiniciada:
+                self._conn.backup(copia, pages=-1)
+                if progreso:
+                    progreso(0, 1)
+        finally:
+            copia.close()
+        return estado["reinicios"]
+
+    def cerrar_conexion_hilo(self):
+        # Cierra solo la conexión del hilo actual (útil al terminar un hilo de trabajo en segundo plano).
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._lock_conexiones:
+                self._conexiones.pop(threading.get_ident(), None)
+            conn.close()
+            self._local.conn = None
+        lectura = getattr(self._local, "conn_lectura", None)
+        if lectura is not None:
+            with self._lock_conexiones:
+                self._conexiones_lectura.pop(threading.get_ident(), None)
+            lectura.close()
+            self._local.conn_lectura = None
+
     def cerrar(self):
-        """Cierra la conexión si está abierta."""
-        if self._conn:
-            self._conn.close()
-            self._conn = None
+        """Cierra todas las conexiones abiertas del pool."""
+        with self._lock_conexiones:
+            conexiones = list(self._conexiones_lectura.values()) + list(self._conexiones.values())
+            self._conexiones.clear()
+            self._conexiones_lectura.clear()
+        self.limpiar_cache()
+        if conexiones:
+            for conn in conexiones:
+                conn.close()
+            self._local.conn = None
+            self._local.conn_lectura = None
             print("Conexión cerrada.")
 
 db = DBManager() # Ahora la inicialización es más segura.
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from db import DBManager
+
+# Fachada asyncio sobre DBManager, para frentes no bloqueantes (tablero local, futura interfaz web).
+# Las escrituras van a un único hilo escritor y las lecturas a un grupo de hilos lectores; cada hilo
+# tiene su propia conexión (DBManager ya trabaja con una conexión por hilo) y WAL deja leer en
+# paralelo. Cada grupo admite un máximo de operaciones pendientes: cuando se llena, quien llama
+# espera (backpressure) en lugar de acumular trabajo sin límite.
+#
+# Uso:
+#     base = AsyncDBManager("BaseDeDatos.db", lectores=4)
+#     productos = await base.obtener_todos("SELECT * FROM PRODUCTOS")
+#     async with base.transaccion() as tx:
+#         await tx.ejecutar("UPDATE PRODUCTOS SET STOCK = STOCK - 1 WHERE CODIGO = ?", (1,))
+#     await base.cerrar()
+
+LECTORES_POR_DEFECTO = 4
+PENDIENTES_POR_DEFECTO = 64  # operaciones en cola por grupo antes de frenar a quien llama
+
+class AsyncDBManager:
+    def __init__(self, db_path="BaseDeDatos.db", lectores=LECTORES_POR_DEFECTO,
+                 max_pendientes=PENDIENTES_POR_DEFECTO, pragmas=None):
+        self._db = DBManager(db_path, pragmas=pragmas)
+        self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-escritor")
+        self._lectores = ThreadPoolExecutor(max_workers=lectores, thread_name_prefix="db-lector")
+        self._cupo_escritura = asyncio.Semaphore(max_pendientes)
+        self._cupo_lectura = asyncio.Semaphore(max_pendientes)
+        # Mientras hay una transacción abierta en el hilo escritor, nadie más puede usarlo:
+        # una escritura suelta quedaría dentro de la transacción ajena.
+        self._lock_transaccion = asyncio.Lock()
+        self._cierres = set()  # cierres de transacciones canceladas que todavía corren en el hilo escritor
+
+    async def _en_hilo(self, ejecutor, cupo, funcion, *args, **kwargs):
+        async with cupo:
+            bucle = asyncio.get_running_loop()
+            return await bucle.run_in_executor(ejecutor, partial(funcion, *args, **kwargs))
+
+    async def _escribir(self, funcion, *args, **kwargs):
+        return await self._en_hilo(self._escritor, self._cupo_escritura, funcion, *args, **kwargs)
+
+    async def _leer(self, funcion, *args, **kwargs):
+        return await self._en_hilo(self._lectores, self._cupo_lectura, funcion, *args, **kwargs)
+
+    async def ejecutar(self, query, params=()):
+        async with self._lock_transaccion:
+            return await self._escribir(self._db.ejecutar, query, params)
+
+    async def ejecutar_lote(self, query, lista_params):
+        lista_params = list(lista_params)
+        async with self._lock_transaccion:
+            return await self._escribir(self._db.ejecutar_lote, query, lista_params)
+
+    async def obtener_uno(self, query, params=(), cache=False):
+        return await self._leer(self._db.obtener_uno, query, params, cache=cache)
+
+    async def obtener_todos(self, query, params=(), cache=False):
+        return await self._leer(self._db.obtener_todos, query, params, cache=cache)
+
+    def transaccion(self):
+        """Transacción atómica en el hilo escritor: 'async with base.transaccion() as tx'."""
+        return _TransaccionAsync(self)
+
+    def estadisticas(self):
+        """Contadores de caché y de contención del DBManager subyacente."""
+        return {"cache": self._db.estadisticas_cache(), "contencion": self._db.estadisticas_contencion()}
+
+    async def cerrar(self):
+        """Espera las operaciones en curso, detiene los hilos y cierra todas las conexiones."""
+        if self._cierres:
+            await asyncio.wait(self._cierres)
+        bucle = asyncio.get_running_loop()
+        await bucle.run_in_executor(None, self._escritor.shutdown)
+        await bucle.run_in_executor(None, self._lectores.shutdown)
+        self._db.cerrar()
+
+class _TransaccionAsync:
+    # Abre 'DBManager.transaccion' en el hilo escritor y manda ahí todas las operaciones del bloque
+    # (incluidas las lecturas, para que vean lo que la propia transacción ya escribió).
+    # Como el contexto se abre y se cierra en el mismo hilo, el candado y los SAVEPOINT funcionan igual.
+    def __init__(self, base):
+        self._base = base
+        self._contexto = None
+
+    # BEGIN y COMMIT/ROLLBACK corren en el hilo escritor aunque cancelen a quien espera (shield): una tarea
+    # cancelada a mitad de camino no puede dejar la transacción abierta con el candado de escritura tomado.
+    # El candado asyncio se suelta recién cuando la transacción quedó cerrada.
+
+    async def __aenter__(self):
+        await self._base._lock_transaccion.acquire()
+        self._contexto = self._base._db.transaccion()
+        entrada = asyncio.ensure_future(self._base._escribir(self._contexto.__enter__))
+        try:
+            await asyncio.shield(entrada)
+        except BaseException:
+            self._en_segundo_plano(self._abortar(entrada))
+            raise
+        return self
+
+    async def __aexit__(self, tipo, error, traza):
+        salida = asyncio.ensure_future(self._base._escribir(self._contexto.__exit__, tipo, error, traza))
+        try:
+            return await asyncio.shield(salida)
+        finally:
+            if salida.done():
+                self._soltar()
+            else:
+                # Cancelaron a quien espera: el COMMIT/ROLLBACK sigue y el candado se suelta al terminar
+                self._en_segundo_plano(self._esperar_salida(salida))
+
+    async def _abortar(self, entrada):
+        # Se canceló (o falló) la apertura: si el BEGIN llegó a ejecutarse, se deshace antes de soltar el candado
+        try:
+            await asyncio.wait([entrada])
+            if not entrada.cancelled() and entrada.exception() is None:
+                cancelacion = asyncio.CancelledError()
+                await self._base._escribir(self._contexto.__exit__, type(cancelacion), cancelacion, None)
+        finally:
+            self._soltar()
+
+    async def _esperar_salida(self, salida):
+        try:
+            await asyncio.wait([salida])
+            if not salida.cancelled():
+                salida.exception()  # el error ya no tiene a quién llegar; se da por visto
+        finally:
+            self._soltar()
+
+    def _en_segundo_plano(self, corrutina):
+        tarea = asyncio.ensure_future(corrutina)
+        self._base._cierres.add(tarea)
+        tarea.add_done_callback(self._base._cierres.discard)
+
+    def _soltar(self):
+        self._contexto = None
+        self._base._lock_transaccion.release()
+
+    async def ejecutar(self, query, params=()):
+        return await self._base._escribir(self._base._db.ejecutar, query, params)
+
+    async def ejecutar_lote(self, query, lista_params):
+        return await self._base._escribir(self._base._db.ejecutar_lote, query, list(lista_params))
+
+    async def obtener_uno(self, query, params=()):
+        return await self._base._escribir(self._base._db.obtener_uno, query, params)
+
+    async def obtener_todos(self, query, params=()):
+        return await self._base._escribir(self._base._db.obtener_todos, query, params)
@@ -1,10 +1,11 @@
 import re
 import sqlite3
 import usuarios
+from auditoria import auditar
 from datetime import datetime, date
 from db import db
 from unidecode import unidecode
-from utiles import HABITACIONES, registrar_log, imprimir_huesped, imprimir_huespedes, pedir_fecha_valida, pedir_entero, pedir_telefono, pedir_confirmacion, pedir_mail, habitacion_ocupada, marca_de_tiempo, pedir_habitación, opcion_menu, pedir_nombre, formatear_fecha, parse_fecha_a_datetime
+from utiles import HABITACIONES, registrar_log, imprimir_huesped, imprimir_huespedes, pedir_fecha_valida, pedir_entero, pedir_telefono, pedir_confirmacion, pedir_mail, habitacion_ocupada, marca_de_tiempo, formatear_evento, pedir_habitación, opcion_menu, pedir_nombre, formatear_fecha, parse_fecha_a_datetime, filas_o_none
 
 LISTA_BLANCA_HUESPED = [
     "APELLIDO",
@@ -16,12 +17,34 @@ LISTA_BLANCA_HUESPED = [
     "CHECKOUT",
     "DOCUMENTO",
     "CONTINGENTE",
-    "REGISTRO",
     "ESTADO",
     "HABITACION",
     "DESCUENTO"
 ]
 
+# Tipos de evento del historial de un huésped (tabla HUESPED_EVENTOS)
+TIPOS_EVENTO = ["CREADO", "CHECKIN", "CONSUMO", "PAGO", "DEUDA", "CHECKOUT", "ESTADO", "EDICION", "INTERCAMBIO", "DESCUENTO", "OTRO"]
+
+def registrar_evento(numero_huesped, tipo, detalle):
+    # Agrega una entrada al historial del huésped: un INSERT, sin leer ni reescribir lo anterior.
+    # La fecha y el usuario de la sesión se completan solos. Llamar dentro de la transacción del cambio.
+    registrar_eventos(numero_huesped, [(tipo, detalle)])
+
+def registrar_eventos(numero_huesped, eventos):
+    # Varias entradas (tipo, detalle) del mismo huésped en un solo lote.
+    # También deja la última en HUESPEDES.ULTIMO_EVENTO, que es lo que muestra imprimir_huesped.
+    if not eventos:
+        return
+    fecha = datetime.now().isoformat(sep=" ", timespec="seconds")
+    usuario = usuarios.sesion.usuario
+    with db.transaccion():
+        db.ejecutar_lote(
+            "INSERT INTO HUESPED_EVENTOS (HUESPED, FECHA, TIPO, USUARIO, DETALLE) VALUES (?, ?, ?, ?, ?)",
+            [(numero_huesped, fecha, tipo, usuario, detalle) for tipo, detalle in eventos]
+        )
+        ultimo = {"FECHA": fecha, "USUARIO": usuario, "DETALLE": eventos[-1][1]}
+        db.ejecutar("UPDATE HUESPEDES SET ULTIMO_EVENTO = ? WHERE NUMERO = ?", (formatear_evento(ultimo), numero_huesped))
+
 @usuarios.requiere_acceso(1)
 def nuevo_huesped():
     estado = None
@@ -79,9 +102,7 @@ def nuevo_huesped():
             print(f"\n⚠️  La habitación {habitacion} no está definida.")
             continue
         break
-    registro = f"CREADO {estado} - {marca_de_tiempo()}"
-
-    data = {"apellido": apellido, "nombre": nombre, "telefono": telefono, "email": email, "aplicativo": aplicativo, "estado": estado, "checkin": checkin, "checkout": checkout, "documento": documento, "habitacion": habitacion, "contingente": contingente, "registro": registro}
+    data = {"apellido": apellido, "nombre": nombre, "telefono": telefono, "email": email, "aplicativo": aplicativo, "estado": estado, "checkin": checkin, "checkout": checkout, "documento": documento, "habitacion": habitacion, "contingente": contingente}
 
     try:
         with db.transaccion():
@@ -89,14 +110,15 @@ def nuevo_huesped():
             INSERT INTO HUESPEDES (
                 APELLIDO, NOMBRE, TELEFONO, EMAIL, APP, ESTADO,
                 CHECKIN, CHECKOUT, DOCUMENTO, HABITACION,
-                CONTINGENTE, REGISTRO
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                CONTINGENTE
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             valores = (data["apellido"],data["nombre"], data["telefono"], data["email"], data["aplicativo"],
                 data["estado"], data["checkin"], data["checkout"], data["documento"],
-                data["habitacion"], data["contingente"], data["registro"])
+                data["habitacion"], data["contingente"])
             
-            db.ejecutar(sql, valores)
+            numero = db.ejecutar(sql, valores)
+            registrar_evento(numero, "CREADO", f"CREADO {estado}")
     except Exception as e:
         print(f"\n❌ Error al registrar el huésped: {e}")
     print("\n✔ Huésped registrado correctamente.")
@@ -172,7 +194,7 @@ def realizar_checkin():
         # 2. BUSCAR HUÉSPED PROGRAMADO (Lógica Original)
         # Ordenamos por CHECKIN ascendente para tomar el más antiguo/próximo.
         huesped = db.obtener_uno(
-            "SELECT * FROM HUESPEDES WHERE HABITACION = ? AND ESTADO = 'PROGRAMADO' AND CHECKIN <= ? ORDER BY DATE(CHECKIN) ASC",
+            "SELECT * FROM HUESPEDES WHERE HABITACION = ? AND ESTADO = 'PROGRAMADO' AND CHECKIN <= ? ORDER BY CHECKIN ASC",
             (habitacion, hoy,)
         )
 
@@ -254,24 +276,18 @@ def _procesar_checkin_y_actualizar(huesped, checkin_definitivo, checkin_programa
     # --- Recolección de datos y actualización (Lógica correcta) ---
     datos_recopilados = _pedir_datos(huesped)
     
-    registro_anterior = str(huesped["REGISTRO"] or "")
-    separador = "\n---\n"
-    
     # Creación del registro (Lógica original)
     if checkin_definitivo != checkin_programado:
         registro_checkin = (
             f"CHECK-IN REALIZADO (Fecha programada: {formatear_fecha(checkin_programado)} - Fecha definitiva: {formatear_fecha(checkin_definitivo)}) "
-            f"- Estado cambiado a ABIERTO - {marca_de_tiempo()}"
+            f"- Estado cambiado a ABIERTO"
         )
     else:
-        registro_checkin = f"CHECK-IN REALIZADO - Estado cambiado a ABIERTO - {marca_de_tiempo()}" 
-    
-    nuevo_registro = registro_anterior + separador + registro_checkin if registro_anterior.strip() else registro_checkin
+        registro_checkin = "CHECK-IN REALIZADO - Estado cambiado a ABIERTO"
 
     updates = {
         "ESTADO": "ABIERTO",
-        "CHECKIN": checkin_definitivo, 
-        "REGISTRO": nuevo_registro
+        "CHECKIN": checkin_definitivo
     }
     updates.update(datos_recopilados)
 
@@ -280,6 +296,8 @@ def _procesar_checkin_y_actualizar(huesped, checkin_definitivo, checkin_programa
         with db.transaccion():
             # Asegúrate que '_editar_huesped_db' está disponible
             _editar_huesped_db(numero, updates)
+            registrar_evento(numero, "CHECKIN", registro_checkin)
+            auditar("CHECKIN", "HUESPED", numero, habitacion=huesped["HABITACION"], fecha_checkin=checkin_definitivo)
         print(f"\n✔ Checkin realizado para {huesped['APELLIDO'].title()} {huesped['NOMBRE'].title()} en la habitación {huesped['HABITACION']}.")
         
         # Log de auditoría
@@ -292,7 +310,8 @@ def _procesar_checkin_y_actualizar(huesped, checkin_definitivo, checkin_programa
         if checkin_definitivo != checkin_programado:
             log = f"Fecha programada: {checkin_programado}\n" + log
             
-        registrar_log("checkins.log", log) 
+        registrar_log("checkins.log", log, accion="CHECKIN", usuario=usuarios.sesion.usuario,
+                      huesped=numero, habitacion=huesped["HABITACION"], fecha_checkin=checkin_definitivo)
         
         return True # Indica éxito
         
@@ -359,10 +378,8 @@ def _editar_huesped_db(numero, updates_dict):
     # Añadir el número del huésped al final de los valores para la cláusula WHERE
     valores.append(numero)
 
-    try:
-        db.ejecutar(sql, tuple(valores))
-    except Exception as e:
-        print(f"\n❌ Error al actualizar el huésped en la DB: {e}")
+    # Los errores se propagan: quien llama decide si revierte toda la transacción o solo este paso
+    db.ejecutar(sql, tuple(valores))
 
 @usuarios.requiere_acceso(1)
 def realizar_checkout():
@@ -399,28 +416,24 @@ def realizar_checkout():
             return
         numero = huesped["NUMERO"]
         hoy = date.today().isoformat()
-        separador = "\n---\n"
-        registro_anterior = str(huesped["REGISTRO"] or "")
+        # Las preguntas de pago van antes de abrir la transacción: mientras se espera al usuario
+        # no se retiene el bloqueo de escritura y las demás terminales pueden seguir trabajando.
+        checkout_ok, cobro = _verificar_consumos_impagos(numero)
+        if not checkout_ok:
+            # El checkout fue cancelado
+            return
+        total_pendiente = cobro["total_pendiente"]
         try:
             with db.transaccion():
-                checkout_ok, registro_actualizado, total_pendiente = _verificar_consumos_impagos(numero, registro_anterior)
-
-                if not checkout_ok:
-                    # El checkout fue cancelado
-                    return
+                # Registra el pago o la deuda en el historial del huésped
+                _registrar_pago_o_deuda(numero, cobro)
 
                 #CERRAR HABITACIÓN
-                registro_nuevo = f"Estado modificado a CERRADO - {marca_de_tiempo()}"
-
-                # Usamos el registro_actualizado que puede o no tener la nota de pago/advertencia
-                if registro_actualizado.strip():
-                    registro_final = registro_actualizado + separador + registro_nuevo
-                else:
-                    registro_final = registro_nuevo
-                
-                updates = {"ESTADO": "CERRADO", "CHECKOUT": hoy, "HABITACION": 0, "REGISTRO": registro_final}
+                updates = {"ESTADO": "CERRADO", "CHECKOUT": hoy, "HABITACION": 0}
 
                 _editar_huesped_db(numero, updates)
+                registrar_evento(numero, "CHECKOUT", "Estado modificado a CERRADO")
+                auditar("CHECKOUT", "HUESPED", numero, habitacion=habitacion, monto=round(total_pendiente, 2))
             
             # 5. LOG DE AUDITORÍA
             log = (
@@ -429,7 +442,8 @@ def realizar_checkout():
                 f"Total de consumos no pagados al momento del cierre: R {total_pendiente:.2f}\n" 
                 f"Acción realizada por: {usuarios.sesion.usuario}"
             )
-            registrar_log("huespedes_cerrados.log", log)
+            registrar_log("huespedes_cerrados.log", log, accion="CHECKOUT", usuario=usuarios.sesion.usuario,
+                          huesped=numero, habitacion=habitacion, monto=round(total_pendiente, 2))
             print(f"\n✔ Checkout de Habitación {habitacion} realizado correctamente.")
             
         except Exception as e:
@@ -437,52 +451,55 @@ def realizar_checkout():
                 print(f"\n❌ Error al realizar el checkout. La operación fue revertida. {e}")
         return
 
-def _verificar_consumos_impagos(numero_huesped, registro_actual):
+def _verificar_consumos_impagos(numero_huesped):
     """
-    Verifica consumos impagos para un huésped, maneja el pago y la confirmación
-    de cierre, aplicando el descuento si existe. 
-    Retorna (True, registro_actualizado, total_final) si el checkout puede continuar, 
-    (False, None, total_final) si se cancela el checkout.
+    Verifica consumos impagos para un huésped, muestra los totales (aplicando el descuento si existe)
+    y pregunta si se cobran o si se cierra con deuda. Solo lee: no escribe nada, así se puede llamar
+    antes de abrir la transacción del cierre, que después aplica el cobro con _registrar_pago_o_deuda.
+    Retorna (True, cobro) si el checkout puede continuar, (False, cobro) si se cancela.
     """
-    
+    cobro = {"consumos": (), "total_pendiente": 0.00, "pagado": False}
+
     # 0. OBTENER INFORMACIÓN DEL HUÉSPED
     huesped = db.obtener_uno("SELECT * FROM HUESPEDES WHERE NUMERO = ?", (numero_huesped,))
     if not huesped:
         print(f"❌ Error: No se encontró el huésped con número {numero_huesped}.")
-        return False, None, 0.00
+        return False, cobro
     
     # 1. Verificar consumos impagos (Calculando el total de consumos BRUTOS)
-    query = """
-        SELECT C.CANTIDAD, P.PRECIO
-        FROM CONSUMOS C
-        JOIN PRODUCTOS P ON C.PRODUCTO = P.CODIGO
-        WHERE C.HUESPED = ? AND C.PAGADO = 0
-    """
-    consumos_no_pagados = db.obtener_todos(query, (numero_huesped,))
+    consumos_no_pagados = _consumos_impagos(numero_huesped)
     
     # Calcular el total de consumos BRUTOS (base para los cálculos)
     grand_subtotal = sum(c["CANTIDAD"] * c["PRECIO"] for c in consumos_no_pagados)
     
     if not consumos_no_pagados:
         print("\n✔ No hay consumos pendientes de pago para esta habitación.")
-        # Se devuelve True, el registro actual y un total final de 0.00
-        return True, registro_actual, 0.00
+        # Se devuelve True y un total final de 0.00
+        return True, cobro
 
     # 2. CALCULAR, MOSTRAR TOTALES Y DESCUENTOS (Delegado)
     total_pendiente, propina, grand_subtotal, dcto_log = _calcular_y_mostrar_totales(huesped, grand_subtotal)
+    cobro.update(consumos=tuple(c["ID"] for c in consumos_no_pagados), total_pendiente=total_pendiente,
+                 grand_subtotal=grand_subtotal, propina=propina, dcto_log=dcto_log)
     
-    # 3. MANEJAR PAGO, CONFIRMACIÓN Y REGISTRO (Delegado)
-    checkout_ok, nuevo_registro_actual = _manejar_pago_y_registro(
-        numero_huesped, 
-        registro_actual, 
-        total_pendiente, 
-        grand_subtotal, 
-        propina, 
-        dcto_log
-    )
+    # 3. PREGUNTAR SI SE COBRA O SE CIERRA CON DEUDA (Delegado)
+    pagado = _preguntar_pago()
+    if pagado is None:
+        return False, cobro
+    cobro["pagado"] = pagado
     
     # 4. DEVOLVER EL RESULTADO FINAL
-    return checkout_ok, nuevo_registro_actual, total_pendiente
+    return True, cobro
+
+def _consumos_impagos(numero_huesped):
+    query = """
+        SELECT C.ID, C.CANTIDAD, P.PRECIO
+        FROM CONSUMOS C
+        JOIN PRODUCTOS P ON C.PRODUCTO = P.CODIGO
+        WHERE C.HUESPED = ? AND C.PAGADO = 0
+        ORDER BY C.ID
+    """
+    return db.obtener_todos(query, (numero_huesped,))
 
 def _calcular_y_mostrar_totales(huesped, grand_subtotal):
     """
@@ -570,53 +587,51 @@ def _calcular_y_mostrar_totales(huesped, grand_subtotal):
     
     return total_pendiente, propina, grand_subtotal, dcto_log
 
-def _manejar_pago_y_registro(numero_huesped, registro_actual, total_pendiente, grand_subtotal, propina, dcto_log):
+def _preguntar_pago():
     """
-    Maneja la interacción con el usuario para el pago y actualiza la BD.
-    Retorna (True/False, registro_final).
+    Pregunta si se cobran los consumos o si se cierra con deuda. No toca la base.
+    Retorna True (se cobran), False (se cierra con deuda) o None si se cancela el cierre.
     """
-    separador = "\n---\n"
-    
     respuesta_pago = pedir_confirmacion("\n⚠️ ¿Querés marcar estos consumos como pagados? (si/no): ")
-    
     if respuesta_pago == "si":
-        try:
-            with db.transaccion():
-                # Marcar consumos como pagados
-                db.ejecutar("UPDATE CONSUMOS SET PAGADO = 1 WHERE HUESPED = ? AND PAGADO = 0", (numero_huesped,))
-                
-                # Actualizar registro del huésped (registro de pago)
-                registro_pago = (
-                    f"Se marcaron como pagados consumos e incluyó propina. {dcto_log}"
-                    f"Total cobrado: R{total_pendiente:.2f} "
-                    f"(Consumos Bruto: R{grand_subtotal:.2f}; Propina: R{propina:.2f}). "
-                    f"- {marca_de_tiempo()}"
-                )
-                nuevo_registro = registro_actual + separador + registro_pago
-                _editar_huesped_db(numero_huesped, {"REGISTRO": nuevo_registro}) 
-            
-            print("\n✔ Todos los consumos pendientes fueron marcados como pagados.")
-            return True, nuevo_registro
+        return True
+
+    # Preguntar si desea cerrar aun con deuda
+    confirmar_cierre = pedir_confirmacion("\n⚠️ ¿Querés cerrar la habitación con consumos impagos? (si/no): ")
+    if confirmar_cierre != "si":
+        print("\n❌ Cierre cancelado.")
+        return None
+    return False
+
+def _registrar_pago_o_deuda(numero_huesped, cobro):
+    """
+    Aplica lo respondido en _verificar_consumos_impagos: marca los consumos como pagados o deja
+    registrada la deuda. Llamar dentro de la transacción del cierre (se revierte junto con él).
+    Si otra terminal cambió los consumos impagos desde que se mostraron los totales, lanza ValueError.
+    """
+    if tuple(c["ID"] for c in _consumos_impagos(numero_huesped)) != cobro["consumos"]:
+        raise ValueError("Los consumos del huésped cambiaron mientras se confirmaba el cierre. Volvé a intentarlo.")
+    if not cobro["consumos"]:
+        return
+
+    total_pendiente = cobro["total_pendiente"]
+    if cobro["pagado"]:
+        # Marcar consumos como pagados
+        db.ejecutar("UPDATE CONSUMOS SET PAGADO = 1 WHERE HUESPED = ? AND PAGADO = 0", (numero_huesped,))
         
-        except Exception as e:
-            print(f"\n❌ Error al marcar consumos como pagados: {e}")
-            print("\n❌ Cierre cancelado debido a un error de pago.")
-            return False, None 
-            
+        # Actualizar registro del huésped (registro de pago)
+        registro_pago = (
+            f"Se marcaron como pagados consumos e incluyó propina. {cobro['dcto_log']}"
+            f"Total cobrado: R{total_pendiente:.2f} "
+            f"(Consumos Bruto: R{cobro['grand_subtotal']:.2f}; Propina: R{cobro['propina']:.2f})."
+        )
+        registrar_evento(numero_huesped, "PAGO", registro_pago)
+        print("\n✔ Todos los consumos pendientes fueron marcados como pagados.")
     else:
-        # Preguntar si desea cerrar aun con deuda
-        confirmar_cierre = pedir_confirmacion("\n⚠️ ¿Querés cerrar la habitación con consumos impagos? (si/no): ")
-        if confirmar_cierre != "si":
-            print("\n❌ Cierre cancelado.")
-            return False, None
-            
-        # Registra la acción de cierre con deuda
-        registro_impago = f"ADVERTENCIA: Habitación cerrada con deuda pendiente (Total Final: R{total_pendiente:.2f}). {dcto_log} - {marca_de_tiempo()}"
-        nuevo_registro_con_adv = registro_actual + separador + registro_impago
-        
+        # Registra la acción de cierre con deuda (se revierte junto con el cierre si este falla)
+        registro_impago = f"ADVERTENCIA: Habitación cerrada con deuda pendiente (Total Final: R{total_pendiente:.2f}). {cobro['dcto_log']}".rstrip()
+        registrar_evento(numero_huesped, "DEUDA", registro_impago)
         print(f"\n✅ Habitación marcada para cierre. Se ha registrado la deuda pendiente (R {total_pendiente:.2f}).")
-        
-        return True, nuevo_registro_con_adv
 
 @usuarios.requiere_acceso(1)
 def buscar_huesped():
@@ -682,7 +697,8 @@ def _ejecutar_busqueda_y_mostrar_resultado(campo, get_valor):
             return None # Señal para salir del menú
 
     elif campo == "*":
-        huespedes = db.obtener_todos("""
+        # Se recorre el cursor en bloques: el listado completo nunca se carga en memoria
+        huespedes = filas_o_none(db.obtener_iter("""
             -- Consulta SQL simplificada, asumo que 'db.obtener_todos' existe
             SELECT * FROM HUESPEDES
             ORDER BY
@@ -692,7 +708,7 @@ def _ejecutar_busqueda_y_mostrar_resultado(campo, get_valor):
                 CASE ESTADO WHEN 'CERRADO' THEN DATE(CHECKOUT) ELSE NULL END DESC,
                 LOWER(APELLIDO),
                 LOWER(NOMBRE)
-        """)
+        """))
 
     elif campo in ("APELLIDO", "NOMBRE"):
         # Delegamos la lógica de búsqueda por texto
@@ -745,12 +761,14 @@ def _buscar_por_habitacion_y_fecha(num_habitacion):
     # La consulta busca un huésped en esa habitación, cuya fecha de CHECKIN
     # sea menor o igual a la fecha de búsqueda, y cuya fecha de CHECKOUT
     # sea mayor o igual a la fecha de búsqueda O sea 'NULL' (todavía abierto).
+    # Las fechas se guardan como YYYY-MM-DD, así que se comparan directo (sin DATE())
+    # y SQLite puede usar el índice por HABITACION, ESTADO, CHECKIN.
     query = """
         SELECT * FROM HUESPEDES 
         WHERE HABITACION = ? 
-          AND DATE(CHECKIN) <= DATE(?) 
-          AND (DATE(CHECKOUT) >= DATE(?) OR ESTADO = 'ABIERTO') 
-          AND ESTADO != 'CERRADO'
+          AND ESTADO IN ('ABIERTO', 'PROGRAMADO')
+          AND CHECKIN <= ? 
+          AND (CHECKOUT >= ? OR ESTADO = 'ABIERTO') 
         ORDER BY CHECKIN DESC
         LIMIT 1
     """
@@ -809,18 +827,13 @@ def cambiar_estado():
     if nuevo_estado is None:
         return
 
-    # 3. Preparar datos comunes
-    registro_anterior_data = db.obtener_uno("SELECT REGISTRO FROM HUESPEDES WHERE NUMERO = ?", (numero,))
-    registro_anterior = str(registro_anterior_data["REGISTRO"] or "") if registro_anterior_data else ""
-    separador = "\n---\n"
-    
-    # 4. Delegar la ejecución
+    # 3. Delegar la ejecución
     if nuevo_estado == "PROGRAMADO":
-        _actualizar_a_programado(numero, registro_anterior, separador)
+        _actualizar_a_programado(numero)
     elif nuevo_estado == "ABIERTO":
-        _actualizar_a_abierto(numero, registro_anterior, separador)
+        _actualizar_a_abierto(numero)
     elif nuevo_estado == "CERRADO":
-        _actualizar_a_cerrado(numero, registro_anterior, separador)
+        _actualizar_a_cerrado(numero)
     
     # La función termina aquí, el programa vuelve al menú principal.
 
@@ -855,7 +868,7 @@ def _nuevo_estado():
             return None # Cancelar selección
         return opciones[seleccion] # Devuelve el nombre del estado
 
-def _actualizar_a_programado(numero, registro_anterior, separador):
+def _actualizar_a_programado(numero):
     # Maneja la lógica para cambiar el estado a PROGRAMADO.
     # 1. Adquisición y validación de fechas
     checkin = pedir_fecha_valida("Ingresá la nueva fecha de checkin (DD-MM-YYYY): ")
@@ -866,23 +879,20 @@ def _actualizar_a_programado(numero, registro_anterior, separador):
     contingente = pedir_entero("Ingresá la cantidad de huéspedes: ", minimo=1, maximo=4)
     habitacion = pedir_habitación(checkin, checkout, contingente, numero)
 
-    # 2. Construcción del registro y updates
-    registro_nuevo = f"Estado modificado a PROGRAMADO - {datetime.now().isoformat(sep=' ', timespec='seconds')}"
-    registro = registro_anterior + separador + registro_nuevo if registro_anterior.strip() else registro_nuevo
-    
+    # 2. Updates
     updates = {
         "ESTADO": "PROGRAMADO", 
         "CHECKIN": checkin, 
         "CHECKOUT": checkout, 
         "HABITACION": habitacion,
-        "CONTINGENTE": contingente,
-        "REGISTRO": registro
+        "CONTINGENTE": contingente
     }
     
     # 3. Ejecución y manejo de errores
     try:
         with db.transaccion():
             _editar_huesped_db(numero, updates) 
+            registrar_evento(numero, "ESTADO", "Estado modificado a PROGRAMADO")
         print("\n✔ Estado actualizado a PROGRAMADO.")
         return True
     except ValueError as e:
@@ -891,7 +901,7 @@ def _actualizar_a_programado(numero, registro_anterior, separador):
         print(f"\n❌ Error al actualizar el estado a PROGRAMADO: {e}")
         return False
 
-def _actualizar_a_abierto(numero, registro_anterior, separador):
+def _actualizar_a_abierto(numero):
     # Maneja la lógica para cambiar el estado a ABIERTO.
     # La función debe obtener el huésped actual para chequear datos faltantes
     huesped_actual = db.obtener_uno("SELECT * FROM HUESPEDES WHERE NUMERO = ?", (numero,))
@@ -910,14 +920,10 @@ def _actualizar_a_abierto(numero, registro_anterior, separador):
     contingente = pedir_entero("Ingresá la cantidad de huéspedes: ", minimo=1, maximo=4)
     habitacion = pedir_habitación(hoy, checkout, contingente, numero)
     
-    # 2. Construcción del registro y updates
-    registro_nuevo = f"Estado modificado a ABIERTO - {datetime.now().isoformat(sep=' ', timespec='seconds')}"
-    registro = registro_anterior + separador + registro_nuevo
-
+    # 2. Updates
     updates = {
         "ESTADO": "ABIERTO", "CHECKIN": hoy, "CHECKOUT": checkout, 
-        "HABITACION": habitacion, "CONTINGENTE": contingente,
-        "REGISTRO": registro
+        "HABITACION": habitacion, "CONTINGENTE": contingente
     }
 
     # Agregar los datos de contacto/documento recopilados al diccionario updates
@@ -927,6 +933,7 @@ def _actualizar_a_abierto(numero, registro_anterior, separador):
     try:
         with db.transaccion():
             _editar_huesped_db(numero, updates)
+            registrar_evento(numero, "ESTADO", "Estado modificado a ABIERTO")
         print("\n✔ Estado actualizado a ABIERTO.")
         return True
     except ValueError as e:
@@ -935,32 +942,34 @@ def _actualizar_a_abierto(numero, registro_anterior, separador):
         print(f"\n❌ Error al actualizar el estado a ABIERTO: {e}")
         return False
 
-def _actualizar_a_cerrado(numero, registro_anterior, separador):
+def _actualizar_a_cerrado(numero):
     # Maneja la lógica para cambiar el estado a CERRADO."""
     # Obtiene el huesped actual para el log si es necesario
     huesped_data = db.obtener_uno("SELECT * FROM HUESPEDES WHERE NUMERO = ?", (numero,))
     if not huesped_data:
         print("\n❌ Error interno: Huésped no encontrado.")
         return False
+    # 1. VERIFICAR CONSUMOS Y PREGUNTAR POR EL PAGO (Lógica Delegada), antes de abrir la transacción:
+    # no se retiene el bloqueo de escritura mientras se espera la respuesta del usuario.
+    checkout_ok, cobro = _verificar_consumos_impagos(numero)
+    if not checkout_ok:
+        # El cierre fue cancelado por el usuario.
+        return False
+    total_pendiente = cobro["total_pendiente"]
     try:
         with db.transaccion():
             hoy = date.today().isoformat()
             
-            # 1. VERIFICAR CONSUMOS Y GESTIONAR PAGO (Lógica Delegada)
-            checkout_ok, registro_modificado, total_pendiente = _verificar_consumos_impagos(numero, registro_anterior)
-            if not checkout_ok:
-                # El cierre fue cancelado por el usuario o falló el pago.
-                return False
-            # Usamos el registro devuelto, que ya incluye notas de pago o de deuda
-            registro_anterior = registro_modificado 
+            # Cobro o deuda, junto con el cierre
+            _registrar_pago_o_deuda(numero, cobro)
             
             # 2. Lógica de Cierre y Log
-            registro_nuevo = f"Estado modificado a CERRADO - {datetime.now().isoformat(sep=' ', timespec='seconds')}"
-            registro = registro_anterior + separador + registro_nuevo
-            updates = {"ESTADO": "CERRADO", "CHECKOUT": hoy, "HABITACION": 0, "REGISTRO": registro}
+            updates = {"ESTADO": "CERRADO", "CHECKOUT": hoy, "HABITACION": 0}
 
             # Ejecución del cierre
             _editar_huesped_db(numero, updates) 
+            registrar_evento(numero, "CHECKOUT", "Estado modificado a CERRADO")
+            auditar("CHECKOUT", "HUESPED", numero, habitacion=huesped_data["HABITACION"], monto=round(total_pendiente, 2))
                 
         # Este código solo se ejecuta si la transacción fue exitosa
         log = (
@@ -969,7 +978,8 @@ def _actualizar_a_cerrado(numero, registro_anterior, separador):
                     f"Total de consumos no pagados al momento del cierre: R {total_pendiente:.2f}\n"
                     f"Acción realizada por: {usuarios.sesion.usuario}"
                 )
-        registrar_log("huespedes_cerrados.log", log)
+        registrar_log("huespedes_cerrados.log", log, accion="CHECKOUT", usuario=usuarios.sesion.usuario,
+                      huesped=numero, habitacion=huesped_data["HABITACION"], monto=round(total_pendiente, 2))
         print("\n✔ Huésped cerrado.")
         return True
     except ValueError as e:
@@ -1037,15 +1047,11 @@ def editar_huesped():
             else:
                 # Para otros campos, usar el valor tal cual lo devuelve la función lambda (ya puede estar validado/formateado)
                 nuevo_valor = valor_ingresado
-            registro_anterior_data = db.obtener_uno("SELECT REGISTRO FROM HUESPEDES WHERE NUMERO = ?", (numero,))
-            registro_anterior = registro_anterior_data["REGISTRO"] if registro_anterior_data and "REGISTRO" in registro_anterior_data else ""
-            separador = "\n---\n"
-            registro_actual = f"Se modificó {campo_sql} a '{nuevo_valor}' - {datetime.now().isoformat(sep=" ", timespec='seconds')}"
-            nuevo_registro = registro_anterior + separador + registro_actual
-            updates = {campo_sql: nuevo_valor, "REGISTRO": nuevo_registro}
+            updates = {campo_sql: nuevo_valor}
             try:
                 with db.transaccion():
                     _editar_huesped_db(numero, updates)
+                    registrar_evento(numero, "EDICION", f"Se modificó {campo_sql} a '{nuevo_valor}'")
                 print(f"✔ {campo_sql} actualizado correctamente a {nuevo_valor}.")
             except ValueError as e:
                 print(f"\n{e}")
@@ -1088,7 +1094,11 @@ def eliminar_huesped():
         if confirmacion == "si":
             try:
                 with db.transaccion():
+                    # El historial se borra en cascada con el huésped; se guarda antes en el log
+                    eventos = db.obtener_todos("SELECT FECHA, TIPO, USUARIO, DETALLE FROM HUESPED_EVENTOS WHERE HUESPED = ? ORDER BY ID", (numero,))
                     db.ejecutar("DELETE FROM HUESPEDES WHERE NUMERO = ?", (numero,))
+                    auditar("HUESPED_ELIMINADO", "HUESPED", numero, apellido=huesped["APELLIDO"], nombre=huesped["NOMBRE"],
+                            estado=huesped["ESTADO"], habitacion=huesped["HABITACION"], eventos=len(eventos))
                     marca_tiempo = marca_de_tiempo()
                     log = (
                         f"[{marca_tiempo}] HUÉSPED ELIMINADO:\n"
@@ -1098,10 +1108,11 @@ def eliminar_huesped():
                         f"| Estado: {huesped['ESTADO']} | Checkin: {huesped['CHECKIN']} | "
                         f"| Checkout: {huesped['CHECKOUT']} | Documento: {huesped['DOCUMENTO']} | "
                         f"| Habitación: {huesped['HABITACION']} | Contingente: {huesped['CONTINGENTE']} | "
-                        f"| Registro: {huesped['REGISTRO']}\n"
+                        f"| Registro: {' / '.join(formatear_evento(e) for e in eventos)}\n"
                         f"| Acción realizada por: {usuarios.sesion.usuario}"
                     )
-                    registrar_log("huespedes_eliminados.log", log)
+                    registrar_log("huespedes_eliminados.log", log, accion="HUESPED_ELIMINADO", usuario=usuarios.sesion.usuario,
+                                  huesped=huesped["NUMERO"], habitacion=huesped["HABITACION"])
                 print("\n✔ Huésped eliminado.")
             except sqlite3.IntegrityError:
                 print("\n❌ No se puede eliminar el huésped porque tiene consumos pendientes.")
@@ -1164,15 +1175,13 @@ def intercambiar_habitacion():
     try:
         with db.transaccion():
             # Actualizar habitación del huésped 1
-            _editar_huesped_db(huesped1["NUMERO"], {
-                "HABITACION": hab2,
-                "REGISTRO": f"{huesped1['REGISTRO']}\n---\nIntercambio: movido a habitación {hab2} - {marca_de_tiempo()}"
-            })
+            _editar_huesped_db(huesped1["NUMERO"], {"HABITACION": hab2})
+            registrar_evento(huesped1["NUMERO"], "INTERCAMBIO", f"Intercambio: movido a habitación {hab2}")
+            auditar("INTERCAMBIO", "HUESPED", huesped1["NUMERO"], habitacion_anterior=hab1, habitacion=hab2)
             # Actualizar habitación del huésped 2
-            _editar_huesped_db(huesped2["NUMERO"], {
-                "HABITACION": hab1,
-                "REGISTRO": f"{huesped2['REGISTRO']}\n---\nIntercambio: movido a habitación {hab1} - {marca_de_tiempo()}"
-            })
+            _editar_huesped_db(huesped2["NUMERO"], {"HABITACION": hab1})
+            registrar_evento(huesped2["NUMERO"], "INTERCAMBIO", f"Intercambio: movido a habitación {hab1}")
+            auditar("INTERCAMBIO", "HUESPED", huesped2["NUMERO"], habitacion_anterior=hab2, habitacion=hab1)
 
         print(f"\n✔ Intercambio realizado con éxito entre las habitaciones {hab1} y {hab2}.")
 
@@ -1184,12 +1193,67 @@ def intercambiar_habitacion():
             f"{huesped2['APELLIDO'].title()}, {huesped2['NOMBRE'].title()}\n"
             f"Acción realizada por: {usuarios.sesion.usuario}"
         )
-        registrar_log("huespedes_cambios.log", log)
+        registrar_log("huespedes_cambios.log", log, accion="INTERCAMBIO", usuario=usuarios.sesion.usuario,
+                      huespedes=[huesped1["NUMERO"], huesped2["NUMERO"]], habitaciones=[hab1, hab2])
 
     except Exception as e:
         print(f"\n❌ Error al realizar el intercambio: {e}")
         return
 
+# Historial paginado: se trae una página por vez, de la más nueva a la más vieja
+TAMANO_PAGINA_REGISTRO = 20
+FILTROS_REGISTRO = {
+    1: ("Consumos", ["CONSUMO"]),
+    2: ("Pagos y deudas", ["PAGO", "DEUDA"]),
+    3: ("Check-in y check-out", ["CHECKIN", "CHECKOUT"]),
+    4: ("Intercambios", ["INTERCAMBIO"]),
+    5: ("Descuentos", ["DESCUENTO"]),
+}
+
+def pagina_de_eventos(numero_huesped, tipos=None, desde=None, hasta=None, antes_de=None, tamano=TAMANO_PAGINA_REGISTRO):
+    """
+    Devuelve (eventos, hay_mas) con hasta 'tamano' eventos del huésped, del más nuevo al más viejo.
+    Paginación por clave: para la página siguiente se pasa en 'antes_de' el ID del último evento recibido,
+    así cada página cuesta lo mismo sin importar cuán largo sea el historial.
+    'desde' y 'hasta' son fechas YYYY-MM-DD (inclusive).
+    """
+    condiciones = ["HUESPED = ?"]
+    params = [numero_huesped]
+    if tipos:
+        condiciones.append(f"TIPO IN ({', '.join('?' * len(tipos))})")
+        params.extend(tipos)
+    if desde:
+        condiciones.append("FECHA >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("FECHA <= ?")
+        params.append(f"{hasta} 23:59:59")
+    if antes_de is not None:
+        condiciones.append("ID < ?")
+        params.append(antes_de)
+
+    # Se pide uno de más para saber si hay otra página sin hacer un COUNT
+    query = f"""
+        SELECT ID, FECHA, TIPO, USUARIO, DETALLE FROM HUESPED_EVENTOS
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY ID DESC LIMIT ?
+    """
+    params.append(tamano + 1)
+    eventos = db.obtener_todos(query, tuple(params))
+    return eventos[:tamano], len(eventos) > tamano
+
+def _pedir_filtros_registro():
+    # Pide el tipo de evento y el rango de fechas. Devuelve (tipos, desde, hasta, descripción)
+    leyenda = "\nFiltrar por tipo: (1) Consumos, (2) Pagos, (3) Check-in/out, (4) Intercambios, (5) Descuentos ó (Enter) todos: "
+    opcion = opcion_menu(leyenda, vacio=True, minimo=1, maximo=5)
+    nombre_filtro, tipos = FILTROS_REGISTRO[opcion] if opcion else ("Todos", None)
+    desde = pedir_fecha_valida("Desde (DD-MM-YYYY) ó (Enter) sin límite: ", allow_past=True, confirmacion=False, vacio=True)
+    hasta = pedir_fecha_valida("Hasta (DD-MM-YYYY) ó (Enter) sin límite: ", allow_past=True, confirmacion=False, vacio=True)
+    descripcion = nombre_filtro
+    if desde or hasta:
+        descripcion += f" | {formatear_fecha(desde) if desde else '...'} a {formatear_fecha(hasta) if hasta else '...'}"
+    return tipos, desde or None, hasta or None, descripcion
+
 @usuarios.requiere_acceso(2)
 def ver_registro():
     leyenda = "Ingresá el número de huésped para ver su historial, (*) para buscar ó (0) para cancelar: "
@@ -1201,21 +1265,30 @@ def ver_registro():
             buscar_huesped()
             continue
         
-        huesped = db.obtener_uno("SELECT NOMBRE, APELLIDO, REGISTRO FROM HUESPEDES WHERE NUMERO = ?", (numero,))
+        huesped = db.obtener_uno("SELECT NOMBRE, APELLIDO FROM HUESPEDES WHERE NUMERO = ?", (numero,))
         if huesped is None:
             print("\n❌ Huésped no encontrado.")
             continue
 
         nombre = huesped["NOMBRE"]
         apellido = huesped["APELLIDO"]
-        registro = huesped["REGISTRO"]
-        print(f"\nHistorial del huésped {nombre} {apellido}:\n")
+        tipos, desde, hasta, descripcion = _pedir_filtros_registro()
+        print(f"\nHistorial del huésped {nombre} {apellido} ({descripcion}), del más reciente al más antiguo:\n")
 
-        if not registro:
-            print("\n❌ Este huésped no tiene historial registrado.")
-        else:
-            entradas = registro.split("\n---\n")
-            for i, linea in enumerate(entradas, start=1):
-                print(f"{i}. {linea.strip()}\n")
+        antes_de = None
+        mostrados = 0
+        while True:
+            eventos, hay_mas = pagina_de_eventos(numero, tipos, desde, hasta, antes_de)
+            if not eventos and mostrados == 0:
+                print("\n❌ Este huésped no tiene historial registrado para ese filtro.")
+                break
+            for evento in eventos:
+                mostrados += 1
+                print(f"{mostrados}. [{evento['TIPO']}] {formatear_evento(evento)}\n")
+            if not hay_mas:
+                break
+            antes_de = eventos[-1]["ID"]
+            if opcion_menu("(Enter) para ver más antiguos ó (0) para salir: ", cero=True, vacio=True, maximo=0) == 0:
+                break
 
         return
@@ -1,14 +1,15 @@
 import re
 import unidecode
 import usuarios
+from auditoria import auditar
 from db import db
 from productos import _ejecutar_busqueda
-from utiles import imprimir_productos, pedir_entero, registrar_log, marca_de_tiempo, opcion_menu, pedir_confirmacion
+from utiles import imprimir_productos, pedir_entero, registrar_log, marca_de_tiempo, opcion_menu, pedir_confirmacion, filas_o_none
 
 @usuarios.requiere_acceso(1)
 def abrir_inventario():
-    productos = db.obtener_todos("SELECT CODIGO, NOMBRE, STOCK FROM PRODUCTOS ORDER BY NOMBRE")
-    if not productos:
+    productos = filas_o_none(db.obtener_iter("SELECT CODIGO, NOMBRE, STOCK FROM PRODUCTOS ORDER BY NOMBRE"))
+    if productos is None:
         print("❌ No hay productos cargados.")
         return
 
@@ -62,6 +63,7 @@ def ingresar_compra():
     try:
         with db.transaccion():
             db.ejecutar(update_query, params)
+            auditar("COMPRA", "PRODUCTO", codigo, cantidad=cantidad, stock_anterior=stock, stock=nuevo_stock, grupo=grupo)
             
             marca_tiempo = marca_de_tiempo()
             log = (
@@ -69,7 +71,8 @@ def ingresar_compra():
                 f"Producto: {nombre} (ID: {codigo}). {log_info} | "
                 f"Cantidad agregada: {cantidad} | Nuevo stock: {nuevo_stock}"
             )
-            registrar_log("inventario_compras.log", log)
+            registrar_log("inventario_compras.log", log, accion="COMPRA", usuario=usuarios.sesion.usuario,
+                          producto=codigo, cantidad=cantidad, stock=nuevo_stock)
             
         # 6. Mensaje de éxito
         plural = "unidad" if cantidad == 1 else "unidades"
@@ -101,6 +104,7 @@ def editar_inventario():
     update_query = "UPDATE PRODUCTOS SET STOCK = ? WHERE CODIGO = ?"
     params = (nuevo_stock, codigo)
     mensaje_accion = f"Modificado solo el stock de '{nombre}'"
+    grupo_afectado = None
 
     # 3. Lógica de Grupo
     if grupo:
@@ -112,6 +116,7 @@ def editar_inventario():
             update_query = "UPDATE PRODUCTOS SET STOCK = ? WHERE GRUPO = ?"
             params = (nuevo_stock, grupo)
             mensaje_accion = f"Modificado el stock del grupo '{grupo}'"
+            grupo_afectado = grupo
             
         else:
             # Aplicar solo al producto editado (se usa el query/params por defecto)
@@ -121,6 +126,8 @@ def editar_inventario():
     try:
         with db.transaccion():
             db.ejecutar(update_query, params)
+            auditar("INVENTARIO_EDITADO", "PRODUCTO", codigo, stock_anterior=stock_anterior, stock=nuevo_stock,
+                    grupo=grupo_afectado)
             
             marca_tiempo = marca_de_tiempo()
             log = (
@@ -129,7 +136,8 @@ def editar_inventario():
                 f"Stock anterior: {stock_anterior} | Nuevo stock: {nuevo_stock}. "
                 f"Acción: {mensaje_accion}"
             )
-            registrar_log("inventario_ediciones.log", log)
+            registrar_log("inventario_ediciones.log", log, accion="INVENTARIO_EDITADO", usuario=usuarios.sesion.usuario,
+                          producto=codigo, stock_anterior=stock_anterior, stock=nuevo_stock)
             
         print(f"\n✔ {mensaje_accion}. Nuevo stock: {nuevo_stock}.")
         
@@ -161,8 +169,8 @@ def _seleccionar_producto(accion="a gestionar"):
 
         # 🔹 Mostrar todos los productos
         if entrada == "*":
-            productos = db.obtener_todos("SELECT * FROM PRODUCTOS ORDER BY CODIGO")
-            if productos:
+            productos = filas_o_none(db.obtener_iter("SELECT * FROM PRODUCTOS ORDER BY CODIGO"))
+            if productos is not None:
                 imprimir_productos(productos)
                 continue
             else:
@@ -12,7 +12,6 @@
 
 #Los logs deben guardar los nombres con Title Case.
 
-#Estructurar Logs en JSON para facilitar su lectura y análisis
 #Verificar el muestreo de registros para que no se muestren todos los registros de una vez
 #Verificar el muestreo de Logs (principalmente aquel de consumos eliminados, ya que no tiene sentido que muestre todo)
 
@@ -21,30 +20,22 @@
 import bcrypt
 import sqlite3
 import traceback
+from bitacora import bitacora
 from consumos import agregar_consumo, ver_consumos, eliminar_consumos, registrar_pago, consumo_cortesia, asignar_descuento
 from db import db
 from huespedes import nuevo_huesped, realizar_checkout, buscar_huesped, ver_registro, cambiar_estado, editar_huesped, eliminar_huesped, realizar_checkin, ver_programados, intercambiar_habitacion
 from inventario import abrir_inventario, ingresar_compra, editar_inventario
+from migraciones import aplicar_migraciones
 from productos import nuevo_producto, buscar_producto, listado_productos, editar_producto, eliminar_producto
-from reportes import reporte_diario, reporte_abiertos, reporte_cerrados, reporte_pronto_checkin, reporte_inventario, reporte_ocupacion, ver_logs
+from reportes import reporte_diario, reporte_abiertos, reporte_cerrados, reporte_pronto_checkin, reporte_inventario, reporte_ocupacion, ver_logs, buscar_en_logs, ver_auditoria
+from respaldos import respaldar_base
 from usuarios import crear_usuario, mostrar_usuarios, editar_usuario, eliminar_usuario, logout
 from utiles import pedir_confirmacion, opcion_menu
 
 ### FUNCIONES ###
 
 def usuarios_existe():
-    try:
-        db.ejecutar('''
-            CREATE TABLE IF NOT EXISTS USUARIOS (
-                ID INTEGER PRIMARY KEY,
-                USUARIO TEXT NOT NULL UNIQUE,
-                CONTRASEÑA_HASH BLOB NOT NULL,
-                NIVEL_DE_ACCESO INTEGER NOT NULL
-            )
-        ''')
-    except Exception as e:
-        print(f"❌ Error al crear la tabla USUARIOS: {e}")
-
+    # El esquema lo crea 'aplicar_migraciones'; acá solo se asegura que exista un Superusuario.
     num_usuarios = db.obtener_uno("SELECT COUNT(*) AS total FROM USUARIOS")["total"]
 
     if num_usuarios == 0:
@@ -57,54 +48,6 @@ def usuarios_existe():
         except sqlite3.IntegrityError:
             print("\n❌ Error: No se pudo crear un Superusuario.")
 
-def productos_existe():
-    try:
-        db.ejecutar('''CREATE TABLE IF NOT EXISTS PRODUCTOS(
-                    CODIGO INTEGER PRIMARY KEY,
-                    NOMBRE TEXT NOT NULL,
-                    PRECIO REAL NOT NULL CHECK (PRECIO >= 0),
-                    STOCK INTEGER NOT NULL CHECK (STOCK >= 0 OR STOCK = -1),
-                    ALERTA INTEGER NOT NULL DEFAULT 5,
-                    PINMEDIATO INTEGER NOT NULL DEFAULT 0 CHECK (PINMEDIATO IN (0,1)),
-                    GRUPO TEXT DEFAULT NULL)''')
-    except Exception as e:
-        print(f"❌ Error al crear la tabla PRODUCTOS: {e}")
-
-def huespedes_existe():
-    try:
-        db.ejecutar('''CREATE TABLE IF NOT EXISTS HUESPEDES(NUMERO INTEGER PRIMARY KEY AUTOINCREMENT,
-                    APELLIDO TEXT NOT NULL, NOMBRE TEXT NOT NULL, TELEFONO INTEGER, EMAIL TEXT, APP TEXT,
-                    ESTADO TEXT NOT NULL CHECK(ESTADO IN ('ABIERTO','CERRADO','PROGRAMADO')),
-                    CHECKIN TEXT, CHECKOUT TEXT, DOCUMENTO TEXT, HABITACION INTEGER NOT NULL,
-                CONTINGENTE INTEGER, REGISTRO TEXT, DESCUENTO TEXT DEFAULT NULL)''')
-    except Exception as e:
-        print(f"❌ Error al crear la tabla HUESPEDES: {e}")
-
-def consumos_existe():
-    try:
-        db.ejecutar('''CREATE TABLE IF NOT EXISTS CONSUMOS(
-                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                    HUESPED INTEGER NOT NULL, PRODUCTO INTEGER NOT NULL,
-                    CANTIDAD INTEGER NOT NULL CHECK (CANTIDAD > 0),
-                    FECHA TEXT NOT NULL, PAGADO INTEGER NOT NULL DEFAULT 0 CHECK (PAGADO IN (0,1)),
-                    FOREIGN KEY (HUESPED) REFERENCES HUESPEDES(NUMERO),
-                    FOREIGN KEY (PRODUCTO) REFERENCES PRODUCTOS(CODIGO)
-                    ON UPDATE CASCADE ON DELETE RESTRICT)''')
-    except Exception as e:
-        print(f"❌ Error al crear la tabla CONSUMOS: {e}")
-
-def cortesias_existe():
-    try:
-        db.ejecutar('''CREATE TABLE IF NOT EXISTS CORTESIAS(
-                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                    PRODUCTO INTEGER NOT NULL,
-                    CANTIDAD INTEGER NOT NULL CHECK (CANTIDAD > 0),
-                    FECHA TEXT NOT NULL, AUTORIZA TEXT NOT NULL,
-                    FOREIGN KEY (PRODUCTO) REFERENCES PRODUCTOS(CODIGO)
-                    ON UPDATE CASCADE ON DELETE RESTRICT)''')
-    except Exception as e:
-        print(f"❌ Error al crear la tabla CORTESIAS: {e}")
-
 def inicio():
     leyenda = "\n¿Qué querés hacer?:\n1.🧘 Gestion de huéspedes\n2.📋 Gestion de consumos\n3.🛍️ Gestion de productos\n4.📦 Gestion de inventario\n5.📈 Gestion de reportes\n6.👤 Gestion de usuarios\n0.❌ Cerrar\n"
     while True:
@@ -207,9 +150,9 @@ def gestionar_inventario():
             return
 
 def gestionar_reportes():
-    leyenda = "\nGestión de reportes\n1.📋 Generar reporte de consumos diarios\n2.🧘 Generar reporte de habitaciones abiertas\n3.👋 Generar reporte de habitaciones cerradas\n4.📆 Generar reporte de pronto checkin\n5.📅 Generar reporte de ocupación\n6.📦 Generar reporte de inventario\n7.㏒ Ver logs\n0.⮐  Volver al inicio\n"
+    leyenda = "\nGestión de reportes\n1.📋 Generar reporte de consumos diarios\n2.🧘 Generar reporte de habitaciones abiertas\n3.👋 Generar reporte de habitaciones cerradas\n4.📆 Generar reporte de pronto checkin\n5.📅 Generar reporte de ocupación\n6.📦 Generar reporte de inventario\n7.㏒ Ver logs\n8.💾 Respaldar base de datos\n9.🔎 Buscar en logs\n10.🧾 Ver auditoría\n0.⮐  Volver al inicio\n"
     while True:
-        respuesta = opcion_menu(leyenda, cero=True, minimo=1, maximo=7)
+        respuesta = opcion_menu(leyenda, cero=True, minimo=1, maximo=10)
         if respuesta == 1:
             reporte_diario()
         elif respuesta == 2:
@@ -224,6 +167,12 @@ def gestionar_reportes():
             reporte_inventario()
         elif respuesta == 7:
             ver_logs()
+        elif respuesta == 8:
+            respaldar_base()
+        elif respuesta == 9:
+            buscar_en_logs()
+        elif respuesta == 10:
+            ver_auditoria()
         elif respuesta == 0:
             return
 
@@ -250,17 +199,15 @@ def gestionar_usuarios():
 
 try:
     print("Bienvenido al sistema de gestión de la posada Onda de mar 2.6 by MatCodePro")
+    aplicar_migraciones()
     usuarios_existe()
-    productos_existe()
-    huespedes_existe()
-    consumos_existe()
-    cortesias_existe()
     inicio()
 except Exception:
     with open("error.log", "w") as f:
         f.write(traceback.format_exc())
 finally:
     print("\nCerrando el programa...")
+    bitacora.cerrar()
     db.cerrar()
     print("Conexión a la base de datos cerrada.")
     print("Adios!!!")
\ No newline at end of file
@@ -0,0 +1,249 @@
+import re
+from db import db
+
+# Migraciones del esquema, en orden. La posición en MIGRACIONES (empezando en 1) es el número
+# de versión, que se guarda en PRAGMA user_version al aplicarla.
+# Cada migración corre dentro de su propia transacción y debe ser idempotente.
+# Regla: las migraciones publicadas no se editan; los cambios nuevos van en una migración nueva al final.
+
+def _columna_existe(tabla, columna):
+    # table_xinfo y no table_info: table_info no lista las columnas generadas (ej: CONSUMOS.DIA)
+    columnas = db.obtener_todos(f"PRAGMA table_xinfo({tabla})")
+    return any(c["name"] == columna for c in columnas)
+
+def _m001_esquema_base():
+    # Tablas originales. Usa IF NOT EXISTS para adoptar instalaciones creadas antes de las migraciones.
+    db.ejecutar('''
+        CREATE TABLE IF NOT EXISTS USUARIOS (
+            ID INTEGER PRIMARY KEY,
+            USUARIO TEXT NOT NULL UNIQUE,
+            CONTRASEÑA_HASH BLOB NOT NULL,
+            NIVEL_DE_ACCESO INTEGER NOT NULL
+        )
+    ''')
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS PRODUCTOS(
+                CODIGO INTEGER PRIMARY KEY,
+                NOMBRE TEXT NOT NULL,
+                PRECIO REAL NOT NULL CHECK (PRECIO >= 0),
+                STOCK INTEGER NOT NULL CHECK (STOCK >= 0 OR STOCK = -1),
+                ALERTA INTEGER NOT NULL DEFAULT 5,
+                PINMEDIATO INTEGER NOT NULL DEFAULT 0 CHECK (PINMEDIATO IN (0,1)),
+                GRUPO TEXT DEFAULT NULL)''')
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS HUESPEDES(NUMERO INTEGER PRIMARY KEY AUTOINCREMENT,
+                APELLIDO TEXT NOT NULL, NOMBRE TEXT NOT NULL, TELEFONO INTEGER, EMAIL TEXT, APP TEXT,
+                ESTADO TEXT NOT NULL CHECK(ESTADO IN ('ABIERTO','CERRADO','PROGRAMADO')),
+                CHECKIN TEXT, CHECKOUT TEXT, DOCUMENTO TEXT, HABITACION INTEGER NOT NULL,
+            CONTINGENTE INTEGER, REGISTRO TEXT, DESCUENTO TEXT DEFAULT NULL)''')
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS CONSUMOS(
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                HUESPED INTEGER NOT NULL, PRODUCTO INTEGER NOT NULL,
+                CANTIDAD INTEGER NOT NULL CHECK (CANTIDAD > 0),
+                FECHA TEXT NOT NULL, PAGADO INTEGER NOT NULL DEFAULT 0 CHECK (PAGADO IN (0,1)),
+                FOREIGN KEY (HUESPED) REFERENCES HUESPEDES(NUMERO),
+                FOREIGN KEY (PRODUCTO) REFERENCES PRODUCTOS(CODIGO)
+                ON UPDATE CASCADE ON DELETE RESTRICT)''')
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS CORTESIAS(
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                PRODUCTO INTEGER NOT NULL,
+                CANTIDAD INTEGER NOT NULL CHECK (CANTIDAD > 0),
+                FECHA TEXT NOT NULL, AUTORIZA TEXT NOT NULL,
+                FOREIGN KEY (PRODUCTO) REFERENCES PRODUCTOS(CODIGO)
+                ON UPDATE CASCADE ON DELETE RESTRICT)''')
+
+def _m002_indices_claves_y_dia():
+    # Índices sobre las claves foráneas: los usan los JOIN de consumos y los chequeos
+    # ON DELETE RESTRICT / ON UPDATE CASCADE al borrar o recodificar productos y huéspedes.
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CONSUMOS_HUESPED ON CONSUMOS(HUESPED)")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CONSUMOS_PRODUCTO ON CONSUMOS(PRODUCTO)")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CORTESIAS_PRODUCTO ON CORTESIAS(PRODUCTO)")
+    # Día del consumo (YYYY-MM-DD) como columna derivada e indexada, para el reporte diario.
+    # DIA es virtual y no se guarda: no aparece en PRAGMA table_info pero sí en 'SELECT *'.
+    # Todas las lecturas de CONSUMOS nombran sus columnas, así que nadie la recibe sin pedirla.
+    if not _columna_existe("CONSUMOS", "DIA"):
+        db.ejecutar("ALTER TABLE CONSUMOS ADD COLUMN DIA TEXT GENERATED ALWAYS AS (substr(FECHA, 1, 10)) VIRTUAL")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CONSUMOS_DIA ON CONSUMOS(DIA)")
+
+def _m003_indices_consultas_frecuentes():
+    # Índices para los filtros que se repiten en casi todas las pantallas.
+    # Huésped ABIERTO/PROGRAMADO de una habitación (consumos, check-in, búsquedas); CHECKIN
+    # al final entrega ya ordenado el programado más próximo.
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_HUESPEDES_HAB_ESTADO ON HUESPEDES(HABITACION, ESTADO, CHECKIN)")
+    # Listados y reportes por estado: programados a ingresar, vencidos y cerrados del día
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_HUESPEDES_ESTADO_CHECKIN ON HUESPEDES(ESTADO, CHECKIN)")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_HUESPEDES_ESTADO_CHECKOUT ON HUESPEDES(ESTADO, CHECKOUT)")
+    # Consumos de un huésped ordenados por fecha. Reemplaza al índice simple de la migración 2,
+    # que queda cubierto por este (la clave foránea sigue indexada por HUESPED).
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CONSUMOS_HUESPED_FECHA ON CONSUMOS(HUESPED, FECHA)")
+    db.ejecutar("DROP INDEX IF EXISTS IDX_CONSUMOS_HUESPED")
+    # Parcial: solo los consumos impagos (checkout y pagos), que son una fracción chica de la tabla.
+    # Las consultas deben incluir literalmente 'PAGADO = 0' para que SQLite lo use.
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_CONSUMOS_IMPAGOS ON CONSUMOS(HUESPED, FECHA) WHERE PAGADO = 0")
+    # Parcial: productos con grupo, para descontar stock de equivalentes y el listado por grupo.
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_PRODUCTOS_GRUPO ON PRODUCTOS(GRUPO, NOMBRE) WHERE GRUPO IS NOT NULL")
+    # Estadísticas para el planificador
+    db.ejecutar("ANALYZE")
+
+# Tipos para clasificar las entradas viejas de REGISTRO según cómo empezaba su texto.
+# Copia fija de los textos que se usaban al escribir REGISTRO (no cambia aunque cambie el código).
+_PREFIJOS_REGISTRO = [
+    ("CREADO ", "CREADO"),
+    ("CHECK-IN REALIZADO", "CHECKIN"),
+    ("Consumo agregado", "CONSUMO"),
+    ("Se marcaron como pagados", "PAGO"),
+    ("ADVERTENCIA: Habitación cerrada con deuda", "DEUDA"),
+    ("Estado modificado a CERRADO", "CHECKOUT"),
+    ("Estado modificado a", "ESTADO"),
+    ("Se modificó", "EDICION"),
+    ("Intercambio", "INTERCAMBIO"),
+    ("Se asignó un descuento", "DESCUENTO"),
+    ("Se quitó el descuento", "DESCUENTO"),
+]
+_FECHA_ISO = re.compile(r"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}(?::\d{2})?)")
+_FECHA_DMY = re.compile(r"(\d{2})-(\d{2})-(\d{4}) (\d{2}:\d{2})")
+
+def _fecha_de_entrada(texto, defecto):
+    # Última fecha y hora que aparece en el texto de la entrada, en formato YYYY-MM-DD HH:MM:SS
+    iso = _FECHA_ISO.findall(texto)
+    if iso:
+        dia, hora = iso[-1]
+        return f"{dia} {hora if len(hora) == 8 else hora + ':00'}"
+    dmy = _FECHA_DMY.findall(texto)
+    if dmy:
+        d, m, a, hora = dmy[-1]
+        return f"{a}-{m}-{d} {hora}:00"
+    return defecto
+
+def _tipo_de_entrada(texto):
+    for prefijo, tipo in _PREFIJOS_REGISTRO:
+        if texto.startswith(prefijo):
+            return tipo
+    return "OTRO"
+
+def _m004_eventos_de_huespedes():
+    # El historial deja de ser un texto que se reescribe entero en cada agregado (HUESPEDES.REGISTRO)
+    # y pasa a una tabla donde cada entrada es un INSERT.
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS HUESPED_EVENTOS(
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                HUESPED INTEGER NOT NULL,
+                FECHA TEXT NOT NULL,
+                TIPO TEXT NOT NULL,
+                USUARIO TEXT,
+                DETALLE TEXT NOT NULL,
+                FOREIGN KEY (HUESPED) REFERENCES HUESPEDES(NUMERO) ON DELETE CASCADE)''')
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_EVENTOS_HUESPED ON HUESPED_EVENTOS(HUESPED, ID)")
+
+    # Pasa cada entrada de REGISTRO a una fila, con el texto completo tal como estaba.
+    # Sin fecha reconocible se usa la del checkin del huésped. Después REGISTRO queda vacío.
+    huespedes = db.obtener_todos("SELECT NUMERO, CHECKIN, REGISTRO FROM HUESPEDES WHERE REGISTRO IS NOT NULL AND REGISTRO != ''")
+    for huesped in huespedes:
+        defecto = f"{huesped['CHECKIN'] or '0000-00-00'} 00:00:00"
+        filas = [
+            (huesped["NUMERO"], _fecha_de_entrada(texto, defecto), _tipo_de_entrada(texto), texto)
+            for texto in (entrada.strip() for entrada in huesped["REGISTRO"].split("\n---\n"))
+            if texto
+        ]
+        db.ejecutar_lote("INSERT INTO HUESPED_EVENTOS (HUESPED, FECHA, TIPO, DETALLE) VALUES (?, ?, ?, ?)", filas)
+    db.ejecutar("UPDATE HUESPEDES SET REGISTRO = NULL WHERE REGISTRO IS NOT NULL")
+
+def _m005_indice_eventos_por_tipo():
+    # Historial filtrado por tipo de evento (ver_registro), recorrido por ID descendente
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_EVENTOS_HUESPED_TIPO ON HUESPED_EVENTOS(HUESPED, TIPO, ID)")
+
+def _m006_ultimo_evento():
+    # Última entrada del historial de cada huésped, ya formateada, para mostrarla sin consultar los eventos.
+    # La mantiene huespedes.registrar_eventos en cada agregado.
+    if not _columna_existe("HUESPEDES", "ULTIMO_EVENTO"):
+        db.ejecutar("ALTER TABLE HUESPEDES ADD COLUMN ULTIMO_EVENTO TEXT")
+    _recalcular_ultimo_evento()
+
+def _recalcular_ultimo_evento(condicion="1 = 1", params=()):
+    # Mismo formato que utiles.formatear_evento: "detalle - por usuario - DD-MM-YYYY HH:MM"
+    db.ejecutar(f'''
+        UPDATE HUESPEDES SET ULTIMO_EVENTO = (
+            SELECT E.DETALLE
+                   || COALESCE(' - por ' || E.USUARIO, '')
+                   || ' - ' || COALESCE(strftime('%d-%m-%Y %H:%M', E.FECHA), E.FECHA)
+            FROM HUESPED_EVENTOS E
+            WHERE E.HUESPED = HUESPEDES.NUMERO
+            ORDER BY E.ID DESC LIMIT 1)
+        WHERE {condicion}
+    ''', params)
+
+def _m007_auditoria():
+    # Rastro de auditoría en la base: cada cambio se registra en la misma transacción que lo produce
+    # (ver auditoria.auditar), así se puede cruzar con HUESPEDES, PRODUCTOS o USUARIOS.
+    # Sin claves foráneas: la fila tiene que sobrevivir a que se borre la entidad auditada.
+    db.ejecutar('''CREATE TABLE IF NOT EXISTS AUDITORIA(
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                FECHA TEXT NOT NULL,
+                USUARIO TEXT,
+                ACCION TEXT NOT NULL,
+                ENTIDAD TEXT NOT NULL,
+                ENTIDAD_ID INTEGER,
+                DATOS TEXT)''')
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_AUDITORIA_FECHA ON AUDITORIA(FECHA)")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_AUDITORIA_USUARIO ON AUDITORIA(USUARIO, FECHA)")
+    db.ejecutar("CREATE INDEX IF NOT EXISTS IDX_AUDITORIA_ENTIDAD ON AUDITORIA(ENTIDAD, ENTIDAD_ID)")
+
+# Fecha con la que terminaba cada entrada del REGISTRO viejo: "... - DD-MM-YYYY HH:MM" (o ISO),
+# a veces seguida de "(PAGADO)" en los consumos.
+_FECHA_AL_FINAL = re.compile(
+    r"\s+-\s+(?P<fecha>\d{2}-\d{2}-\d{4} \d{2}:\d{2}|\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2})?)"
+    r"\s*(?P<pagado>\(PAGADO\))?\s*$")
+
+def _separar_fecha(detalle):
+    # Devuelve (detalle sin la fecha final, fecha YYYY-MM-DD HH:MM:SS), o (detalle, None) si no termina con fecha
+    coincidencia = _FECHA_AL_FINAL.search(detalle)
+    if not coincidencia:
+        return detalle, None
+    sin_fecha = detalle[:coincidencia.start()].rstrip()
+    if coincidencia.group("pagado"):
+        sin_fecha += " (PAGADO)"
+    return sin_fecha, _fecha_de_entrada(coincidencia.group("fecha"), None)
+
+def _m008_fecha_fuera_del_detalle():
+    # Las entradas que _m004 pasó desde REGISTRO conservaban su fecha al final del DETALLE, y formatear_evento
+    # le agrega FECHA: se veía dos veces. La fecha sale del texto y queda solo en FECHA.
+    # Las entradas nuevas nunca llevan fecha en el DETALLE, así que no coinciden.
+    cambios = []
+    huespedes = set()
+    for evento in db.obtener_iter("SELECT ID, HUESPED, DETALLE FROM HUESPED_EVENTOS WHERE DETALLE GLOB '* - [0-9]*'"):
+        detalle, fecha = _separar_fecha(evento["DETALLE"])
+        if fecha is not None:
+            cambios.append((detalle, fecha, evento["ID"]))
+            huespedes.add(evento["HUESPED"])
+    db.ejecutar_lote("UPDATE HUESPED_EVENTOS SET DETALLE = ?, FECHA = ? WHERE ID = ?", cambios)
+    for huesped in huespedes:
+        _recalcular_ultimo_evento("NUMERO = ?", (huesped,))
+
+MIGRACIONES = [
+    _m001_esquema_base,
+    _m002_indices_claves_y_dia,
+    _m003_indices_consultas_frecuentes,
+    _m004_eventos_de_huespedes,
+    _m005_indice_eventos_por_tipo,
+    _m006_ultimo_evento,
+    _m007_auditoria,
+    _m008_fecha_fuera_del_detalle,
+]
+
+def version_actual():
+    return db.obtener_uno("PRAGMA user_version")["user_version"]
+
+def aplicar_migraciones():
+    """
+    Lleva el esquema a la última versión. Si ya está al día no ejecuta ningún DDL.
+    Devuelve la versión final del esquema.
+    """
+    version = version_actual()
+    if version >= len(MIGRACIONES):
+        return version
+
+    for numero in range(version + 1, len(MIGRACIONES) + 1):
+        migracion = MIGRACIONES[numero - 1]
+        with db.transaccion():
+            migracion()
+            # PRAGMA no admite parámetros; 'numero' es un entero controlado por nosotros
+            db.ejecutar(f"PRAGMA user_version = {numero}")
+        print(f"✔ Esquema de la base de datos actualizado a la versión {numero}.")
+    return len(MIGRACIONES)
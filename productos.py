@@ -1,9 +1,10 @@
 import re
 import sqlite3
 import usuarios
+from auditoria import auditar
 from db import db
 from unidecode import unidecode
-from utiles import pedir_precio, pedir_entero, pedir_confirmacion, imprimir_productos, imprimir_producto, marca_de_tiempo, registrar_log, opcion_menu, pedir_grupo
+from utiles import pedir_precio, pedir_entero, pedir_confirmacion, imprimir_productos, imprimir_producto, marca_de_tiempo, registrar_log, opcion_menu, pedir_grupo, filas_o_none
 
 LISTA_BLANCA_PRODUCTOS = [
     "CODIGO",
@@ -147,7 +148,7 @@ def listado_productos():
         if query_type == "SIMPLE":
             # Opción 1 (Código) o 2 (Nombre)
             query = f"SELECT {COLUMNAS_BASE} FROM PRODUCTOS ORDER BY {orden}"
-            productos = db.obtener_todos(query)
+            productos = filas_o_none(db.obtener_iter(query))
             
         elif query_type == "GRUPO":
             # Opción 3 (Grupo): Filtra productos con grupo asignado y ordena por GRUPO, luego por NOMBRE
@@ -156,7 +157,7 @@ def listado_productos():
                 f"WHERE GRUPO IS NOT NULL AND GRUPO != '' " # Filtra los que tienen grupo
                 f"ORDER BY GRUPO, NOMBRE"
             )
-            productos = db.obtener_todos(query)
+            productos = filas_o_none(db.obtener_iter(query))
 
         if not productos:
             mensaje = "con un grupo asignado" if query_type == "GRUPO" else ""
@@ -197,8 +198,8 @@ def buscar_producto():
         break
 
     if opcion == "*":
-        productos = db.obtener_todos("SELECT CODIGO, NOMBRE, PRECIO, STOCK, ALERTA FROM PRODUCTOS")
-        if not productos:
+        productos = filas_o_none(db.obtener_iter("SELECT CODIGO, NOMBRE, PRECIO, STOCK, ALERTA FROM PRODUCTOS"))
+        if productos is None:
             print("\n❌ No hay productos registrados.")
             return
         imprimir_productos(productos)
@@ -399,18 +400,19 @@ def _actualizar_y_registrar_log(producto_original, campo, nuevo_valor):
     # Función centralizada que actualiza la BD y registra el cambio en el log.
 
     codigo_original = producto_original["CODIGO"]
-    actualizacion_exitosa = _actualizar_producto_db(codigo_original, campo, nuevo_valor)
-
-    if not actualizacion_exitosa:
-        # Si la actualización falló (sea por seguridad o integridad), los errores ya fueron impresos.
-        # Por ejemplo, si _actualizar_producto_db falla por la lista blanca, imprime:
-        # "❌ ERROR de seguridad: El campo 'GRUPO' no está permitido para ser actualizado."
-        # y esta función retorna False.
-        return False
 
-    # Si la ejecución a bajo nivel fue True, intentamos registrar la transacción y log.
+    # El cambio y su registro de auditoría van en la misma transacción.
     try:
         with db.transaccion():
+            if not _actualizar_producto_db(codigo_original, campo, nuevo_valor):
+                # Si la actualización falló (sea por seguridad o integridad), los errores ya fueron impresos.
+                # Por ejemplo, si _actualizar_producto_db falla por la lista blanca, imprime:
+                # "❌ ERROR de seguridad: El campo 'GRUPO' no está permitido para ser actualizado."
+                # y esta función retorna False.
+                return False
+            codigo_actual = nuevo_valor if campo == "CODIGO" else codigo_original
+            auditar("PRODUCTO_EDITADO", "PRODUCTO", codigo_actual, campo=campo,
+                    anterior=producto_original[campo] if campo in producto_original.keys() else None, valor=nuevo_valor)
 
             log = (
                 f"[{marca_de_tiempo()}] PRODUCTO EDITADO por {usuarios.sesion.usuario}:\n"
@@ -419,7 +421,8 @@ def _actualizar_y_registrar_log(producto_original, campo, nuevo_valor):
                 f"Alerta: {producto_original['ALERTA']}\n, P.Inmediato: {producto_original['PINMEDIATO']}"
                 f"  Campo modificado -> \"{campo}\": {nuevo_valor}"
             )
-            registrar_log("productos_editados.log", log)
+            registrar_log("productos_editados.log", log, accion="PRODUCTO_EDITADO", usuario=usuarios.sesion.usuario,
+                          producto=codigo_original, campo=campo, valor=nuevo_valor)
         print(f"\n✔ {campo.capitalize()} actualizado correctamente.")
         return True
     except sqlite3.IntegrityError:
@@ -476,6 +479,8 @@ def eliminar_producto():
                 try:
                     with db.transaccion():
                         db.ejecutar("DELETE FROM PRODUCTOS WHERE CODIGO = ?", (codigo,))
+                        auditar("PRODUCTO_ELIMINADO", "PRODUCTO", codigo, nombre=producto["NOMBRE"],
+                                precio=producto["PRECIO"], stock=producto["STOCK"])
                         marca_tiempo = marca_de_tiempo()
                         log = (
                             f"[{marca_tiempo}] PRODUCTO ELIMINADO por {usuarios.sesion.usuario}:\n"
@@ -484,7 +489,8 @@ def eliminar_producto():
                             f"Precio: {producto['PRECIO']} | "
                             f"Stock: {producto['STOCK']}"
                         )
-                        registrar_log("productos_eliminados.log", log)
+                        registrar_log("productos_eliminados.log", log, accion="PRODUCTO_ELIMINADO", usuario=usuarios.sesion.usuario,
+                                      producto=producto["CODIGO"], precio=producto["PRECIO"], stock=producto["STOCK"])
                     print("\n✔ Producto eliminado.")
                     return
                 except sqlite3.IntegrityError:
@@ -1,8 +1,16 @@
-import os
 import usuarios
+from auditoria import ENTIDADES, consultar_auditoria, formatear_auditoria
 from datetime import datetime, date, timedelta
+from itertools import islice
+from bitacora import bitacora
 from db import db
-from utiles import HABITACIONES,pedir_confirmacion, imprimir_huespedes, opcion_menu
+from utiles import HABITACIONES,pedir_confirmacion, imprimir_huespedes, opcion_menu, filas_o_none, formatear_fecha, pedir_fecha_valida
+
+# Los reportes leen de una foto de solo lectura (db.lectura_consistente): cada uno ve la base tal
+# como estaba en su primera consulta y no compite con los checkouts y consumos que se escriben.
+# La foto abarca solo las consultas: una transacción de lectura abierta mientras se espera al usuario
+# no deja hacer checkpoint del WAL, que crece sin límite. reporte_inventario (nivel 0) lee por la
+# conexión de solo lectura desde requiere_acceso.
 
 @usuarios.requiere_acceso(1)
 def reporte_diario():
@@ -12,15 +20,23 @@ def reporte_diario():
     P.NOMBRE AS PRODUCTO, C.CANTIDAD FROM CONSUMOS C
     JOIN HUESPEDES H ON C.HUESPED = H.NUMERO
     JOIN PRODUCTOS P ON C.PRODUCTO = P.CODIGO
-    WHERE C.FECHA LIKE ?
+    WHERE C.DIA = ?
     ORDER BY H.HABITACION, C.FECHA
     """
 
-    consumos = db.obtener_todos(query, (f"{hoy}%",)) 
+    with db.lectura_consistente():
+        if not _imprimir_consumos_del_dia(query, hoy):
+            return
+    print("-" * 50)
+    input("\nPresione Enter para continuar...")
+
+def _imprimir_consumos_del_dia(query, hoy):
+    # Recorre los consumos del día a medida que llegan. Devuelve False si no hubo ninguno.
+    consumos = filas_o_none(db.obtener_iter(query, (hoy,)))
 
-    if not consumos:
+    if consumos is None:
         print(f"\n❌ No se registraron consumos en la fecha de hoy ({date.today().strftime('%d-%m-%Y')}).")
-        return
+        return False
 
     print(f"\nConsumos registrados hoy ({date.today().strftime('%d-%m-%Y')}):")
 
@@ -39,23 +55,24 @@ def reporte_diario():
         hora = datetime.strptime(fecha, "%Y-%m-%d %H:%M:%S").strftime("%H:%M") 
         print(f"  - {hora} {producto} (x{cantidad})")
 
-    print("-" * 50)
-    input("\nPresione Enter para continuar...")
+    return True
 
 @usuarios.requiere_acceso(1)
 def reporte_abiertos():
     fecha = date.today()
     fecha_iso = fecha.isoformat()
     query_vencidos = "SELECT * FROM HUESPEDES WHERE ESTADO = 'ABIERTO' AND CHECKOUT <= ? ORDER BY CAST(HABITACION AS INTEGER)"
-    vencidos = db.obtener_todos(query_vencidos, (fecha_iso,))
+    query = "SELECT * FROM HUESPEDES WHERE ESTADO = ? ORDER BY CAST(HABITACION AS INTEGER)"
+    # Las dos consultas en la misma foto, antes de preguntar nada
+    with db.lectura_consistente():
+        vencidos = db.obtener_todos(query_vencidos, (fecha_iso,))
+        huespedes = db.obtener_todos(query, ("ABIERTO",))
     if vencidos:
         respuesta = pedir_confirmacion("\n⚠️  ¡¡¡Atención!!! ⚠️ \nSe encontraron huéspedes abiertos con checkout vencido.\n¿Desea verlos? (si/no): ")
         if respuesta == "si":
             print("\n⚠️  Huéspedes con checkout vencido:\n")
             imprimir_huespedes(vencidos)
             return
-    query = "SELECT * FROM HUESPEDES WHERE ESTADO = ? ORDER BY CAST(HABITACION AS INTEGER)"
-    huespedes = db.obtener_todos(query, ("ABIERTO",))
     if huespedes:
         print("\nHuéspedes abiertos:\n")
         imprimir_huespedes(huespedes)
@@ -80,7 +97,10 @@ def reporte_cerrados():
             break
     fecha_iso = fecha.isoformat()
     query = "SELECT * FROM HUESPEDES WHERE ESTADO = 'CERRADO' AND CHECKOUT = ? ORDER BY CAST(HABITACION AS INTEGER)"
-    cerrados = db.obtener_todos(query, (fecha_iso,))
+    query_vencidos = "SELECT * FROM HUESPEDES WHERE ESTADO = 'ABIERTO' AND CHECKOUT <= ? ORDER BY CAST(HABITACION AS INTEGER)"
+    with db.lectura_consistente():
+        cerrados = db.obtener_todos(query, (fecha_iso,))
+        vencidos = db.obtener_todos(query_vencidos, (fecha_iso,)) if not cerrados else None
 
     if cerrados:
         print(f"\nHuéspedes cerrados el {fecha.strftime('%d-%m-%Y')}:\n")
@@ -88,9 +108,6 @@ def reporte_cerrados():
         input("\nPresione Enter para continuar...")
         return
     else:
-        query_vencidos = "SELECT * FROM HUESPEDES WHERE ESTADO = 'ABIERTO' AND CHECKOUT <= ? ORDER BY CAST(HABITACION AS INTEGER)"
-        vencidos = db.obtener_todos(query_vencidos, (fecha_iso,))
-
         if vencidos:
             respuesta = pedir_confirmacion("\n⚠️ ¡¡¡Atención!!! ⚠️\nNo se encontraron huéspedes cerrados pero HAY HUÉSPEDES CON CHECKOUT VENCIDO\n¿Desea verlos? (si/no): ")
             if respuesta == "si":
@@ -109,7 +126,8 @@ def reporte_pronto_checkin():
     manana_iso = manana.isoformat()
 
     query = "SELECT * FROM HUESPEDES WHERE ESTADO = 'PROGRAMADO' AND CHECKIN IN (?, ?)"
-    huespedes = db.obtener_todos(query, (hoy_iso, manana_iso))
+    with db.lectura_consistente():
+        huespedes = db.obtener_todos(query, (hoy_iso, manana_iso))
 
     if huespedes:
         print("\nHuéspedes con check-in programado proximamente:")
@@ -159,11 +177,12 @@ def reporte_ocupacion():
             ANCHO_ETIQUETA = len(label_base)
 
     # Traer huéspedes abiertos y programados
-    huespedes = db.obtener_todos("""
-        SELECT NUMERO, NOMBRE, APELLIDO, HABITACION, CHECKIN, CHECKOUT, ESTADO
-        FROM HUESPEDES
-        WHERE ESTADO IN ('ABIERTO', 'PROGRAMADO')
-    """)
+    with db.lectura_consistente():
+        huespedes = db.obtener_todos("""
+            SELECT NUMERO, NOMBRE, APELLIDO, HABITACION, CHECKIN, CHECKOUT, ESTADO
+            FROM HUESPEDES
+            WHERE ESTADO IN ('ABIERTO', 'PROGRAMADO')
+        """)
 
     # Inicializar mapa de ocupación (habitaciones 1..7)
     ocupacion = {hab: [" . " for _ in range(dias)] for hab in range(1, 8)}
@@ -245,27 +264,128 @@ def _marcar_reserva_en_mapa(ocupacion, h, hoy, dias):
 
     return True
 
+ENTRADAS_POR_PAGINA_LOG = 10
+RESULTADOS_BUSQUEDA_LOGS = 50
+
+LOGS = {
+    1: "consumos_cortesia.log", 
+    2: "consumos_eliminados.log", 
+    3: "huespedes_cerrados.log", 
+    4: "huespedes_eliminados.log", 
+    5: "productos_editados.log",
+    6: "checkins.log" 
+}
+
+def _mostrar_log(nombre_archivo):
+    # Muestra el log de lo más nuevo a lo más viejo, de a una página. Solo se lee del archivo
+    # lo que se muestra: el final primero y, a pedido, las entradas anteriores o las de otra fecha.
+    desde = hasta = None
+    while True:
+        entradas = bitacora.leer_recientes(nombre_archivo, desde, hasta)
+        rango = f" ({formatear_fecha(desde) if desde else '...'} a {formatear_fecha(hasta) if hasta else 'hoy'})" if desde or hasta else ""
+        print(f"\n📄 {nombre_archivo}{rango}, de lo más reciente a lo más antiguo:\n")
+        mostradas = 0
+        while True:
+            pagina = list(islice(entradas, ENTRADAS_POR_PAGINA_LOG))
+            if not pagina:
+                print("(No hay más entradas.)" if mostradas else "❌ No hay entradas para esas fechas.")
+            for entrada in pagina:
+                mostradas += 1
+                print(f"{mostradas}. {entrada['texto']}")
+                print("-" * 60)
+            leyenda = "\n(Enter) entradas anteriores, (F) ir a una fecha ó (0) volver: " if pagina else "\n(F) ir a una fecha ó (0) volver: "
+            respuesta = input(leyenda).strip().lower()
+            if respuesta == "f":
+                break
+            if respuesta == "0" or not pagina:
+                entradas.close()
+                return
+        # Ir a una fecha: se vuelve a empezar desde ahí sin leer lo posterior
+        entradas.close()
+        hasta = pedir_fecha_valida("Mostrar hasta la fecha (DD-MM-YYYY) ó (Enter) hasta hoy: ", allow_past=True, confirmacion=False, vacio=True) or None
+        desde = pedir_fecha_valida("Desde la fecha (DD-MM-YYYY) ó (Enter) sin límite: ", allow_past=True, confirmacion=False, vacio=True) or None
+
 @usuarios.requiere_acceso(2)
 def ver_logs():
     leyenda = "\n¿Qué log querés ver?\n1. Consumos de cortesía\n2. Consumos eliminados\n3. Huéspedes cerrados\n4. Huéspedes eliminados\n5. Productos editados\n6. Check-ins realizados\nó 0. Cancelar\n"
-    
-    logs = {
-        1: "consumos_cortesia.log", 
-        2: "consumos_eliminados.log", 
-        3: "huespedes_cerrados.log", 
-        4: "huespedes_eliminados.log", 
-        5: "productos_editados.log",
-        6: "checkins.log" 
-    }
+    logs = LOGS
     while True:
         opcion = opcion_menu(leyenda, cero=True, minimo=1, maximo=6)
         if opcion == 0:
             return
         elif opcion in logs:
-            path = os.path.join("logs", logs[opcion])
-            if os.path.exists(path):
-                with open(path, encoding="utf-8") as f:
-                    print("\n" + f.read())
-                input("\nPresione Enter para continuar...")
+            bitacora.vaciar()  # que se vea también lo que todavía estaba en cola
+            if bitacora.segmentos(logs[opcion]):
+                _mostrar_log(logs[opcion])
             else:
-                print("\n❌ No se encontró el archivo de log.")
\ No newline at end of file
+                print("\n❌ No se encontró el archivo de log.")
+
+def consultar_logs(log=None, desde=None, hasta=None, usuario=None, habitacion=None, huesped=None,
+                   producto=None, accion=None, limite=RESULTADOS_BUSQUEDA_LOGS):
+    # Busca en todos los logs (incluidos los segmentos rotados) usando el índice de la bitácora,
+    # sin recorrer los archivos. Ej: consultar_logs("consumos_eliminados.log", habitacion=5, desde="2026-10-01")
+    bitacora.vaciar()
+    return bitacora.indice.buscar(log=log, desde=desde, hasta=hasta, usuario=usuario, habitacion=habitacion,
+                                  huesped=huesped, producto=producto, accion=accion, limite=limite)
+
+@usuarios.requiere_acceso(2)
+def buscar_en_logs():
+    leyenda = ("\n¿En qué log buscar?\n1. Consumos de cortesía\n2. Consumos eliminados\n3. Huéspedes cerrados\n"
+               "4. Huéspedes eliminados\n5. Productos editados\n6. Check-ins realizados\n(Enter) Todos ó 0. Cancelar\n")
+    opcion = opcion_menu(leyenda, cero=True, vacio=True, minimo=1, maximo=len(LOGS))
+    if opcion == 0:
+        return
+    log = LOGS[opcion] if opcion else None
+
+    print("\nDejá vacío (Enter) cualquier filtro que no quieras usar.")
+    usuario = input("Usuario: ").strip() or None
+    habitacion = opcion_menu("Habitación: ", vacio=True, minimo=0)
+    huesped = opcion_menu("Número de huésped: ", vacio=True, minimo=1)
+    producto = opcion_menu("Código de producto: ", vacio=True, minimo=0)
+    desde = pedir_fecha_valida("Desde (DD-MM-YYYY): ", allow_past=True, confirmacion=False, vacio=True) or None
+    hasta = pedir_fecha_valida("Hasta (DD-MM-YYYY): ", allow_past=True, confirmacion=False, vacio=True) or None
+
+    resultados = consultar_logs(log, desde, hasta, usuario, habitacion, huesped, producto)
+    if not resultados:
+        print("\n❌ No hay entradas que coincidan.")
+        return
+    print(f"\n🔎 {len(resultados)} entrada(s), de la más reciente a la más antigua"
+          f"{f' (se muestran las primeras {RESULTADOS_BUSQUEDA_LOGS})' if len(resultados) == RESULTADOS_BUSQUEDA_LOGS else ''}:\n")
+    for entrada in resultados:
+        print(f"[{entrada['log']}] {entrada['texto']}")
+        print("-" * 60)
+    input("\nPresione Enter para continuar...")
+
+@usuarios.requiere_acceso(2)
+def ver_auditoria():
+    # Consulta paginada de la tabla AUDITORIA, del registro más nuevo al más viejo
+    leyenda = ("\n¿Qué entidad revisar?\n" + "\n".join(f"{i}. {entidad.title()}" for i, entidad in enumerate(ENTIDADES, 1))
+               + "\n(Enter) Todas ó 0. Cancelar\n")
+    opcion = opcion_menu(leyenda, cero=True, vacio=True, minimo=1, maximo=len(ENTIDADES))
+    if opcion == 0:
+        return
+    entidad = ENTIDADES[opcion - 1] if opcion else None
+
+    print("\nDejá vacío (Enter) cualquier filtro que no quieras usar.")
+    entidad_id = opcion_menu("Número o código de la entidad: ", vacio=True, minimo=0) if entidad else None
+    usuario = input("Usuario: ").strip() or None
+    accion = input("Acción (ej: CHECKOUT): ").strip().upper() or None
+    desde = pedir_fecha_valida("Desde (DD-MM-YYYY): ", allow_past=True, confirmacion=False, vacio=True) or None
+    hasta = pedir_fecha_valida("Hasta (DD-MM-YYYY): ", allow_past=True, confirmacion=False, vacio=True) or None
+
+    antes_de = None
+    mostrados = 0
+    while True:
+        filas, hay_mas = consultar_auditoria(usuario, accion, entidad, entidad_id or None, desde, hasta, antes_de)
+        if not filas and mostrados == 0:
+            print("\n❌ No hay registros de auditoría que coincidan.")
+            return
+        for fila in filas:
+            mostrados += 1
+            print(f"{mostrados}. {formatear_auditoria(fila)}")
+        if not hay_mas:
+            break
+        antes_de = (filas[-1]["FECHA"], filas[-1]["ID"])
+        if opcion_menu("\n(Enter) para ver más antiguos ó (0) para salir: ", cero=True, vacio=True, maximo=0) == 0:
+            return
+    input("\nPresione Enter para continuar...")
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import sys
+import time
+import usuarios
+from datetime import datetime
+from db import db
+from utiles import registrar_log, marca_de_tiempo
+
+# Respaldos en caliente de la base, con la API de backup de SQLite (ver DBManager.respaldar).
+# A diferencia de copiar el .db a mano, la copia es consistente aunque alguien esté escribiendo.
+CARPETA_RESPALDOS = "respaldos"
+RESPALDOS_A_CONSERVAR = 10
+PAGINAS_POR_PASO = 256      # ~1 MB por paso con páginas de 4 KB
+PAUSA_ENTRE_PASOS = 0.005   # segundos; deja pasar a las escrituras de recepción entre pasos
+PREFIJO = "BaseDeDatos_"
+
+def _verificar_integridad(ruta):
+    # Devuelve la lista de problemas que informa PRAGMA integrity_check (vacía si está bien).
+    conn = sqlite3.connect(ruta)
+    try:
+        resultado = [fila[0] for fila in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if resultado == ["ok"] else resultado
+
+def _rotar(carpeta, conservar):
+    # Borra los respaldos más viejos y deja solo los 'conservar' más recientes.
+    # El nombre lleva la fecha en formato ordenable, así que alcanza con ordenar por nombre.
+    # Con conservar = 0 no se borra ninguno.
+    respaldos = sorted(f for f in os.listdir(carpeta) if f.startswith(PREFIJO) and f.endswith(".db"))
+    sobrantes = respaldos[:-conservar] if conservar > 0 else []
+    borrados = []
+    for nombre in sobrantes:
+        os.remove(os.path.join(carpeta, nombre))
+        borrados.append(nombre)
+    return borrados
+
+def crear_respaldo(carpeta=CARPETA_RESPALDOS, conservar=RESPALDOS_A_CONSERVAR, mostrar_progreso=False):
+    """
+    Genera un respaldo con fecha y hora en 'carpeta', lo verifica con integrity_check y rota
+    los anteriores. Devuelve un diccionario con ruta, tamaño, segundos y MB/s.
+    Si la verificación falla, descarta la copia y lanza RuntimeError.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    nombre = f"{PREFIJO}{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    ruta = os.path.join(carpeta, nombre)
+    parcial = ruta + ".parcial"  # no cuenta como respaldo hasta estar verificado
+
+    def progreso(restantes, total):
+        if total:
+            print(f"\r   Copiando... {100 * (total - restantes) // total}%", end="", flush=True)
+
+    inicio = time.perf_counter()
+    try:
+        reinicios = db.respaldar(parcial, PAGINAS_POR_PASO, PAUSA_ENTRE_PASOS, progreso if mostrar_progreso else None)
+        if mostrar_progreso:
+            print()
+        problemas = _verificar_integridad(parcial)
+        if problemas:
+            raise RuntimeError(f"La copia no pasó la verificación de integridad: {'; '.join(problemas[:5])}")
+        os.replace(parcial, ruta)
+    except Exception:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+    segundos = time.perf_counter() - inicio
+
+    tamano = os.path.getsize(ruta)
+    return {
+        "ruta": ruta,
+        "bytes": tamano,
+        "segundos": segundos,
+        "mb_por_segundo": tamano / 1024 / 1024 / segundos if segundos > 0 else 0.0,
+        "reinicios": reinicios,
+        "borrados": _rotar(carpeta, conservar),
+    }
+
+def _informar(resultado):
+    print(f"\n✔ Respaldo creado y verificado: {resultado['ruta']}")
+    print(f"   {resultado['bytes'] / 1024 / 1024:.2f} MB en {resultado['segundos']:.2f} s "
+          f"({resultado['mb_por_segundo']:.1f} MB/s)")
+    if resultado["borrados"]:
+        print(f"   Se eliminaron {len(resultado['borrados'])} respaldos antiguos.")
+
+@usuarios.requiere_acceso(2)
+def respaldar_base():
+    try:
+        resultado = crear_respaldo(mostrar_progreso=True)
+    except Exception as e:
+        print(f"\n❌ No se pudo crear el respaldo: {e}")
+        return
+    _informar(resultado)
+    registrar_log("respaldos.log", (
+        f"[{marca_de_tiempo()}] RESPALDO por {usuarios.sesion.usuario}: {resultado['ruta']} | "
+        f"{resultado['bytes']} bytes en {resultado['segundos']:.2f} s"
+    ), accion="RESPALDO", usuario=usuarios.sesion.usuario, ruta=resultado["ruta"],
+       bytes=resultado["bytes"], segundos=round(resultado["segundos"], 2))
+
+if __name__ == "__main__":
+    # Uso no interactivo (ej: tarea programada): python respaldos.py [carpeta] [cantidad_a_conservar]
+    carpeta = sys.argv[1] if len(sys.argv) > 1 else CARPETA_RESPALDOS
+    conservar = int(sys.argv[2]) if len(sys.argv) > 2 else RESPALDOS_A_CONSERVAR
+    try:
+        _informar(crear_respaldo(carpeta, conservar))
+    except Exception as e:
+        print(f"❌ No se pudo crear el respaldo: {e}")
+        sys.exit(1)
+    finally:
+        db.cerrar()
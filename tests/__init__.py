@@ -0,0 +1,12 @@
+# db.py crea BaseDeDatos.db y bitacora.py la carpeta logs/ en el directorio actual apenas se importan:
+# las pruebas corren en una carpeta temporal para no tocar la base ni los logs reales.
+# Correr desde la raíz del repositorio:  python -m unittest discover -v
+
+import atexit
+import os
+import shutil
+import tempfile
+
+CARPETA_PRUEBAS = tempfile.mkdtemp(prefix="sablabla-pruebas-")
+os.chdir(CARPETA_PRUEBAS)
+atexit.register(shutil.rmtree, CARPETA_PRUEBAS, ignore_errors=True)
@@ -0,0 +1,61 @@
+# Bitácora: varios escritores (terminales) sobre la misma carpeta de logs.
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from bitacora import Bitacora
+
+ENTRADAS_POR_ESCRITOR = 100
+
+class TestVariosEscritores(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp(dir=os.getcwd())
+
+    def test_la_rotacion_no_pierde_entradas_de_otro_escritor(self):
+        # Cada instancia tiene sus propios archivos abiertos, como dos procesos; los logs chicos hacen que
+        # roten (y se compriman los segmentos) mientras el otro escribe
+        escritores = [Bitacora(self.carpeta, lineas_por_lote=4, tamano_maximo=2000, rotar_por_dia=False)
+                      for _ in range(2)]
+
+        def escribir(numero, escritor):
+            for i in range(ENTRADAS_POR_ESCRITOR):
+                escritor.registrar("prueba.log", f"escritor {numero} entrada {i}")
+                if i % 4 == 3:
+                    escritor.vaciar()
+
+        hilos = [threading.Thread(target=escribir, args=(numero, escritor)) for numero, escritor in enumerate(escritores)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        for escritor in escritores:
+            escritor.cerrar()
+
+        lector = Bitacora(self.carpeta)
+        textos = [entrada["texto"] for entrada in lector.leer("prueba.log")]
+        self.assertGreater(len(lector.segmentos("prueba.log")), 2)
+        self.assertEqual(sorted(textos), sorted(f"escritor {numero} entrada {i}" for numero in range(2)
+                                                for i in range(ENTRADAS_POR_ESCRITOR)))
+        # El índice también las tiene todas
+        self.assertEqual(len(lector.indice.buscar(log="prueba.log", limite=1000)), 2 * ENTRADAS_POR_ESCRITOR)
+        lector.cerrar()
+
+    def test_si_no_se_puede_rotar_se_sigue_escribiendo(self):
+        # En Windows no se puede renombrar un archivo que otro proceso tiene abierto: el lote no se pierde
+        escritor = Bitacora(self.carpeta, lineas_por_lote=4, tamano_maximo=200, rotar_por_dia=False)
+        with mock.patch("bitacora.os.replace", side_effect=PermissionError("en uso")):
+            for i in range(20):
+                escritor.registrar("prueba.log", f"entrada {i}")
+            escritor.vaciar()
+        self.assertEqual([entrada["texto"] for entrada in escritor.leer("prueba.log")], [f"entrada {i}" for i in range(20)])
+
+        # Cuando se puede, rota
+        escritor.registrar("prueba.log", "entrada 20")
+        escritor.cerrar()
+        self.assertEqual(len(escritor.segmentos("prueba.log")), 2)
+        self.assertEqual(len(list(escritor.leer("prueba.log"))), 21)
+
+if __name__ == "__main__":
+    unittest.main()
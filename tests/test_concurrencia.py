@@ -0,0 +1,185 @@
+# Varias terminales (procesos) escribiendo sobre la misma base, y transacciones interrumpidas.
+
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+import huespedes
+import usuarios
+from db import DBManager, db
+from migraciones import aplicar_migraciones
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TERMINALES = 4
+VENTAS_POR_TERMINAL = 25
+STOCK_INICIAL = 1000
+
+# Cada proceso importa los módulos de la aplicación con la carpeta de la prueba como directorio actual,
+# igual que una terminal abriendo BaseDeDatos.db.
+_PREPARAR = """
+from db import db
+from migraciones import aplicar_migraciones
+aplicar_migraciones()
+db.ejecutar_lote("INSERT INTO PRODUCTOS (CODIGO, NOMBRE, PRECIO, STOCK, GRUPO) VALUES (?, ?, ?, ?, ?)", [
+    (1, "agua", 5, {stock}, None), (2, "cerveza lata", 8, {stock}, "cerveza"), (3, "cerveza botella", 9, {stock}, "cerveza")])
+db.ejecutar("INSERT INTO HUESPEDES (APELLIDO, NOMBRE, ESTADO, CHECKIN, CHECKOUT, HABITACION) "
+            "VALUES ('perez', 'juan', 'ABIERTO', '2026-10-01', '2026-10-30', 5)")
+db.cerrar()
+"""
+
+_TERMINAL = """
+import json, sys, time
+import consumos, usuarios
+from db import db
+terminal, ventas, inicio = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+usuarios.sesion.iniciar(f"terminal{terminal}", 1)
+while time.time() < inicio:  # todas arrancan juntas
+    time.sleep(0.005)
+for _ in range(ventas):
+    consumos._escribir_consumos([
+        {"huesped_id": 1, "codigo": 1, "nombre": "agua", "cantidad": 1, "pagado": 0, "stock_anterior": 0},
+        {"huesped_id": 1, "codigo": 2, "nombre": "cerveza lata", "cantidad": 1, "pagado": 0, "stock_anterior": 0},
+    ], 1)
+contencion = db.estadisticas_contencion()
+db.cerrar()
+print(json.dumps(contencion))
+"""
+
+def _entorno():
+    entorno = dict(os.environ)
+    entorno["PYTHONPATH"] = RAIZ + os.pathsep + entorno.get("PYTHONPATH", "")
+    return entorno
+
+class TestTerminalesConcurrentes(unittest.TestCase):
+    def setUp(self):
+        self.carpeta = tempfile.mkdtemp(dir=os.getcwd())
+        subprocess.run([sys.executable, "-c", _PREPARAR.format(stock=STOCK_INICIAL)],
+                       cwd=self.carpeta, env=_entorno(), check=True, capture_output=True)
+
+    def test_ninguna_terminal_pierde_ventas(self):
+        inicio = time.time() + 1.5
+        procesos = [
+            subprocess.Popen([sys.executable, "-c", _TERMINAL, str(n), str(VENTAS_POR_TERMINAL), str(inicio)],
+                             cwd=self.carpeta, env=_entorno(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for n in range(TERMINALES)
+        ]
+        fallos = 0
+        for proceso in procesos:
+            salida, errores = proceso.communicate(timeout=120)
+            self.assertEqual(proceso.returncode, 0, errores)
+            contencion = json.loads(salida.strip().splitlines()[-1])
+            fallos += contencion["fallos"]
+        self.assertEqual(fallos, 0)
+
+        ventas = TERMINALES * VENTAS_POR_TERMINAL
+        conn = sqlite3.connect(os.path.join(self.carpeta, "BaseDeDatos.db"))
+        try:
+            stock = dict(conn.execute("SELECT CODIGO, STOCK FROM PRODUCTOS"))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM CONSUMOS").fetchone()[0], 2 * ventas)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM HUESPED_EVENTOS WHERE TIPO = 'CONSUMO'").fetchone()[0],
+                             2 * ventas)
+        finally:
+            conn.close()
+        # Descuentos relativos: ninguna terminal pisa lo que descontó otra, y el grupo baja entero
+        self.assertEqual(stock, {1: STOCK_INICIAL - ventas, 2: STOCK_INICIAL - ventas, 3: STOCK_INICIAL - ventas})
+
+class TestTransaccionInterrumpida(unittest.TestCase):
+    # Ctrl+C (o una tarea cancelada) dentro de 'transaccion' no puede dejarla abierta con el candado tomado
+    def setUp(self):
+        self.ruta = os.path.join(tempfile.mkdtemp(dir=os.getcwd()), "base.db")
+        self.base = DBManager(self.ruta)
+        self.base.ejecutar("CREATE TABLE P (C INTEGER PRIMARY KEY, S INTEGER)")
+        self.base.ejecutar("INSERT INTO P VALUES (1, 7)")
+
+    def tearDown(self):
+        self.base.cerrar()
+
+    def _stock_en_disco(self):
+        conn = sqlite3.connect(self.ruta)
+        try:
+            return conn.execute("SELECT S FROM P").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_keyboard_interrupt_revierte_y_libera(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with self.base.transaccion():
+                self.base.ejecutar("UPDATE P SET S = 99")
+                raise KeyboardInterrupt
+        self.assertEqual(self._stock_en_disco(), 7)
+
+        # Lo que sigue se confirma de verdad, y se pueden abrir nuevas transacciones
+        self.base.ejecutar("UPDATE P SET S = 56")
+        self.assertEqual(self._stock_en_disco(), 56)
+        with self.base.transaccion():
+            self.base.ejecutar("UPDATE P SET S = S + 1")
+        self.assertEqual(self._stock_en_disco(), 57)
+
+class TestCheckoutConOtraTerminal(unittest.TestCase):
+    # Mientras el checkout espera la respuesta de cobro, otra terminal tiene que poder escribir.
+    # Usa la base global de la aplicación (habitación 7 y producto 50, que no usan las otras pruebas).
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migraciones()
+        db.ejecutar("INSERT OR IGNORE INTO PRODUCTOS (CODIGO, NOMBRE, PRECIO, STOCK) VALUES (50, 'te', 4, 100)")
+        usuarios.sesion.iniciar("tester", 3)
+
+    def setUp(self):
+        self.numero = db.ejecutar("INSERT INTO HUESPEDES (APELLIDO, NOMBRE, ESTADO, CHECKIN, CHECKOUT, HABITACION) "
+                                  "VALUES ('diaz', 'ana', 'ABIERTO', '2026-10-01', '2026-10-30', 7)")
+        db.ejecutar("INSERT INTO CONSUMOS (HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO) "
+                    "VALUES (?, 50, 2, '2026-10-02 10:00:00', 0)", (self.numero,))
+
+    def tearDown(self):
+        # Si el checkout no se hizo, la habitación queda libre para la próxima prueba
+        db.ejecutar("UPDATE HUESPEDES SET ESTADO = 'CERRADO', HABITACION = 0 WHERE NUMERO = ?", (self.numero,))
+
+    def _checkout_con_otra_terminal(self, escritura):
+        # Responde las preguntas del checkout; en la de cobro, otra conexión (otra terminal) ejecuta 'escritura'
+        # sin esperar el bloqueo: si el checkout lo tuviera tomado, fallaría con "database is locked".
+        def responder(pregunta=""):
+            if "pagados" in pregunta:
+                otra = sqlite3.connect(db._path, timeout=0.2)
+                try:
+                    otra.execute(*escritura)
+                    otra.commit()
+                finally:
+                    otra.close()
+            return "si"
+
+        with mock.patch("builtins.input", side_effect=lambda pregunta="": "7" if "habitación a cerrar" in pregunta
+                        else responder(pregunta)), contextlib.redirect_stdout(io.StringIO()) as salida:
+            huespedes.realizar_checkout()
+        return salida.getvalue()
+
+    def _estado(self):
+        return db.obtener_uno("SELECT ESTADO FROM HUESPEDES WHERE NUMERO = ?", (self.numero,))["ESTADO"]
+
+    def test_otra_terminal_escribe_mientras_se_pregunta_el_cobro(self):
+        self._checkout_con_otra_terminal(("UPDATE PRODUCTOS SET STOCK = STOCK + 1 WHERE CODIGO = 50",))
+
+        self.assertEqual(self._estado(), "CERRADO")
+        impagos = db.obtener_uno("SELECT COUNT(*) AS N FROM CONSUMOS WHERE HUESPED = ? AND PAGADO = 0", (self.numero,))
+        self.assertEqual(impagos["N"], 0)
+
+    def test_un_consumo_nuevo_durante_la_pregunta_cancela_el_cierre(self):
+        # No se cobra un total distinto del que se le mostró al usuario
+        salida = self._checkout_con_otra_terminal((
+            "INSERT INTO CONSUMOS (HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO) VALUES (?, 50, 1, '2026-10-02 11:00:00', 0)",
+            (self.numero,)))
+
+        self.assertIn("cambiaron", salida)
+        self.assertEqual(self._estado(), "ABIERTO")
+        impagos = db.obtener_uno("SELECT COUNT(*) AS N FROM CONSUMOS WHERE HUESPED = ? AND PAGADO = 0", (self.numero,))
+        self.assertEqual(impagos["N"], 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# DBManager: conexiones por hilo, lecturas consistentes y respaldos en caliente.
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from db import DBManager
+
+class _BaseDB(unittest.TestCase):
+    def setUp(self):
+        self.ruta = os.path.join(tempfile.mkdtemp(dir=os.getcwd()), "base.db")
+        self.base = DBManager(self.ruta)
+
+    def tearDown(self):
+        self.base.cerrar()
+
+    def _en_hilo(self, funcion):
+        # Corre 'funcion' en un hilo nuevo y espera a que termine; devuelve su resultado.
+        resultado = []
+        hilo = threading.Thread(target=lambda: resultado.append(funcion()))
+        hilo.start()
+        hilo.join()
+        return resultado[0]
+
+class TestConexionesPorHilo(_BaseDB):
+    def test_se_cierran_las_conexiones_de_hilos_terminados(self):
+        def usar_base():
+            self.base.obtener_uno("SELECT 1")
+            return self.base._conn
+
+        vieja = self._en_hilo(usar_base)
+        nueva = self._en_hilo(usar_base)
+
+        # La del primer hilo se cerró al abrir la del segundo (que pudo recibir el mismo id de hilo)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            vieja.execute("SELECT 1")
+        self.assertNotIn(vieja, self.base._conexiones.values())
+        self.assertIn(nueva, self.base._conexiones.values())
+        self.assertEqual(len(self.base._conexiones), 2)  # la del hilo principal y la del segundo
+
+class TestLecturaConsistente(_BaseDB):
+    def setUp(self):
+        super().setUp()
+        self.base.ejecutar("CREATE TABLE P (C INTEGER PRIMARY KEY, S INTEGER)")
+        self.base.ejecutar("INSERT INTO P VALUES (1, 7)")
+
+    def _stock(self):
+        return self.base.obtener_uno("SELECT S FROM P WHERE C = 1")["S"]
+
+    def test_la_foto_no_ve_escrituras_de_otros(self):
+        with self.base.lectura_consistente():
+            self.assertEqual(self._stock(), 7)
+            self._en_hilo(lambda: self.base.ejecutar("UPDATE P SET S = 8"))
+            self.assertEqual(self._stock(), 7)
+        self.assertEqual(self._stock(), 8)
+
+    def test_una_transaccion_dentro_de_la_foto_ve_sus_propias_escrituras(self):
+        for foto in (True, False):
+            with self.base.lectura_consistente(foto=foto):
+                antes = self._stock()
+                with self.base.transaccion():
+                    self.base.ejecutar("UPDATE P SET S = S + 1")
+                    self.assertEqual(self._stock(), antes + 1)
+                    self.assertEqual(len(self.base.obtener_todos("SELECT S FROM P WHERE S = ?", (antes + 1,))), 1)
+                    self.assertEqual([fila["S"] for fila in self.base.obtener_iter("SELECT S FROM P")], [antes + 1])
+
+class TestRespaldar(_BaseDB):
+    def test_pausa_entre_pasos(self):
+        # ~100 páginas de 4 KiB: con 10 páginas por paso son unos 10 pasos, y entre cada uno se duerme la pausa
+        self.base.ejecutar("CREATE TABLE DATOS (ID INTEGER PRIMARY KEY, RELLENO BLOB)")
+        self.base.ejecutar_lote("INSERT INTO DATOS (RELLENO) VALUES (?)", [(bytes(4000),) for _ in range(100)])
+        pasos = []
+        destino = os.path.join(os.path.dirname(self.ruta), "copia.db")
+
+        inicio = time.perf_counter()
+        self.base.respaldar(destino, paginas_por_paso=10, pausa=0.02, progreso=lambda restantes, total: pasos.append(restantes))
+        duracion = time.perf_counter() - inicio
+
+        self.assertGreaterEqual(len(pasos), 5)
+        pausas = sum(1 for restantes in pasos if restantes > 0)  # después del último paso no se espera
+        self.assertGreaterEqual(duracion, pausas * 0.02 * 0.9)
+        copia = sqlite3.connect(destino)
+        try:
+            self.assertEqual(copia.execute("SELECT COUNT(*) FROM DATOS").fetchone()[0], 100)
+        finally:
+            copia.close()
+
+if __name__ == "__main__":
+    unittest.main()
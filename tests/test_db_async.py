@@ -0,0 +1,178 @@
+# AsyncDBManager: escrituras concurrentes, tareas canceladas a mitad de transacción y lecturas en paralelo.
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from db_async import AsyncDBManager
+
+SALDO_TOTAL = 1000
+
+class _BaseAsync(unittest.IsolatedAsyncioTestCase):
+    lectores = 4
+
+    async def asyncSetUp(self):
+        self.ruta = os.path.join(tempfile.mkdtemp(dir=os.getcwd()), "base.db")
+        self.base = AsyncDBManager(self.ruta, lectores=self.lectores)
+        # Dos cuentas: cada transacción pasa una unidad de A a B, así A + B delata una transacción a medias
+        await self.base.ejecutar("CREATE TABLE CUENTAS (NOMBRE TEXT PRIMARY KEY, SALDO INTEGER NOT NULL)")
+        await self.base.ejecutar_lote("INSERT INTO CUENTAS VALUES (?, ?)", [("A", SALDO_TOTAL), ("B", 0)])
+
+    async def asyncTearDown(self):
+        await self.base.cerrar()
+
+    def _saldos_en_disco(self):
+        # Conexión aparte: solo ve lo confirmado
+        conn = sqlite3.connect(self.ruta)
+        try:
+            return dict(conn.execute("SELECT NOMBRE, SALDO FROM CUENTAS"))
+        finally:
+            conn.close()
+
+    async def _transferir(self, unidades=1):
+        async with self.base.transaccion() as tx:
+            await tx.ejecutar("UPDATE CUENTAS SET SALDO = SALDO - ? WHERE NOMBRE = 'A'", (unidades,))
+            await tx.ejecutar("UPDATE CUENTAS SET SALDO = SALDO + ? WHERE NOMBRE = 'B'", (unidades,))
+
+    async def _sigue_funcionando(self):
+        # Después de cualquier cancelación: las escrituras sueltas se confirman y se puede abrir otra transacción
+        antes = self._saldos_en_disco()
+        await self.base.ejecutar("UPDATE CUENTAS SET SALDO = SALDO + 1 WHERE NOMBRE = 'A'")
+        await self.base.ejecutar("UPDATE CUENTAS SET SALDO = SALDO - 1 WHERE NOMBRE = 'A'")
+        await asyncio.wait_for(self._transferir(), timeout=5)
+        despues = self._saldos_en_disco()
+        self.assertEqual(despues, {"A": antes["A"] - 1, "B": antes["B"] + 1})
+
+class TestEscriturasConcurrentes(_BaseAsync):
+    async def test_transacciones_y_escrituras_sueltas_mezcladas(self):
+        async def leer():
+            fila = await self.base.obtener_uno("SELECT SUM(SALDO) AS TOTAL FROM CUENTAS")
+            return fila["TOTAL"]
+
+        tareas = [self._transferir() for _ in range(50)]
+        tareas += [self.base.ejecutar("UPDATE CUENTAS SET SALDO = SALDO + 0 WHERE NOMBRE = 'B'") for _ in range(50)]
+        tareas += [leer() for _ in range(50)]
+        resultados = await asyncio.gather(*tareas)
+
+        # Ningún lector vio una transferencia a medias
+        self.assertEqual(set(resultados[100:]), {SALDO_TOTAL})
+        self.assertEqual(self._saldos_en_disco(), {"A": SALDO_TOTAL - 50, "B": 50})
+
+    async def test_error_dentro_del_bloque_revierte(self):
+        with self.assertRaises(ValueError):
+            async with self.base.transaccion() as tx:
+                await tx.ejecutar("UPDATE CUENTAS SET SALDO = 0 WHERE NOMBRE = 'A'")
+                raise ValueError("falla a mitad de la operación")
+        self.assertEqual(self._saldos_en_disco(), {"A": SALDO_TOTAL, "B": 0})
+        await self._sigue_funcionando()
+
+class TestCancelacion(_BaseAsync):
+    async def test_cancelada_dentro_del_bloque_revierte(self):
+        adentro = asyncio.Event()
+
+        async def colgada():
+            async with self.base.transaccion() as tx:
+                await tx.ejecutar("UPDATE CUENTAS SET SALDO = 0 WHERE NOMBRE = 'A'")
+                adentro.set()
+                await asyncio.Event().wait()  # nunca termina: la cancela el test
+
+        tarea = asyncio.create_task(colgada())
+        await adentro.wait()
+        tarea.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await tarea
+
+        self.assertEqual(self._saldos_en_disco(), {"A": SALDO_TOTAL, "B": 0})
+        await self._sigue_funcionando()
+
+    async def test_cancelada_en_cualquier_punto(self):
+        # Cancela cada transferencia tras un número creciente de vueltas del bucle, así el corte cae
+        # mientras se abre, en el medio del bloque o mientras se confirma. Puede confirmarse o no, pero nunca a medias.
+        for vueltas in range(40):
+            tarea = asyncio.create_task(self._transferir())
+            for _ in range(vueltas):
+                await asyncio.sleep(0)
+            tarea.cancel()
+            try:
+                await tarea
+            except asyncio.CancelledError:
+                pass
+
+        saldos = self._saldos_en_disco()
+        self.assertEqual(saldos["A"] + saldos["B"], SALDO_TOTAL)
+        await self._sigue_funcionando()
+
+    async def test_cerrar_espera_los_cierres_pendientes(self):
+        tarea = asyncio.create_task(self._transferir())
+        await asyncio.sleep(0)
+        tarea.cancel()
+        try:
+            await tarea
+        except asyncio.CancelledError:
+            pass
+        await self.base.cerrar()
+        saldos = self._saldos_en_disco()
+        self.assertEqual(saldos["A"] + saldos["B"], SALDO_TOTAL)
+        self.base = AsyncDBManager(self.ruta)  # asyncTearDown vuelve a cerrar
+
+def _consulta_pesada(filas):
+    # Consulta que trabaja de verdad dentro de SQLite (sin tablas ni disco): cuenta hasta 'filas'
+    return (f"WITH RECURSIVE N(X) AS (SELECT 1 UNION ALL SELECT X + 1 FROM N WHERE X < {filas}) "
+            "SELECT SUM(X) AS TOTAL FROM N")
+
+class TestLecturasEnParalelo(unittest.IsolatedAsyncioTestCase):
+    # Rendimiento de las lecturas según la cantidad de hilos lectores, con consultas reales a SQLite
+    LECTURAS = 8
+
+    async def asyncSetUp(self):
+        self.ruta = os.path.join(tempfile.mkdtemp(dir=os.getcwd()), "base.db")
+        base = AsyncDBManager(self.ruta)
+        await base.ejecutar("CREATE TABLE T (X INTEGER)")
+        await base.ejecutar_lote("INSERT INTO T VALUES (?)", [(i,) for i in range(100)])
+        await base.cerrar()
+
+    async def _espera_con_lector_ocupado(self, lectores):
+        # Un lector ocupado con una consulta larga (un reporte pesado) y, mientras tanto, varias lecturas cortas.
+        # Devuelve (segundos que tardaron las cortas, segundos de la larga).
+        base = AsyncDBManager(self.ruta, lectores=lectores)
+        try:
+            inicio = time.perf_counter()
+            pesada = asyncio.create_task(base.obtener_uno(_consulta_pesada(1_000_000)))
+            await asyncio.sleep(0.05)  # la pesada ya está corriendo en un hilo lector
+            inicio_cortas = time.perf_counter()
+            cortas = await asyncio.gather(*(base.obtener_uno("SELECT COUNT(*) AS N FROM T") for _ in range(self.LECTURAS)))
+            espera = time.perf_counter() - inicio_cortas
+            await pesada
+            self.assertEqual({fila["N"] for fila in cortas}, {100})
+            return espera, time.perf_counter() - inicio
+        finally:
+            await base.cerrar()
+
+    async def test_lecturas_cortas_no_esperan_a_una_pesada(self):
+        # Con un solo lector las cortas esperan a que termine la pesada; con varios corren a la par
+        # (sqlite3 suelta el GIL mientras SQLite ejecuta, así que pasa aun con un único núcleo).
+        espera_un_lector, pesada = await self._espera_con_lector_ocupado(1)
+        espera_cuatro_lectores, _ = await self._espera_con_lector_ocupado(4)
+        self.assertGreater(espera_un_lector, (pesada - 0.05) * 0.5)
+        self.assertLess(espera_cuatro_lectores, espera_un_lector / 3)
+
+    @unittest.skipIf((os.cpu_count() or 1) < 2, "hace falta más de un núcleo")
+    async def test_lecturas_pesadas_escalan_con_los_nucleos(self):
+        async def medir(lectores):
+            base = AsyncDBManager(self.ruta, lectores=lectores)
+            try:
+                inicio = time.perf_counter()
+                await asyncio.gather(*(base.obtener_uno(_consulta_pesada(300_000)) for _ in range(self.LECTURAS)))
+                return time.perf_counter() - inicio
+            finally:
+                await base.cerrar()
+
+        lectores = min(4, os.cpu_count())
+        un_lector = await medir(1)
+        varios = await medir(lectores)
+        self.assertGreater(un_lector / varios, 1.3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# Migraciones de datos viejos: el historial en texto (REGISTRO) pasado a eventos.
+
+import contextlib
+import io
+import unittest
+import migraciones
+from db import db
+from migraciones import aplicar_migraciones
+from utiles import formatear_evento
+
+# Entradas como las escribía la versión anterior, cada una con su fecha al final
+_REGISTRO = "\n---\n".join([
+    "CREADO PROGRAMADO - 01-10-2026 09:30",
+    "Consumo agregado: agua (x2) - 2026-10-02 10:15:00 (PAGADO)",
+    "Se modificó NOMBRE a 'ana' - 2026-10-03 11:00:00",
+    "Intercambio: movido a habitación 4 por tester - 04-10-2026 12:45",
+])
+
+class TestRegistroViejo(unittest.TestCase):
+    # Usa la base global de la aplicación (habitación 8, que no usan las otras pruebas)
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migraciones()
+
+    def setUp(self):
+        self.numero = db.ejecutar("INSERT INTO HUESPEDES (APELLIDO, NOMBRE, ESTADO, CHECKIN, CHECKOUT, HABITACION, REGISTRO) "
+                                  "VALUES ('gomez', 'ana', 'CERRADO', '2026-10-01', '2026-10-05', 8, ?)", (_REGISTRO,))
+
+    def _eventos(self):
+        return db.obtener_todos("SELECT * FROM HUESPED_EVENTOS WHERE HUESPED = ? ORDER BY ID", (self.numero,))
+
+    def test_la_fecha_sale_del_detalle(self):
+        migraciones._m004_eventos_de_huespedes()
+        migraciones._m008_fecha_fuera_del_detalle()
+
+        eventos = self._eventos()
+        self.assertEqual([(evento["DETALLE"], evento["FECHA"]) for evento in eventos], [
+            ("CREADO PROGRAMADO", "2026-10-01 09:30:00"),
+            ("Consumo agregado: agua (x2) (PAGADO)", "2026-10-02 10:15:00"),
+            ("Se modificó NOMBRE a 'ana'", "2026-10-03 11:00:00"),
+            ("Intercambio: movido a habitación 4 por tester", "2026-10-04 12:45:00"),
+        ])
+        # Al mostrarlas, cada fecha aparece una sola vez
+        self.assertEqual(formatear_evento(eventos[0]), "CREADO PROGRAMADO - 01-10-2026 09:30")
+        ultimo = db.obtener_uno("SELECT ULTIMO_EVENTO FROM HUESPEDES WHERE NUMERO = ?", (self.numero,))
+        self.assertEqual(ultimo["ULTIMO_EVENTO"], "Intercambio: movido a habitación 4 por tester - 04-10-2026 12:45")
+
+        # Volver a correrla no toca nada
+        migraciones._m008_fecha_fuera_del_detalle()
+        self.assertEqual([dict(evento) for evento in self._eventos()], [dict(evento) for evento in eventos])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# Cantidad de sentencias SQL por acción del menú (db.ultima_accion, ver requiere_acceso).
+# Lo que se prueba es que no dependa del tamaño del carrito ni de los grupos de productos: fuera de las
+# sentencias propias de cada ítem que el usuario tipea o elige (a lo sumo una de cada una por ítem),
+# la cantidad es la misma con dos ítems que con ocho, y se mantiene por debajo de un tope.
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+import consumos
+import usuarios
+from bitacora import bitacora
+from db import db
+from migraciones import aplicar_migraciones
+
+# Sentencias que se ejecutan una vez por ítem
+BUSQUEDA_PRODUCTO = "SELECT * FROM PRODUCTOS WHERE CODIGO = ?"  # al tipear el código, para mostrar el stock
+BORRADO_CONSUMO = "DELETE FROM CONSUMOS WHERE ID = ?"
+AUDITORIA = "INSERT INTO AUDITORIA (FECHA, USUARIO, ACCION, ENTIDAD, ENTIDAD_ID, DATOS) VALUES (?, ?, ?, ?, ?, ?)"
+
+MAXIMO_FIJAS = 12  # tope holgado para el resto de las sentencias de una acción
+
+STOCK_INICIAL = 1000
+VINOS = range(10, 20)  # un grupo de diez productos equivalentes
+
+def _escrituras(accion):
+    return sum(n for forma, n in accion.formas().items() if forma.split()[0] in ("INSERT", "UPDATE", "DELETE"))
+
+def _fijas(accion, por_item):
+    # Sentencias de la acción que no son propias de cada ítem
+    formas = accion.formas()
+    return accion.sentencias - sum(formas.get(forma, 0) for forma in por_item)
+
+class TestSentenciasPorAccion(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            aplicar_migraciones()
+        productos = [(1, "agua", None), (2, "cerveza lata", "cerveza"), (3, "cerveza botella", "cerveza"),
+                     (20, "gaseosa", None), (21, "jugo", None)]
+        productos += [(codigo, f"vino {codigo}", "vino") for codigo in VINOS]
+        db.ejecutar_lote("INSERT INTO PRODUCTOS (CODIGO, NOMBRE, PRECIO, STOCK, GRUPO) VALUES (?, ?, 10, ?, ?)",
+                         [(codigo, nombre, STOCK_INICIAL, grupo) for codigo, nombre, grupo in productos])
+        db.ejecutar_lote("INSERT INTO HUESPEDES (APELLIDO, NOMBRE, ESTADO, CHECKIN, CHECKOUT, HABITACION) "
+                         "VALUES (?, 'juan', 'ABIERTO', '2026-10-01', '2026-10-30', ?)", [("perez", 5), ("gomez", 6)])
+        usuarios.sesion.iniciar("tester", 3)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Los logs de las acciones se escriben acá, mientras el directorio actual es todavía la carpeta de pruebas
+        bitacora.cerrar()
+
+    def _sin_depender_del_tamano(self, chica, grande, items_grande, por_item):
+        self.assertEqual(_fijas(grande, por_item), _fijas(chica, por_item))
+        self.assertLessEqual(_fijas(grande, por_item), MAXIMO_FIJAS)
+        for forma in por_item:
+            self.assertLessEqual(grande.formas().get(forma, 0), items_grande, forma)
+
+    def _correr(self, accion, respuestas):
+        with mock.patch("builtins.input", side_effect=respuestas), contextlib.redirect_stdout(io.StringIO()):
+            accion()
+        return db.ultima_accion
+
+    def _stock(self, codigo):
+        return db.obtener_uno("SELECT STOCK FROM PRODUCTOS WHERE CODIGO = ?", (codigo,))["STOCK"]
+
+    def _consumos_de(self, habitacion):
+        return db.obtener_uno("SELECT COUNT(*) AS N FROM CONSUMOS C JOIN HUESPEDES H ON C.HUESPED = H.NUMERO "
+                              "WHERE H.HABITACION = ?", (habitacion,))["N"]
+
+    def test_agregar_consumo(self):
+        def carrito(codigos):
+            respuestas = ["5"]
+            for codigo in codigos:
+                respuestas += [str(codigo), "1"]
+            return respuestas + ["0", "si"]
+
+        chico = self._correr(consumos.agregar_consumo, carrito([1, 2]))
+        self.assertEqual(self._consumos_de(5), 2)
+        vino = self._stock(10)
+        grande = self._correr(consumos.agregar_consumo, carrito([1, 2, 3, 20, 21, 10, 11, 12]))
+        self.assertEqual(self._consumos_de(5), 10)
+
+        self._sin_depender_del_tamano(chico, grande, 8, [BUSQUEDA_PRODUCTO])
+        self.assertEqual(_escrituras(grande), _escrituras(chico))
+        # Los diez vinos bajan juntos con un solo UPDATE
+        self.assertEqual({self._stock(codigo) for codigo in VINOS}, {vino - 3})
+
+    def test_eliminar_consumos(self):
+        def eliminar(codigos):
+            huesped = db.obtener_uno("SELECT NUMERO FROM HUESPEDES WHERE HABITACION = 6")["NUMERO"]
+            consumos._escribir_consumos([{"huesped_id": huesped, "codigo": codigo, "nombre": str(codigo), "cantidad": 1,
+                                          "pagado": 0, "stock_anterior": STOCK_INICIAL} for codigo in codigos], huesped)
+            seleccion = ",".join(str(i) for i in range(1, len(codigos) + 1))
+            return self._correr(consumos.eliminar_consumos, ["6", seleccion, "si"])
+
+        pocos = eliminar([1, 2])
+        self.assertEqual(self._consumos_de(6), 0)
+        muchos = eliminar([1, 2, 3, 20, 10, 11])
+        self.assertEqual(self._consumos_de(6), 0)
+
+        self._sin_depender_del_tamano(pocos, muchos, 6, [BORRADO_CONSUMO, AUDITORIA])
+        # La reposición de stock no consulta producto por producto
+        self.assertEqual(sum(n for forma, n in muchos.formas().items() if "FROM PRODUCTOS" in forma), 1)
+
+    def test_consumo_cortesia(self):
+        def cortesia(codigos):
+            respuestas = []
+            for codigo in codigos:
+                respuestas += [str(codigo), "1"]
+            return self._correr(consumos.consumo_cortesia, respuestas + ["0", "no", "jefe"])
+
+        antes = db.obtener_uno("SELECT COUNT(*) AS N FROM CORTESIAS")["N"]
+        pocas = cortesia([21, 13])
+        muchas = cortesia([21, 3, 13, 14, 15])
+        self.assertEqual(db.obtener_uno("SELECT COUNT(*) AS N FROM CORTESIAS")["N"], antes + 7)
+
+        self._sin_depender_del_tamano(pocas, muchas, 5, [BUSQUEDA_PRODUCTO, AUDITORIA])
+        self.assertEqual(muchas.formas()["INSERT INTO CORTESIAS (PRODUCTO, CANTIDAD, FECHA, AUTORIZA) VALUES (?, ?, ?, ?)"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
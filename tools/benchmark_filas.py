@@ -0,0 +1,68 @@
+"""
+Compara memoria y tiempo de lectura de CONSUMOS con filas dict (implementación anterior
+de obtener_todos) contra las filas compactas de db.Fila.
+
+Uso, desde la raíz del repositorio: python -m tools.benchmark_filas [cantidad_de_filas]   (por defecto 1.000.000)
+Los datos van a una base temporal; BaseDeDatos.db no se modifica.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from db import DBManager
+
+QUERY = "SELECT ID, HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO FROM CONSUMOS"
+
+def _crear_base(ruta, cantidad):
+    base = DBManager(ruta)
+    base.ejecutar('''CREATE TABLE CONSUMOS(
+                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    HUESPED INTEGER NOT NULL, PRODUCTO INTEGER NOT NULL,
+                    CANTIDAD INTEGER NOT NULL, FECHA TEXT NOT NULL,
+                    PAGADO INTEGER NOT NULL DEFAULT 0)''')
+    inicio = datetime(2020, 1, 1)
+    lote = 50000
+    for desde in range(0, cantidad, lote):
+        filas = [
+            (i % 500 + 1, i % 80 + 1, i % 4 + 1, (inicio + timedelta(minutes=i)).isoformat(sep=" "), i % 2)
+            for i in range(desde, min(desde + lote, cantidad))
+        ]
+        base.ejecutar_lote("INSERT INTO CONSUMOS (HUESPED, PRODUCTO, CANTIDAD, FECHA, PAGADO) VALUES (?, ?, ?, ?, ?)", filas)
+    return base
+
+def _leer_como_dict(ruta):
+    # Réplica del obtener_todos original: sqlite3.Row + dict por fila
+    conn = sqlite3.connect(ruta)
+    conn.row_factory = sqlite3.Row
+    filas = [dict(fila) for fila in conn.execute(QUERY).fetchall()]
+    conn.close()
+    return filas
+
+def _medir(nombre, funcion):
+    inicio = time.perf_counter()
+    filas = funcion()
+    segundos = time.perf_counter() - inicio
+    del filas
+
+    tracemalloc.start()
+    filas = funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre:<28} {len(filas):>10} filas {segundos:>8.2f} s {pico / 1024 / 1024:>10.1f} MB pico")
+    del filas
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "benchmark.db")
+        print(f"Generando {cantidad} consumos...")
+        base = _crear_base(ruta, cantidad)
+        _medir("dict por fila (anterior)", lambda: _leer_como_dict(ruta))
+        _medir("Fila compacta (actual)", lambda: base.obtener_todos(QUERY))
+        base.cerrar()
+
+if __name__ == "__main__":
+    main()
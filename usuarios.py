@@ -1,3 +1,4 @@
+import auditoria  # 'import' de módulo: auditoria también importa este módulo
 import bcrypt
 import re
 import sqlite3
@@ -144,7 +145,15 @@ def requiere_acceso(nivel_requerido):
                     return
             # si pasó todas las verificaciones → ejecutar la función real
             sesion.refrescar()
-            return func(*args, **kwargs)
+            # Cada acción del menú se mide (sentencias, filas, tiempo de SQL; ver db.medir_accion)
+            with db.medir_accion(func.__name__):
+                if nivel_requerido == 0:
+                    # Pantallas de consulta (observadores): leen por la conexión de solo lectura.
+                    # Sin foto: esperan al usuario entre consulta y consulta, y una transacción de
+                    # lectura abierta todo ese tiempo no deja hacer checkpoint del WAL.
+                    with db.lectura_consistente(foto=False):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
         return wrapper
     return decorador
 
@@ -183,8 +192,9 @@ def crear_usuario():
             contraseña_hash = bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt())
             try:
                 with db.transaccion():
-                    db.ejecutar("INSERT INTO USUARIOS (USUARIO, CONTRASEÑA_HASH, NIVEL_DE_ACCESO) VALUES (?, ?, ?)", 
+                    id_usuario = db.ejecutar("INSERT INTO USUARIOS (USUARIO, CONTRASEÑA_HASH, NIVEL_DE_ACCESO) VALUES (?, ?, ?)", 
                                 (usuario, contraseña_hash, nivel_de_acceso))
+                    auditoria.auditar("USUARIO_CREADO", "USUARIO", id_usuario, usuario=usuario, nivel=nivel_de_acceso)
                 print(f"\n✔ Usuario '{usuario}' de nivel de acceso {nivel_de_acceso} creado exitosamente.")
                 break
             except sqlite3.IntegrityError:
@@ -258,6 +268,10 @@ def editar_usuario():
         # Después de intentar editar cualquier campo, terminamos la función.
         return  
 
+def _id_de_usuario(usuario):
+    fila = db.obtener_uno("SELECT ID FROM USUARIOS WHERE USUARIO = ?", (usuario,))
+    return fila["ID"] if fila else None
+
 def _editar_contrasena(usuario):
     """Maneja la lógica de validación y actualización de la contraseña."""
     while True:
@@ -279,6 +293,7 @@ def _editar_contrasena(usuario):
         contraseña_hash = bcrypt.hashpw(contrasena.encode('utf-8'), bcrypt.gensalt())
         with db.transaccion():
             db.ejecutar("UPDATE USUARIOS SET CONTRASEÑA_HASH=? WHERE USUARIO=?", (contraseña_hash, usuario))
+            auditoria.auditar("CONTRASEÑA_EDITADA", "USUARIO", _id_de_usuario(usuario), usuario=usuario)
         print(f"\n✔ Contraseña de '{usuario}' modificada.")
     except Exception as e:
         print(f"\n❌ Error al modificar la contraseña de '{usuario}': {e}")
@@ -295,6 +310,7 @@ def _editar_nivel(usuario):
     try:
         with db.transaccion():
             db.ejecutar("UPDATE USUARIOS SET NIVEL_DE_ACCESO=? WHERE USUARIO=?", (nuevo_nivel, usuario))
+            auditoria.auditar("NIVEL_EDITADO", "USUARIO", _id_de_usuario(usuario), usuario=usuario, nivel=nuevo_nivel)
         print(f"\n✔ Nivel de acceso de '{usuario}' modificado a {nuevo_nivel}.")
     except Exception as e:
         print(f"\n❌ Error al modificar el nivel de acceso de '{usuario}': {e}")
@@ -314,6 +330,8 @@ def _editar_nombre(usuario_actual):
             with db.transaccion():
                 # Actualizamos usando el usuario_actual como filtro
                 db.ejecutar("UPDATE USUARIOS SET USUARIO=? WHERE USUARIO=?", (nuevo_nombre, usuario_actual))
+                auditoria.auditar("USUARIO_RENOMBRADO", "USUARIO", _id_de_usuario(nuevo_nombre),
+                                  anterior=usuario_actual, usuario=nuevo_nombre)
             print(f"\n✔ Nombre de usuario de '{usuario_actual}' modificado a {nuevo_nombre}.")
         except Exception as e:
             # Captura un error potencial si el nuevo_nombre ya existe (violación de unicidad)
@@ -340,7 +358,9 @@ def eliminar_usuario():
             # Elimina un usuario de la base de datos.
             try:
                 with db.transaccion():
+                    id_usuario = _id_de_usuario(usuario)
                     db.ejecutar("DELETE FROM USUARIOS WHERE USUARIO=?", (usuario,))
+                    auditoria.auditar("USUARIO_ELIMINADO", "USUARIO", id_usuario, usuario=usuario)
                 print(f"\n✔ Usuario '{usuario}' eliminado.")
             except Exception as e:
                 print(f"\n❌ Error al eliminar el usuario '{usuario}': {e}")
@@ -1,6 +1,7 @@
 import re
-import os
+from itertools import chain
 from datetime import date, datetime
+from bitacora import bitacora
 from db import db
 from unidecode import unidecode
 
@@ -14,15 +15,19 @@ HABITACIONES = {
     7: {"tipo": "Master Suite", "capacidad": 4},  # o la capacidad real que quieras
 }
 
-def registrar_log(nombre_archivo, contenido):
-    try:
-        os.makedirs("logs", exist_ok=True)
-        ruta = os.path.join("logs", nombre_archivo)
-        with open(ruta, "a", encoding="utf-8") as f:
-            f.write(contenido + "\n" + "-"*60 + "\n")
-    except Exception as e:
-        # Evitar que un error de log rompa el flujo principal
-        print(f"⚠️  No se pudo escribir el log '{nombre_archivo}': {e}")
+def registrar_log(nombre_archivo, contenido, **campos):
+    # Encola la entrada; la escribe el hilo de la bitácora (no bloquea, ni siquiera dentro de una transacción).
+    # 'campos' son los datos tipados de la entrada (accion, usuario, huesped, producto, cantidad, monto...)
+    bitacora.registrar(nombre_archivo, contenido, **campos)
+
+def filas_o_none(filas):
+    # Permite saber si un iterable de filas (ej: db.obtener_iter) trae resultados sin cargarlo entero.
+    # Devuelve None si está vacío, o un iterador con las mismas filas (incluida la primera).
+    filas = iter(filas)
+    primera = next(filas, None)
+    if primera is None:
+        return None
+    return chain((primera,), filas)
 
 def imprimir_huesped(huesped):
     print("\nHuésped seleccionado:")
@@ -38,17 +43,15 @@ def imprimir_huesped(huesped):
         elif col in ("CHECKIN", "CHECKOUT"):
             display_val = formatear_fecha(val)
         elif col == "REGISTRO":
-            val_str = str(val or "")
-            if val_str.strip():
-                display_val = val_str.strip().split("\n---\n")[-1]
-            else:
-                display_val = "(Sin registro)"
+            # Última entrada del historial, ya formateada al registrarla (no se consulta el historial)
+            display_val = huesped["ULTIMO_EVENTO"] or "(Sin registro)"
         if display_val is None or (isinstance(display_val, str) and not display_val.strip()):
             display_val = "N/A" # O el valor que prefieras para campos vacíos
         print(f"{col:<15}: {display_val}")
     print("-" * 40)
 
 def imprimir_huespedes(huespedes):
+    # Acepta una lista o cualquier iterable de filas (ej: db.obtener_iter), que se recorre una sola vez.
     print(f"{'NUMERO':<6} {'APELLIDO':<15} {'NOMBRE':<15} {'HAB':^5} {'ESTADO':^10} {'CON':^5} {'CHECKIN':^12} {'CHECKOUT':<12} {'DESCUENTO':<18}")
     print("-" * 106)
     for _, h in enumerate(huespedes, start=1):
@@ -137,7 +140,9 @@ def imprimir_producto(producto):
         print(f"{col_display:<15}: {display_val}")
 
 def imprimir_productos(productos, todo=False):
-    if not productos:
+    # Acepta una lista o cualquier iterable de filas (ej: db.obtener_iter), que se recorre una sola vez.
+    productos = filas_o_none(productos)
+    if productos is None:
         print("No hay productos para mostrar.")
         return
     if todo is False:
@@ -352,6 +357,18 @@ def parse_fecha_a_datetime(fecha_str):
 def marca_de_tiempo():
     return datetime.now().strftime("%d-%m-%Y %H:%M")
 
+def formatear_evento(evento):
+    # Una entrada del historial de un huésped como texto: "detalle - usuario - DD-MM-YYYY HH:MM"
+    try:
+        fecha = datetime.fromisoformat(evento["FECHA"]).strftime("%d-%m-%Y %H:%M")
+    except (TypeError, ValueError):
+        fecha = evento["FECHA"]
+    partes = [evento["DETALLE"]]
+    if evento["USUARIO"]:
+        partes.append(f"por {evento['USUARIO']}")
+    partes.append(fecha)
+    return " - ".join(partes)
+
 def opcion_menu(leyenda, cero=False, vacio=False, asterisco=False, minimo=None, maximo=None):
     # Solicita una opción numérica al usuario, validando contra una serie de reglas.
     # Retorna el entero validado, 0 si se permite y elige cancelar, o None si se permite vacío.